@@ -0,0 +1,285 @@
+import argparse
+import hashlib
+import logging
+import os
+import random
+import unicodedata
+from itertools import islice
+
+from dotenv import load_dotenv
+from ...common.common import set_log_level
+from ...common.leakage import LeakageIndex, SIMILARITY_THRESHOLD, BATCH_SIZE
+from ...common.tmx_reader import iter_tmx_units
+from ...common.tmx_writer import TmxWriter, TMX_FOOTER
+
+load_dotenv()
+
+TEST_TUNE_LIMIT = 2500  # Custom Translator takes at most this many sentence pairs in a test or tune document
+MAX_TRAIN_UNITS = 99500  # The units per training shard, the notebook kept each shard under the upload limit this way
+MAX_SHARD_BYTES = 100 * 1024 * 1024  # The size cap of a training shard in bytes
+
+
+class Config:
+    """
+    Read from .env file - These are params that are static across parallel jobs
+    """
+    DEBUG = bool(os.environ.get("DEBUG"))  # Activate debugging
+
+
+class Reservoir:
+    """
+    A uniform random sample of at most size units of a stream, offering a unit returns the unit that is not kept,
+    either the offered unit or the one it replaced
+    """
+
+    def __init__(self, size, rng):
+        """
+        :param size: The number of units to keep
+        :param rng: The seeded random.Random the sample is drawn with
+        """
+        self.size = size
+        self.rng = rng
+        self.units = []
+        self.seen = 0
+
+    def offer(self, unit):
+        """
+        :param unit: The unit to offer
+        :return: The unit that is not kept, None while the reservoir is filling
+        """
+        self.seen += 1
+        if len(self.units) < self.size:
+            self.units.append(unit)
+            return None
+        slot = self.rng.randrange(self.seen)
+        if slot < self.size:
+            self.units[slot], unit = unit, self.units[slot]
+        return unit
+
+
+class ShardedTmxWriter:
+    """
+    Writes units to numbered tmx shards, a new shard is started before a unit would take the current one over its
+    unit or byte cap
+    """
+
+    def __init__(self, file_pattern, source_language, target_language, max_units=None, max_bytes=None):
+        """
+        :param file_pattern: The shard file with a {} for the zero based shard number
+        :param source_language: The source language code e.g. en-US
+        :param target_language: The target language code e.g. fr-FR
+        :param max_units: The most units in a shard, None for no limit
+        :param max_bytes: The largest shard in bytes, None for no limit
+        """
+        self.file_pattern = file_pattern
+        self.source_language = source_language
+        self.target_language = target_language
+        self.max_units = max_units
+        self.max_bytes = max_bytes
+        self.files = []
+        self.units = 0
+        self._writer = None
+
+    def write(self, unit):
+        data = None
+        if self._writer is not None:
+            data = self._writer.encode(unit)
+            if ((self.max_units is not None and self._writer.units >= self.max_units) or
+                    (self.max_bytes is not None and self._writer.units > 0 and
+                     self._writer.size + len(data) + len(TMX_FOOTER) > self.max_bytes)):
+                self._writer.close()
+                logging.info(f"Wrote {self._writer.units} units to {self._writer.path}")
+                self._writer = None
+        if self._writer is None:
+            self._writer = TmxWriter(self.file_pattern.format(len(self.files)), self.source_language,
+                                     self.target_language)
+            self.files.append(self._writer.path)
+        self._writer.write_encoded(data if data is not None else self._writer.encode(unit))
+        self.units += 1
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            logging.info(f"Wrote {self._writer.units} units to {self._writer.path}")
+            self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def unit_key(unit):
+    """
+    :param unit: A TmxUnit
+    :return: A 64 bit hash of the whitespace and unicode normalised source and target, equal for duplicate units
+    """
+    text = '\0'.join(unicodedata.normalize('NFC', ' '.join(segment.split())) for segment in (unit.source, unit.target))
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def drop_seen(units, index, threshold, counts, batch_size=BATCH_SIZE):
+    """
+    Drops the units whose source is a near duplicate of a segment in a leakage index, e.g. an index of the evaluation
+    documents, the units are looked up a batch at a time
+    :param units: An iterable of TmxUnit records
+    :param index: The LeakageIndex
+    :param threshold: The estimated Jaccard similarity from which a unit is dropped
+    :param counts: A dictionary whose 'seen' count is incremented for each unit dropped
+    :param batch_size: The number of units looked up at a time
+    :return: A generator of the units that are kept
+    """
+    units = iter(units)
+    for batch in iter(lambda: list(islice(units, batch_size)), []):
+        seen = index.seen([unit.source for unit in batch], threshold)
+        counts['seen'] = counts.get('seen', 0) + int(seen.sum())
+        for unit, unit_seen in zip(batch, seen):
+            if not unit_seen:
+                yield unit
+
+
+def split_units(units, train, test_size=0, tune_size=0, min_tokens=1, max_tokens=None, tune_min_tokens=None,
+                tune_max_tokens=None, dedupe=True, seed=0):
+    """
+    Strips, filters, deduplicates and splits a stream of units in one pass. The test and tune sets are seeded uniform
+    samples held in memory, a unit that is not sampled, or is replaced in a sample, is written to train straight away
+    :param units: An iterable of TmxUnit records
+    :param train: The writer the training units are written to, e.g. a ShardedTmxWriter
+    :param test_size: The number of units sampled for the test set
+    :param tune_size: The number of units sampled for the tune set
+    :param min_tokens: Drop units whose source or target has fewer whitespace separated tokens
+    :param max_tokens: Drop units whose source or target has more tokens, None for no limit
+    :param tune_min_tokens: Only sample tune units whose source has at least this many tokens, None for no limit
+    :param tune_max_tokens: Only sample tune units whose source has at most this many tokens, None for no limit
+    :param dedupe: Drop units whose normalised source and target were already seen
+    :param seed: The random seed of the samples
+    :return: The test units, the tune units, both in input order, and a dictionary of counts
+    """
+    rng = random.Random(seed)
+    test = Reservoir(test_size, rng)
+    tune = Reservoir(tune_size, rng)
+    seen = set()  # Only 64 bit hashes are kept, the memory used is a small fraction of the unique text
+    counts = {'read': 0, 'duplicate': 0, 'filtered': 0}
+
+    for unit in units:
+        counts['read'] += 1
+        unit.source, unit.target = unit.source.strip(), unit.target.strip()
+        source_tokens = len(unit.source.split())
+        target_tokens = len(unit.target.split())
+        if (min(source_tokens, target_tokens) < min_tokens or
+                (max_tokens is not None and max(source_tokens, target_tokens) > max_tokens)):
+            counts['filtered'] += 1
+            continue
+        if dedupe:
+            key = unit_key(unit)
+            if key in seen:
+                counts['duplicate'] += 1
+                continue
+            seen.add(key)
+
+        if ((tune_min_tokens is None or source_tokens >= tune_min_tokens) and
+                (tune_max_tokens is None or source_tokens <= tune_max_tokens)):
+            unit = tune.offer(unit)
+        if unit is not None:
+            unit = test.offer(unit)
+        if unit is not None:
+            train.write(unit)
+
+    test_units = sorted(test.units, key=lambda sampled: sampled.index)
+    tune_units = sorted(tune.units, key=lambda sampled: sampled.index)
+    counts.update(train=train.units, test=len(test_units), tune=len(tune_units))
+    return test_units, tune_units, counts
+
+
+def write_units(file, units, source_language, target_language):
+    """
+    Writes units to a single tmx file
+    """
+    with TmxWriter(file, source_language, target_language) as writer:
+        for unit in units:
+            writer.write(unit)
+    logging.info(f"Wrote {len(units)} units to {file}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Clean a translation memory and split it into train, test and tune '
+                                                 'datasets for Custom Translator')
+    parser.add_argument('--source-tmx', type=str, required=True,
+                        help='The master translation memory (tmx) file')
+    parser.add_argument('--output-path', type=str, required=True,
+                        help='The directory the train, test and tune directories are written to')
+    parser.add_argument('--source-language', type=str, default='en-US',
+                        help='The source language code written to the datasets e.g. en-US')
+    parser.add_argument('--target-language', type=str, required=True,
+                        help='The target language code written to the datasets e.g. es-ES')
+    parser.add_argument('--test-size', type=int, default=TEST_TUNE_LIMIT, metavar='N',
+                        help='The number of units sampled for the test set, 0 for no test set')
+    parser.add_argument('--tune-size', type=int, default=TEST_TUNE_LIMIT, metavar='N',
+                        help='The number of units sampled for the tune set, 0 for no tune set')
+    parser.add_argument('--tune-min-tokens', type=int, default=7, metavar='N',
+                        help='Only sample tune units whose source has at least this many tokens')
+    parser.add_argument('--tune-max-tokens', type=int, default=10, metavar='N',
+                        help='Only sample tune units whose source has at most this many tokens')
+    parser.add_argument('--min-tokens', type=int, default=1, metavar='N',
+                        help='Drop units whose source or target has fewer tokens')
+    parser.add_argument('--max-tokens', type=int, default=None, metavar='N',
+                        help='Drop units whose source or target has more tokens')
+    parser.add_argument('--max-train-units', type=int, default=MAX_TRAIN_UNITS, metavar='N',
+                        help='The most units in a training shard')
+    parser.add_argument('--max-shard-bytes', type=int, default=MAX_SHARD_BYTES, metavar='N',
+                        help='The largest training shard in bytes')
+    parser.add_argument('--keep-duplicates', action='store_true',
+                        help='Keep units whose source and target were already seen')
+    parser.add_argument('--no-repair', action='store_true',
+                        help='Read the translation memory without repairing bad encodings')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='The random seed of the test and tune samples')
+    parser.add_argument('--leakage-index', type=str, default=None,
+                        help='Drop units whose source is a near duplicate of a segment in this index, see '
+                             'build_leakage_index.py')
+    parser.add_argument('--leakage-threshold', type=float, default=SIMILARITY_THRESHOLD,
+                        help='The estimated Jaccard similarity from which a unit counts as a near duplicate')
+
+    args = parser.parse_args()
+    set_log_level(Config.DEBUG)
+
+    for size in ('test_size', 'tune_size'):
+        if not 0 <= getattr(args, size) <= TEST_TUNE_LIMIT:
+            parser.error(f"--{size.replace('_', '-')} must be between 0 and {TEST_TUNE_LIMIT}")
+
+    name = os.path.splitext(os.path.basename(args.source_tmx))[0]
+    for dataset in ('train', 'test', 'tune'):
+        os.makedirs(os.path.join(args.output_path, dataset), exist_ok=True)
+
+    # The reader matches the variants on the language subtag, so en-GB variants are written as the en-US requested
+    units = iter_tmx_units(args.source_tmx, args.source_language.split('-')[0], args.target_language.split('-')[0],
+                           repair=not args.no_repair)
+    seen = {'seen': 0}
+    index = LeakageIndex(args.leakage_index) if args.leakage_index else None
+    if index is not None:
+        units = drop_seen(units, index, args.leakage_threshold, seen)
+    try:
+        with ShardedTmxWriter(os.path.join(args.output_path, 'train', name + '_{}_train.tmx'), args.source_language,
+                              args.target_language, args.max_train_units, args.max_shard_bytes) as train:
+            test_units, tune_units, counts = split_units(units, train, args.test_size, args.tune_size,
+                                                         args.min_tokens, args.max_tokens, args.tune_min_tokens,
+                                                         args.tune_max_tokens, not args.keep_duplicates, args.seed)
+    finally:
+        # The units are read lazily, so the index is only done with once the split has consumed them
+        if index is not None:
+            index.close()
+
+    for dataset, dataset_units in (('test', test_units), ('tune', tune_units)):
+        if dataset_units:
+            write_units(os.path.join(args.output_path, dataset, name + '_' + dataset + '.tmx'), dataset_units,
+                        args.source_language, args.target_language)
+
+    print(f"Read {counts['read'] + seen['seen']} units, dropped {seen['seen']} seen in the leakage index, "
+          f"{counts['duplicate']} duplicates and {counts['filtered']} outside the token limits")
+    print(f"Generated {counts['train']} train units in {len(train.files)} shards, {counts['test']} test units and "
+          f"{counts['tune']} tune units")
+
+
+if __name__ == '__main__':
+    main()
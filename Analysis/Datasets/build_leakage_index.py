@@ -0,0 +1,118 @@
+import argparse
+import glob
+import logging
+import os
+from itertools import chain, islice
+
+from dotenv import load_dotenv
+from ...common.common import set_log_level
+from ...common.leakage import LeakageIndex, NUM_PERM, BANDS, SHINGLE_SIZE, SIMILARITY_THRESHOLD, BATCH_SIZE
+from ...common.reports import CSVReport
+from ...common.tmx_reader import iter_tmx_units
+
+load_dotenv()
+
+
+class Config:
+    """
+    Read from .env file - These are params that are static across parallel jobs
+    """
+    DEBUG = bool(os.environ.get("DEBUG"))  # Activate debugging
+
+
+def iter_segments(files, side='source'):
+    """
+    Streams the segments of translation memories and plain text files, a file ending in .tmx is read as a translation
+    memory and any other file has one segment per line, e.g. the aligned sentences of an evaluated document
+    :param files: The files
+    :param side: source or target, the side of the translation units that is read
+    :return: A generator of the segments
+    """
+    for file in files:
+        if file.lower().endswith('.tmx'):
+            for unit in iter_tmx_units(file, repair=True):
+                yield (unit.source if side == 'source' else unit.target).strip()
+        else:
+            with open(file, 'r', encoding='utf-8') as text:
+                for line in text:
+                    yield line.rstrip('\n')
+
+
+def check_files(index, files, threshold, side='source', report=None):
+    """
+    Looks up every segment of the files in the index
+    :param index: The LeakageIndex
+    :param files: The translation memories or text files to check, e.g. the test and tune sets
+    :param threshold: The estimated Jaccard similarity from which a segment counts as seen
+    :param side: source or target, the side of the translation units that is checked
+    :param report: An optional CSVReport the seen segments are written to
+    :return: A dictionary of each file to its (seen, segments) counts
+    """
+    counts = {}
+    for file in files:
+        segments = iter_segments([file], side)
+        seen_count, total = 0, 0
+        for batch in iter(lambda: list(islice(segments, BATCH_SIZE)), []):
+            similarities, ids = index.query(batch)
+            seen = similarities >= threshold
+            seen_count += int(seen.sum())
+            if report is not None:
+                for i in seen.nonzero()[0]:
+                    report.write_row([file, total + i, similarities[i], ids[i], batch[i]])
+            total += len(batch)
+        counts[file] = (seen_count, total)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build a near duplicate index of the training memories and check '
+                                                 'test sets against it')
+    parser.add_argument('--index-path', type=str, required=True,
+                        help='The index directory')
+    parser.add_argument('--train', type=str, nargs='*', default=[],
+                        help='Globs of the training memories (tmx) or text files to index, the index is rebuilt if '
+                             'any are given')
+    parser.add_argument('--check', type=str, nargs='*', default=[],
+                        help='Globs of the tmx or text files whose segments are looked up in the index')
+    parser.add_argument('--side', type=str, default='source', choices=['source', 'target'],
+                        help='The side of the translation units indexed and checked')
+    parser.add_argument('--threshold', type=float, default=SIMILARITY_THRESHOLD,
+                        help='The estimated Jaccard similarity from which a segment counts as seen in training')
+    parser.add_argument('--report', type=str, default=None,
+                        help='A CSV file the seen segments are written to')
+    parser.add_argument('--num-perm', type=int, default=NUM_PERM, metavar='N',
+                        help='The number of MinHash permutations')
+    parser.add_argument('--bands', type=int, default=BANDS, metavar='N',
+                        help='The number of LSH bands, it must divide the number of permutations')
+    parser.add_argument('--shingle-size', type=int, default=SHINGLE_SIZE, metavar='N',
+                        help='The characters per shingle')
+
+    args = parser.parse_args()
+    set_log_level(Config.DEBUG)
+
+    train_files = sorted(chain.from_iterable(glob.glob(pattern) for pattern in args.train))
+    if args.train:
+        if not train_files:
+            parser.error('No training files matched --train')
+        count = LeakageIndex.build(args.index_path, iter_segments(train_files, args.side), args.num_perm, args.bands,
+                                   args.shingle_size)
+        print(f"Indexed {count} segments of {len(train_files)} files in {args.index_path}")
+
+    check_paths = sorted(chain.from_iterable(glob.glob(pattern) for pattern in args.check))
+    if check_paths:
+        with LeakageIndex(args.index_path) as index:
+            report = CSVReport(args.report, ['file', 'segment', 'similarity', 'training_segment', 'text']) \
+                if args.report else None
+            try:
+                counts = check_files(index, check_paths, args.threshold, args.side, report)
+            finally:
+                if report is not None:
+                    report.close()
+        for file, (seen, segments) in counts.items():
+            print(f"{file}: {seen} of {segments} segments seen in training")
+    elif args.check:
+        logging.warning('No files matched --check')
+
+
+if __name__ == '__main__':
+    main()
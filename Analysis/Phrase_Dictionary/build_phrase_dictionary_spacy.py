@@ -1,16 +1,26 @@
 import argparse
+import gc
+import math
+import multiprocessing
 import os
+import time
+from itertools import islice, tee
 
-import spacy
-import textacy
-from textacy import ke
 from dotenv import load_dotenv
-from translate.storage.tmx import tmxfile
-from ..common.common import call_translation, set_log_level, load_tmx_file, load_spacy_model, load_phrase_dictionary
+from ...common.common import set_log_level, load_spacy_model, TranslationCache, TRANSLATOR_ENDPOINT
+from ...common.keyterms import KeytermClient, pipe_keyterms
+from ...common.metrics import Metrics, profile
+from ...common.phrase_dictionary import PhraseDictionary
+from ...common.tmx_reader import iter_tmx_units, count_tmx_units
+from ...common.unit_manifest import UnitManifest
 import logging
 
 load_dotenv()
 
+SHARDS_PER_WORKER = 4  # Smaller shards balance the load when some units take longer to parse
+
+_worker = {}  # The models, phrase dictionary and cache loaded once per worker process
+
 
 class Config:
     """
@@ -19,6 +29,438 @@ class Config:
     SUBSCRIPTION_KEY = os.environ.get("SUBSCRIPTION_KEY")  # Our Subscription key
     REGION = os.environ.get("REGION")  # The region our model is deployed in
     DEBUG = bool(os.environ.get("DEBUG"))  # Activate debugging
+    TRANSLATOR_ENDPOINT = os.environ.get("TRANSLATOR_ENDPOINT", TRANSLATOR_ENDPOINT)  # Override for a local stub
+    TRANSLATION_CACHE = os.environ.get("TRANSLATION_CACHE")  # Optional SQLite translation cache file
+    CACHE_READ_ONLY = bool(os.environ.get("CACHE_READ_ONLY"))  # Never write to the translation cache e.g. in CI
+    CACHE_MAX_ENTRIES = os.environ.get("CACHE_MAX_ENTRIES")  # Evict the oldest cache entries above this many
+    CACHE_MAX_AGE_DAYS = os.environ.get("CACHE_MAX_AGE_DAYS")  # Evict cache entries older than this many days
+    NLP_SERVER = os.environ.get("NLP_SERVER")  # Optional socket of a keyterm server that has the models loaded
+    PHRASE_MANIFEST = os.environ.get("PHRASE_MANIFEST")  # Optional SQLite manifest of the units already mined
+    CACHE_KEYTERMS = bool(os.environ.get("CACHE_KEYTERMS"))  # Keep the keyterms of each unit in the manifest
+    FUZZY_THRESHOLD = os.environ.get("FUZZY_THRESHOLD")  # Optional lowest chrF score of a fuzzy phrase match
+    METRICS_PATH = os.environ.get("METRICS_PATH")  # Optional metrics snapshot file, .prom for the Prometheus format
+    PROFILE = os.environ.get("PROFILE")  # Optional profile file, .html for pyinstrument and cProfile otherwise
+
+
+def extract_unit_keyterms(units, nlp_model_id, nlp_model_target, batch_size=64, n_process=1, metrics=None):
+    """
+    Streams the units through both spaCy models with nlp.pipe and runs textrank on the results
+    :param units: An iterable of TmxUnit records
+    :param nlp_model_id: The source language spaCy model
+    :param nlp_model_target: The target language spaCy model
+    :param batch_size: The number of texts spaCy parses per batch
+    :param n_process: The number of processes spaCy parses with
+    :param metrics: Optional Metrics the parse and textrank seconds are recorded in
+    :return: A generator of (unit, source keyterms, target keyterms) tuples
+    """
+    units_id, units_target, units_out = tee(units, 3)
+    keyterms = pipe_keyterms(nlp_model_id, nlp_model_target, (unit.getid() for unit in units_id),
+                             (unit.gettarget() for unit in units_target), batch_size, n_process, metrics=metrics)
+
+    for unit, (res_id, res_target) in zip(units_out, keyterms):
+        yield unit, res_id, res_target
+
+
+def request_unit_keyterms(units, client, batch_size=64, metrics=None):
+    """
+    Sends the units to a keyterm server a batch at a time, so the models are not loaded by this process
+    :param units: An iterable of TmxUnit records
+    :param client: The KeytermClient of the server
+    :param batch_size: The number of units sent per request
+    :param metrics: Optional Metrics the seconds of each request are recorded in
+    :return: A generator of (unit, source keyterms, target keyterms) tuples
+    """
+    units = iter(units)
+    for batch in iter(lambda: list(islice(units, batch_size)), []):
+        started = time.perf_counter()
+        keyterms = client.keyterms([unit.getid() for unit in batch], [unit.gettarget() for unit in batch])
+        if metrics:
+            metrics.observe('keyterm_request_seconds', time.perf_counter() - started)
+        for unit, (res_id, res_target) in zip(batch, keyterms):
+            yield unit, res_id, res_target
+
+
+def pending_units(units, manifest, batch_size=64, cached_keyterms=False, reprocess=False, metrics=None):
+    """
+    Streams the units that were not mined with the models and category of the manifest, looking their fingerprints up
+    a batch at a time
+    :param units: An iterable of TmxUnit records
+    :param manifest: The UnitManifest
+    :param batch_size: The number of units looked up per query
+    :param cached_keyterms: Look up the keyterms the manifest kept for the pending units
+    :param reprocess: Mine and parse every unit again, whether or not it is in the manifest
+    :param metrics: Optional Metrics the skipped units are counted in
+    :return: A generator of (unit, fingerprint, keyterms) tuples, keyterms are the kept (source keyterms, target
+    keyterms) of the unit or None if it has to be parsed
+    """
+    units = iter(units)
+    for batch in iter(lambda: list(islice(units, batch_size)), []):
+        fingerprints = [UnitManifest.fingerprint(unit.getid(), unit.gettarget()) for unit in batch]
+        processed = set() if reprocess else manifest.processed(fingerprints)
+        # Reprocessed units are parsed again, their kept keyterms may be from another version of the models
+        kept = manifest.keyterms(set(fingerprints) - processed) if cached_keyterms and not reprocess else {}
+        if metrics and processed:
+            metrics.increment('units_skipped_total', sum(fingerprint in processed for fingerprint in fingerprints))
+        for unit, fingerprint in zip(batch, fingerprints):
+            if fingerprint not in processed:
+                yield unit, fingerprint, kept.get(fingerprint)
+
+
+def parse_pending_units(pending, extract):
+    """
+    Extracts the keyterms of the pending units that have none kept, and streams them in order with those that have
+    :param pending: An iterable of (unit, fingerprint, keyterms) tuples from pending_units
+    :param extract: A function streaming the (unit, source keyterms, target keyterms) tuples of an iterable of units,
+    e.g. extract_unit_keyterms
+    :return: A generator of (unit, fingerprint, source keyterms, target keyterms, parsed) tuples, parsed is False
+    for the units whose keyterms were kept
+    """
+    pending_parse, pending_out = tee(pending)
+    parsed = extract(unit for unit, _, keyterms in pending_parse if keyterms is None)
+    for unit, fingerprint, keyterms in pending_out:
+        if keyterms is None:
+            _, res_id, res_target = next(parsed)
+            yield unit, fingerprint, res_id, res_target, True
+        else:
+            yield unit, fingerprint, keyterms[0], keyterms[1], False
+
+
+def match_key(keyterm):
+    """
+    :return: The key a translation and a target keyterm match on, whitespace, unicode and case normalised
+    """
+    return PhraseDictionary.key(keyterm).lower()
+
+
+def is_phrase(keyterm):
+    return len(keyterm.split()) > 1  # We don't want single words, we want phrases
+
+
+def candidate_keyterms(unit_keyterms, phrases):
+    """
+    Collects the keyterms of a batch of units worth translating, the multi word source keyterms of units that have a
+    multi word target keyterm for them to match
+    :param unit_keyterms: A list of the (source keyterms, target keyterms) of each unit in the batch
+    :param phrases: The phrases already in the dictionary, e.g. a PhraseDictionary, these are not translated again
+    :return: The unique candidates in the order they first occur
+    """
+    candidates = {}
+    for res_id, res_target in unit_keyterms:
+        if not any(is_phrase(keyterm) for keyterm, _ in res_target):
+            continue
+        for keyterm, _ in res_id:
+            if is_phrase(keyterm) and keyterm not in candidates and keyterm not in phrases:
+                candidates[keyterm] = None
+    return list(candidates)
+
+
+def translate_keyterms(keyterms, target_language, category_id, translator, cache=None, metrics=None):
+    """
+    Translates keyterms in as few requests as the Translator limits allow, checking the translation cache first
+    :param keyterms: The unique keyterms to translate
+    :param translator: The TranslationClient the keyterms that are not cached are sent with
+    :param cache: An optional TranslationCache, the new translations are added to it
+    :param metrics: Optional Metrics the cache hits are recorded in
+    :return: A dictionary of keyterm to translation, the keyterms of a request that failed are left out
+    """
+    translations, missing = {}, []
+    for keyterm in keyterms:
+        translated_text = cache.get(keyterm, target_language, category_id) if cache else None
+        if metrics and cache:
+            metrics.increment('translation_cache_total', result='miss' if translated_text is None else 'hit')
+        if translated_text is None:
+            missing.append(keyterm)
+        else:
+            translations[keyterm] = translated_text
+    if missing:
+        translated = translator.translate_categories(missing, target_language, [category_id])[0]
+        new = [(keyterm, text) for keyterm, text in zip(missing, translated) if text]
+        translations.update(new)
+        if cache and new:
+            cache.put_many([(keyterm, target_language, category_id, text) for keyterm, text in new])
+    return translations
+
+
+def fuzzy_matches(candidates, threshold):
+    """
+    Scores the translation of each candidate against every target keyterm of its unit with chrF, all the pairs of a
+    batch in one vectorised call
+    :param candidates: A list of (source keyterm, translation, target keyterms) tuples
+    :param threshold: The lowest chrF score, from 0 to 100, a match is kept at
+    :return: A list of (source keyterm, target keyterm, score) tuples of the best match of each candidate that has one
+    """
+    from ...common.scoring import ReferenceStatistics, chrf_scores
+
+    references = [target for _, _, targets in candidates for target in targets]
+    hypotheses = [translated for _, translated, targets in candidates for _ in targets]
+    if not references:
+        return []
+    scores = chrf_scores(ReferenceStatistics(references, ('chrf',)).statistics('chrf', hypotheses))
+
+    matches = []
+    start = 0
+    for keyterm, _, targets in candidates:
+        best = start + int(scores[start:start + len(targets)].argmax())
+        if scores[best] >= threshold:
+            matches.append((keyterm, references[best], float(scores[best])))
+        start += len(targets)
+    return matches
+
+
+def match_phrases(unit_keyterms, translations, fuzzy_threshold=None):
+    """
+    Matches the translated source keyterms of each unit of a batch against an index of its multi word target keyterms,
+    normalised by match_key, so an exact match is a hash lookup rather than a comparison with each
+    :param unit_keyterms: A list of the (source keyterms, target keyterms) of each unit in the batch
+    :param translations: A dictionary of the candidate source keyterms to their translations
+    :param fuzzy_threshold: Optionally the lowest chrF score, from 0 to 100, a source keyterm without an exact match
+    in any unit is matched at to the target keyterm of its unit its translation scores highest against
+    :return: A dictionary of the new source phrases to their target phrases, the first match of a source phrase in
+    unit order is kept and exact matches are kept over fuzzy ones
+    """
+    found, unmatched = {}, {}
+
+    for res_id, res_target in unit_keyterms:
+        index = {}
+        for keyterm, _ in res_target:
+            if is_phrase(keyterm):
+                index.setdefault(match_key(keyterm), keyterm.strip())
+        for keyterm, _ in res_id:
+            translated_text = translations.get(keyterm)
+            if not translated_text or keyterm in found:
+                continue
+            target = index.get(match_key(translated_text))
+            if target is not None:
+                logging.debug('Found %s : %s', keyterm, target)
+                found[keyterm] = target
+                unmatched.pop(keyterm, None)
+            elif fuzzy_threshold is not None and index and keyterm not in unmatched:
+                unmatched[keyterm] = (translated_text, list(index.values()))
+
+    if unmatched:
+        candidates = [(keyterm, translated_text, targets) for keyterm, (translated_text, targets) in unmatched.items()]
+        for keyterm, target, score in fuzzy_matches(candidates, fuzzy_threshold):
+            logging.debug('Found %s : %s (chrF %.1f)', keyterm, target, score)
+            found[keyterm] = target
+
+    return found
+
+
+def load_models(nlp_id, nlp_target):
+    """
+    Loads the spaCy models into this process, the worker processes forked after share them copy on write
+    """
+    _worker['nlp_id'] = load_spacy_model(nlp_id)
+    _worker['nlp_target'] = load_spacy_model(nlp_target)
+    logging.debug(f"Loaded models {nlp_id} {nlp_target} in {os.getpid()}")
+
+
+def init_worker(nlp_id, nlp_target, dictionary_file, target_language, category_id, cache_path, cache_read_only,
+                nlp_server=None, manifest_path=None, cache_keyterms=False, reprocess=False, fuzzy_threshold=None):
+    """
+    Opens the phrase dictionary, the translation cache and the unit manifest once per worker process, and the keyterm
+    server or the spaCy models unless the worker was forked with the models already loaded
+    """
+    set_log_level(Config.DEBUG)
+    if nlp_server:
+        _worker['client'] = KeytermClient(nlp_server)
+    elif 'nlp_id' not in _worker:
+        load_models(nlp_id, nlp_target)
+    _worker['phrases'] = PhraseDictionary(dictionary_file)
+    _worker['target_language'] = target_language
+    _worker['category_id'] = category_id
+    _worker['cache'] = TranslationCache(cache_path, read_only=cache_read_only) if cache_path else None
+    _worker['manifest'] = UnitManifest(manifest_path, nlp_id, nlp_target, category_id) if manifest_path else None
+    _worker['cache_keyterms'] = cache_keyterms
+    _worker['reprocess'] = reprocess
+    _worker['fuzzy_threshold'] = fuzzy_threshold
+
+
+def process_shard(shard):
+    """
+    Extracts and matches the phrases of a contiguous range of units a batch of units at a time. The unique candidate
+    keyterms of a batch are translated together, and the phrases matched in a batch are added to the phrase dictionary
+    straight away so the other workers do not translate them again. With a unit manifest the units it has are skipped,
+    and the units of a batch are recorded in it after their phrases are added, but for the units with a keyterm that
+    could not be translated
+    :param shard: A (source tmx, start, end, pipe batch size, n_process) tuple, end is exclusive
+    :return: The number of phrases the shard added and a snapshot of the metrics of the shard
+    """
+    from ...common.translator import TranslationClient
+
+    source_tmx, start, end, batch_size, n_process = shard
+    cache, manifest, cache_keyterms = _worker['cache'], _worker['manifest'], _worker['cache_keyterms']
+    metrics = Metrics()
+    added = 0
+
+    def extract(units):
+        if 'client' in _worker:
+            return request_unit_keyterms(units, _worker['client'], batch_size, metrics)
+        return extract_unit_keyterms(units, _worker['nlp_id'], _worker['nlp_target'], batch_size, n_process, metrics)
+
+    with metrics.stage('shard'), TranslationClient(Config.SUBSCRIPTION_KEY, Config.REGION, Config.TRANSLATOR_ENDPOINT,
+                                                   metrics=metrics) as translator:
+        units = iter_tmx_units(source_tmx, start=start, end=end)
+        if manifest is None:
+            unit_keyterms = ((unit, None, res_id, res_target, True) for unit, res_id, res_target in extract(units))
+        else:
+            unit_keyterms = parse_pending_units(pending_units(units, manifest, batch_size, cache_keyterms,
+                                                              _worker['reprocess'], metrics), extract)
+        for batch in iter(lambda: list(islice(unit_keyterms, batch_size)), []):
+            # Logged lazily, formatting a line per batch costs more than the logging when it is off
+            logging.debug('Processing records %s to %s (Shard start %s Shard end %s)', batch[0][0].index,
+                          batch[-1][0].index, start, end - 1)
+            keyterms = [(res_id, res_target) for _, _, res_id, res_target, _ in batch]
+            with metrics.timer('match_seconds'):
+                candidates = candidate_keyterms(keyterms, _worker['phrases'])
+                translations = translate_keyterms(candidates, _worker['target_language'], _worker['category_id'],
+                                                  translator, cache, metrics)
+                matches = match_phrases(keyterms, translations, _worker['fuzzy_threshold'])
+            metrics.increment('keyterm_candidates_total', len(candidates))
+            if matches:
+                with metrics.timer('dictionary_write_seconds'):
+                    added += _worker['phrases'].add_many(matches.items())
+            metrics.increment('units_total', len(batch))
+            # A unit with a candidate whose translation failed after all retries, e.g. past the translation quota, is
+            # not recorded as mined so the next run mines it again
+            failed = set(candidates).difference(translations)
+            complete = [not any(keyterm in failed for keyterm, _ in res_id) for res_id, _ in keyterms]
+            if failed:
+                metrics.increment('units_incomplete_total', complete.count(False))
+                logging.warning(f"Could not translate {len(failed)} keyterms of {complete.count(False)} units, records "
+                                f"{batch[0][0].index} to {batch[-1][0].index}")
+            if manifest is None:
+                continue
+            if cache_keyterms:
+                for _, _, _, _, parsed in batch:
+                    metrics.increment('keyterm_cache_total', result='miss' if parsed else 'hit')
+            manifest.record([fingerprint for (_, fingerprint, _, _, _), done in zip(batch, complete) if done],
+                            [(fingerprint, res_id, res_target) for _, fingerprint, res_id, res_target, parsed in batch
+                             if cache_keyterms and parsed])
+
+    metrics.increment('phrases_added_total', added)
+    return added, metrics.snapshot()
+
+
+def load_phrases(phrase_file_name):
+    """
+    Streams the phrases of a legacy comma separated phrase dictionary, each line holds a source phrase, a comma and
+    its target phrase. The line is split on its first comma so a comma in the target phrase is kept, a comma in the
+    source phrase cannot be told apart from the separator in this format
+    :param phrase_file_name: The legacy phrase dictionary file
+    :return: A generator of (source phrase, target phrase) tuples
+    """
+    with open(phrase_file_name, 'r', encoding='utf-8') as phrase_file:
+        for line in phrase_file:
+            source_phrase, separator, target_phrase = line.partition(',')
+            if source_phrase.strip() and separator:
+                yield source_phrase.strip(), target_phrase.strip()
+
+
+def open_phrase_dictionary(dictionary_path, target_language):
+    """
+    Opens the phrase dictionary of a target language, a new dictionary imports the legacy comma separated
+    <language>_phrase_dictionary.txt next to it once
+    :param dictionary_path: The phrase dictionary directory
+    :param target_language: The target language code
+    :return: The PhraseDictionary
+    """
+    dictionary_file = os.path.join(dictionary_path, target_language + '_phrase_dictionary.sqlite')
+    phrases = PhraseDictionary(dictionary_file)
+    legacy_file = os.path.join(dictionary_path, target_language + '_phrase_dictionary.txt')
+    if len(phrases) == 0 and os.path.isfile(legacy_file):
+        added = phrases.add_many(load_phrases(legacy_file))
+        logging.info(f"Imported {added} phrases from the legacy phrase dictionary {legacy_file}")
+    return phrases
+
+
+def build_shards(source_tmx, start, end, workers, batch_size, n_process):
+    """
+    Splits the inclusive unit range start to end into contiguous shards
+    :return: A list of shards for process_shard
+    """
+    shard_count = max(1, workers * SHARDS_PER_WORKER) if workers > 1 else 1
+    shard_size = max(1, math.ceil((end - start + 1) / shard_count))
+    return [(source_tmx, shard_start, min(shard_start + shard_size, end + 1), batch_size, n_process)
+            for shard_start in range(start, end + 1, shard_size)]
+
+
+def build_dictionary(args, metrics):
+    """
+    Extracts and matches the phrases of the units in the batch range across the workers and exports the dictionary
+    :param args: The parsed arguments
+    :param metrics: The Metrics the stages are recorded in, the metrics of each shard are merged into them
+    """
+    if args.cache_path and not args.cache_read_only:
+        # Apply the eviction policy once up front, the workers open the cache without one
+        TranslationCache(args.cache_path,
+                         int(Config.CACHE_MAX_ENTRIES) if Config.CACHE_MAX_ENTRIES else None,
+                         float(Config.CACHE_MAX_AGE_DAYS) * 86400 if Config.CACHE_MAX_AGE_DAYS else None).close()
+
+    unit_count = count_tmx_units(args.source_tmx)
+    logging.debug(f"Found {unit_count} units in {args.source_tmx}")
+    batch_end = unit_count - 1 if args.batch_end < 0 else min(args.batch_end, unit_count - 1)
+
+    # Creates the dictionary before the workers open it, they add their phrases to it as they find them
+    with open_phrase_dictionary(args.dictionary_path, args.target_language) as phrases:
+        dictionary_file = phrases.path
+        logging.debug(f"Opened phrase dictionary {dictionary_file} with {len(phrases)} phrases")
+
+    if args.manifest_path:
+        # Creates the manifest before the workers open it, they record the units they mine in it
+        UnitManifest(args.manifest_path, args.nlp_id, args.nlp_target, args.category_id).close()
+
+    worker_args = (args.nlp_id, args.nlp_target, dictionary_file, args.target_language, args.category_id,
+                   args.cache_path, args.cache_read_only, args.nlp_server, args.manifest_path, args.cache_keyterms,
+                   args.reprocess, args.fuzzy_threshold)
+    shards = build_shards(args.source_tmx, args.batch_start, batch_end, args.workers, args.pipe_batch_size,
+                          args.n_process if args.workers <= 1 else 1)
+
+    if args.workers <= 1:
+        init_worker(*worker_args)
+        results = map(process_shard, shards)
+    elif args.nlp_server or 'fork' not in multiprocessing.get_all_start_methods():
+        pool = multiprocessing.Pool(args.workers, initializer=init_worker, initargs=worker_args)
+        results = pool.imap(process_shard, shards)
+    else:
+        # The models are loaded once and the workers forked after, so they share the memory of the models copy on
+        # write rather than each loading their own. The models are out of the garbage collector while the workers
+        # are forked so a collection in a worker does not copy the pages they share
+        with metrics.stage('load_models'):
+            load_models(args.nlp_id, args.nlp_target)
+        gc.freeze()
+        pool = multiprocessing.get_context('fork').Pool(args.workers, initializer=init_worker, initargs=worker_args)
+        gc.unfreeze()
+        results = pool.imap(process_shard, shards)
+
+    added = 0
+    with metrics.stage('shards'):
+        for shard_added, shard_metrics in results:
+            added += shard_added
+            metrics.merge(shard_metrics)
+
+    if args.workers > 1:
+        pool.close()
+        pool.join()
+    else:
+        _worker['phrases'].close()
+        if _worker['manifest']:
+            _worker['manifest'].close()
+
+    # Custom Translator takes a phrase dictionary as a pair of line aligned files, one per language
+    phrase_file_name = os.path.join(args.dictionary_path, args.target_language + '_phrase_dictionary_{}.txt')
+    with metrics.stage('export'), PhraseDictionary(dictionary_file, read_only=True) as phrases:
+        count = phrases.export_text(phrase_file_name.format(args.source_language),
+                                    phrase_file_name.format(args.target_language))
+    logging.info(f"Added {added} phrases to {dictionary_file}, exported {count} phrases to "
+                 f"{phrase_file_name.format('*')}")
+    if args.manifest_path:
+        logging.info(f"Mined {metrics.counter('units_total')} units, skipped "
+                     f"{metrics.counter('units_skipped_total')} units already in {args.manifest_path}")
+    if args.cache_path:
+        hits = metrics.counter('translation_cache_total', result='hit')
+        misses = metrics.counter('translation_cache_total', result='miss')
+        logging.info(f"Translation cache {args.cache_path} hits {hits} misses {misses}")
 
 
 def main():
@@ -30,6 +472,8 @@ def main():
                         help='The input/output path for the phrase dictionary')
     parser.add_argument('--target-language', type=str, default='',
                         help='es or fr')
+    parser.add_argument('--source-language', type=str, default='en',
+                        help='The source language code the exported source phrase file is named with')
     parser.add_argument('--category-id', type=str, default='',
                         help='The model against which to build the phrase dictionary')
     parser.add_argument('--nlp-id', type=str, default='',
@@ -39,71 +483,56 @@ def main():
     parser.add_argument('--batch-start', type=int, default=0, metavar='N',
                         help='start at this number + batch-size')
     parser.add_argument('--batch-end', type=int, default=100, metavar='N',
-                        help='end at this number')
+                        help='end at this number, -1 for the last unit')
+    parser.add_argument('--workers', type=int, default=1, metavar='N',
+                        help='The number of worker processes the units are sharded across')
+    parser.add_argument('--pipe-batch-size', type=int, default=64, metavar='N',
+                        help='The number of texts spaCy parses per batch')
+    parser.add_argument('--n-process', type=int, default=1, metavar='N',
+                        help='The number of processes spaCy parses with when running a single worker')
+    parser.add_argument('--cache-path', type=str, default=Config.TRANSLATION_CACHE,
+                        help='The SQLite translation cache file, translations are not cached if omitted')
+    parser.add_argument('--cache-read-only', action='store_true', default=Config.CACHE_READ_ONLY,
+                        help='Read from the translation cache without writing to it')
+    parser.add_argument('--nlp-server', type=str, default=Config.NLP_SERVER,
+                        help='The socket of a keyterm server with the models loaded, the units are parsed by the '
+                             'server rather than loading the models in this run')
+    parser.add_argument('--manifest-path', type=str, default=Config.PHRASE_MANIFEST,
+                        help='The SQLite manifest of the units already mined with these models and category, only new '
+                             'or changed units are mined and every unit is mined if omitted')
+    parser.add_argument('--cache-keyterms', action='store_true', default=Config.CACHE_KEYTERMS,
+                        help='Keep the keyterms of each unit in the manifest, so mining it again e.g. for another '
+                             'category does not parse it again')
+    parser.add_argument('--reprocess', action='store_true',
+                        help='Mine every unit in the batch range whether or not it is in the manifest, e.g. after '
+                             'upgrading a spaCy model of the same name')
+    parser.add_argument('--fuzzy-threshold', type=float, default=Config.FUZZY_THRESHOLD, metavar='CHRF',
+                        help='Also keep a source keyterm without an exact match when the chrF score, from 0 to 100, of '
+                             'its translation against a target keyterm of its unit is at least this, exact matches '
+                             'only if omitted')
+    parser.add_argument('--metrics-path', type=str, default=Config.METRICS_PATH,
+                        help='Write the stage timings, request counts and cache hits of the run to this file, in the '
+                             'Prometheus text format if it ends in .prom and as JSON otherwise')
+    parser.add_argument('--profile', type=str, default=Config.PROFILE,
+                        help='Profile the run to this file, with pyinstrument if it ends in .html and cProfile '
+                             'otherwise')
 
     args = parser.parse_args()
     set_log_level(Config.DEBUG)
 
-    nlp_model_id = load_spacy_model(args.nlp_id)
-    nlp_model_target = load_spacy_model(args.nlp_target)
-    logging.debug(f"Loaded models {args.nlp_id} {args.nlp_target}")
-
-    phrases = {}
-
-    tmx_file = load_tmx_file(args.source_tmx)
-    logging.debug(f"Loaded {args.source_tmx}")
-
-    if os.path.isfile(os.path.join(args.dictionary_path, args.target_language + '_phrase_dictionary.txt')):
-        phrase_file_name = str(os.path.join(args.dictionary_path, args.target_language + '_phrase_dictionary.txt'))
-        phrase_file = load_phrase_dictionary(phrase_file_name, 'a')
-        logging.debug(f"Found existing phrase dictionary {phrase_file_name}")
-        phrase_list = [line.rstrip('\n') for line in open(phrase_file_name)]
-        for line in phrase_list:
-            lst_line = line.split(',')
-            if len(lst_line[0]) > 0:
-                phrases[lst_line[0]] = lst_line[1]
-
-    else:
-        phrase_file = load_phrase_dictionary(os.path.join(args.dictionary_path, args.target_language +
-                                                          '_phrase_dictionary.txt'), 'a')
-
-    for i, unit in enumerate(tmx_file.getunits()):
-
-        if i < args.batch_start:
-            continue
+    if args.nlp_server:
+        models = KeytermClient(args.nlp_server).models()
+        if args.nlp_id and args.nlp_target and models != (args.nlp_id, args.nlp_target):
+            parser.error(f"The keyterm server {args.nlp_server} has the models {' '.join(models)} loaded")
+    if args.cache_keyterms and not args.manifest_path:
+        parser.error('--cache-keyterms keeps the keyterms in the manifest, it needs --manifest-path')
 
-        if i > args.batch_end:
-            break
-
-        logging.info(f"Processing record {i} of {len(tmx_file.units)} (Batch start {args.batch_start} Batch end "
-                     f"{args.batch_end})")
-
-        nlp_id = nlp_model_id(unit.getid())
-        nlp_target = nlp_model_target(unit.gettarget())
-        res_id = ke.textrank(nlp_id, normalize='lemma', include_pos=('NOUN', 'PROPN', 'ADJ', 'VERB'), window_size=5,
-                                     edge_weighting='binary', position_bias=False, topn=5)
-        res_target = ke.textrank(nlp_target, normalize='lemma', include_pos=('NOUN', 'PROPN', 'ADJ', 'VERB'),
-                                         window_size=5, edge_weighting='binary', position_bias=False, topn=5)
-
-        for r_id in res_id:
-            if (len(r_id[0].split()) > 1) and (len(res_target) > 0):  # We don't want single words, we want phrases
-                if not r_id[0] in phrases:
-                    translation_results = call_translation([{'Text': r_id[0]}], args.target_language,
-                                                           args.category_id, Config.SUBSCRIPTION_KEY, Config.REGION)
-                    if len(translation_results[0]['translations'][0]) > 0:
-                        for r_tar in res_target:
-                            if len(r_tar[0].split()) > 1:
-                                bleu_score = 0
-                                # Let's only take exact matches
-                                if r_tar[0].lower().strip() == translation_results[0]['translations'][0][
-                                    'text'].lower().strip():
-                                    bleu_score = 1  # We use absolute matches but keep this here for BLEU if needed
-                                    print(f"Found {r_id[0]} : {r_tar[0].strip()}")
-                                    phrases[r_id[0]] = r_tar[0].strip()
-                                    # As the phrase dictionary is case sensitive, let's include a few variations
-                                    phrase_file.write('\n' + r_id[0] + ', ' + r_tar[0].strip())
-                                # TODO add BLEU evaluation if needed
-    phrase_file.close()
+    metrics = Metrics()
+    # The profile covers this process, the workers of a run with --workers are not profiled
+    with profile(args.profile):
+        build_dictionary(args, metrics)
+    if args.metrics_path:
+        metrics.write(args.metrics_path)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,54 @@
+import argparse
+import os
+import signal
+import sys
+
+from dotenv import load_dotenv
+from ...common.common import set_log_level
+from ...common.keyterms import KeytermServer, PIPE_BATCH_SIZE
+
+load_dotenv()
+
+
+class Config:
+    """
+    Read from .env file - These are params that are static across parallel jobs
+    """
+    DEBUG = bool(os.environ.get("DEBUG"))  # Activate debugging
+    NLP_SERVER = os.environ.get("NLP_SERVER")  # The socket the keyterm server listens on
+
+
+def main():
+    """
+    Loads the source and target spaCy models once and serves the keyterms of the units the phrase dictionary batch
+    jobs send it, from workers forked after the models are loaded, until it is interrupted or terminated
+    """
+    parser = argparse.ArgumentParser(description='Serve spaCy and textrank keyterms to the phrase dictionary builders')
+    parser.add_argument('--socket', type=str, default=Config.NLP_SERVER, required=not Config.NLP_SERVER,
+                        help='The Unix socket file to listen on, the builders take it as --nlp-server')
+    parser.add_argument('--nlp-id', type=str, required=True,
+                        help='The source language spacy model e.g. en_core_web_md')
+    parser.add_argument('--nlp-target', type=str, required=True,
+                        help='The target language spacy model e.g. fr_core_news_md')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, metavar='N',
+                        help='The number of worker processes parsing requests in parallel')
+    parser.add_argument('--pipe-batch-size', type=int, default=PIPE_BATCH_SIZE, metavar='N',
+                        help='The number of texts spaCy parses per batch')
+
+    args = parser.parse_args()
+    set_log_level(Config.DEBUG)
+
+    # A terminated server closes its workers and removes its socket like an interrupted one
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    with KeytermServer(args.socket, args.nlp_id, args.nlp_target, args.workers, args.pipe_batch_size) as server:
+        server.start()
+        print(f"Serving the keyterms of {args.nlp_id} and {args.nlp_target} on {args.socket} with {args.workers} "
+              f"workers", flush=True)
+        try:
+            server.join()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+import argparse
+import os
+import subprocess
+import tempfile
+import time
+
+from ..common.aligner import align_sentences
+from ..common.tmx_reader import iter_tmx_units
+
+
+def write_documents(tmx, directory, units, join):
+    """
+    Writes a source and target document from the units of a tmx file, dropping sentences from either side and
+    merging some target sentences so the documents need more than 1-1 alignments
+    :param tmx: The tmx file
+    :param directory: The directory to write source.txt and target.txt to
+    :param units: The number of units to read
+    :param join: The number of units joined into each sentence, for documents with longer sentences
+    :return: The source and target document
+    """
+    source_lines, target_lines = [], []
+    for i, unit in enumerate(iter_tmx_units(tmx, end=units)):
+        if i % 13 != 5:
+            source_lines.append(' '.join(unit.getid().split()))
+        if i % 17 != 3:
+            target_lines.append(' '.join(unit.gettarget().split()))
+        if i % 29 == 7:
+            target_lines[-1] += ' ' + ' '.join(unit.gettarget().split())
+
+    documents = []
+    for name, lines in (('source.txt', source_lines), ('target.txt', target_lines)):
+        lines = [' '.join(lines[i:i + join]) for i in range(0, len(lines), join)]
+        documents.append(os.path.join(directory, name))
+        with open(documents[-1], 'w') as document:
+            document.write('\n'.join(lines) + '\n')
+    return documents
+
+
+def benchmark(engine, source_file, target_file, aligner_path):
+    """
+    :return: The wall time in seconds and the contents of both .aligned documents
+    """
+    started = time.perf_counter()
+    if engine == 'perl':
+        subprocess.run(['perl', 'align-sents-all.pl', os.path.abspath(source_file), os.path.abspath(target_file)],
+                       cwd=aligner_path, stdout=subprocess.DEVNULL, check=True)
+    else:
+        align_sentences(source_file, target_file)
+    seconds = time.perf_counter() - started
+
+    aligned = []
+    for file in (source_file, target_file):
+        with open(file + '.aligned', 'rb') as aligned_file:
+            aligned.append(aligned_file.read())
+    return seconds, aligned
+
+
+def main():
+    """
+    Compares the wall time of the Perl aligner scripts with the NumPy port and checks they write the same output
+    """
+    parser = argparse.ArgumentParser(description='Benchmark the sentence aligners')
+    parser.add_argument('--tmx', type=str, default='Data/train/EAC_FORMS.en_es.tmx',
+                        help='The tmx file the documents are built from')
+    parser.add_argument('--aligner-path', type=str, default='Aligner',
+                        help='The directory of the Perl aligner scripts')
+    parser.add_argument('--units', type=int, default=None, metavar='N',
+                        help='The number of units to read, defaults to the whole file')
+    parser.add_argument('--join', type=int, nargs='+', default=[1, 3], metavar='N',
+                        help='The number of units joined into each sentence, one run per value')
+    args = parser.parse_args()
+
+    print(f"{'sentences':>10} {'words/sentence':>15} {'engine':<8} {'seconds':>9} {'aligned':>8} {'same':>5}")
+    for join in args.join:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            results = {}
+            for engine in ('perl', 'python'):
+                os.mkdir(os.path.join(temp_dir, engine))
+                source_file, target_file = write_documents(args.tmx, os.path.join(temp_dir, engine), args.units,
+                                                           join)
+                results[engine] = benchmark(engine, source_file, target_file, args.aligner_path)
+
+            with open(source_file) as source:
+                lines = source.read().split('\n')[:-1]
+            words = sum(len(line.split()) for line in lines) / len(lines)
+            for engine, (seconds, aligned) in results.items():
+                print(f"{len(lines):>10} {words:>15.1f} {engine:<8} {seconds:>9.3f} "
+                      f"{len(aligned[0].splitlines()):>8} {str(aligned == results['perl'][1]):>5}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+from ..__main__ import COMMANDS
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ('spacy', 'textacy', 'pandas', 'numpy', 'requests', 'pdfminer', 'translate', 'lxml')
+# What every entry point imported before the stages imported their own dependencies, common.common alone pulled in
+# spaCy, translate-toolkit and requests
+EAGER_IMPORTS = 'import spacy, translate.storage.tmx, requests, pandas, pdfminer.pdfpage'
+IMPORT_TIME = re.compile(r'import time:\s+\d+ \|\s+\d+ \|( *)(\S+)')
+
+
+def run(arguments):
+    """
+    :return: The wall time in seconds of a fresh interpreter running the arguments from the directory above the
+    repository, as the package relative imports need
+    """
+    started = time.perf_counter()
+    subprocess.run([sys.executable] + arguments, cwd=os.path.dirname(ROOT), stdout=subprocess.DEVNULL,
+                   stderr=subprocess.DEVNULL, check=True)
+    return time.perf_counter() - started
+
+
+def heavy_imports(arguments):
+    """
+    :return: The heavy top level packages the arguments import, read from python -X importtime
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime'] + arguments, cwd=os.path.dirname(ROOT),
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, check=True)
+    modules = {match.group(2).split('.')[0] for match in IMPORT_TIME.finditer(result.stderr)}
+    return [module for module in HEAVY_MODULES if module in modules]
+
+
+def main():
+    """
+    Measures the cold start latency of each command of python -m <package>, the time a fresh interpreter takes to
+    import the command's entry point and print its help, against a bare interpreter and one importing the heavy
+    dependencies every entry point used to import
+    """
+    parser = argparse.ArgumentParser(description='Benchmark the cold start of the command line')
+    parser.add_argument('--repeats', type=int, default=5, metavar='N',
+                        help='The number of fresh interpreters timed per command, the median is reported')
+    parser.add_argument('--commands', type=str, nargs='+', default=list(COMMANDS), choices=list(COMMANDS),
+                        help='The commands to time')
+    args = parser.parse_args()
+
+    runs = [('python', ['-c', 'pass']), ('eager imports', ['-c', EAGER_IMPORTS])]
+    runs += [(command, ['-m', os.path.basename(ROOT), command, '--help']) for command in args.commands]
+    print(f"{'command':<20} {'median ms':>9} {'min ms':>7}  heavy imports")
+    for name, arguments in runs:
+        seconds = [run(arguments) for _ in range(args.repeats)]
+        print(f"{name:<20} {statistics.median(seconds) * 1000:>9.0f} {min(seconds) * 1000:>7.0f}  "
+              f"{' '.join(heavy_imports(arguments))}")
+
+
+if __name__ == '__main__':
+    main()
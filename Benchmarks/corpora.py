@@ -0,0 +1,117 @@
+import io
+import os
+import random
+import re
+
+from ..common.tmx_reader import iter_tmx_units
+
+SAMPLE_TMX = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Tests', 'Data',
+                          'en_es.tmx')  # The sample memory the generated corpora take their vocabulary from
+WORDS = ['translation', 'model', 'document', 'sentence', 'reference', 'the', 'of', 'and', 'a', 'custom', 'quality',
+         'evaluation', 'language', 'text', 'human', 'machine', 'aligned', 'service', 'category', 'score']
+TARGET_LENGTH_RATIO = 1.15  # Spanish and French sentences run about this much longer than their English source
+WORD = re.compile(r'[^\W\d_]+')
+
+
+def sample_vocabulary(file=SAMPLE_TMX):
+    """
+    :param file: A sample translation memory
+    :return: The sorted lower cased source words and target words of its units, the source words include WORDS
+    """
+    source_words, target_words = set(WORDS), set()
+    for unit in iter_tmx_units(file):
+        source_words.update(word.lower() for word in WORD.findall(unit.getid()))
+        target_words.update(word.lower() for word in WORD.findall(unit.gettarget()))
+    return sorted(source_words), sorted(target_words)
+
+
+def iter_sentence_pairs(count, seed=0, vocabulary=None, min_words=3, max_words=25):
+    """
+    Generates aligned sentence pairs of random words, the target about TARGET_LENGTH_RATIO longer than its source as
+    in a real memory, each pair numbered so none is a duplicate. Pairs are generated lazily so a corpus of millions of
+    segments is written without holding it in memory
+    :param count: The number of pairs
+    :param seed: The random seed of the words
+    :param vocabulary: The source and target words, defaults to those of the sample memory in Tests/Data
+    :param min_words: The fewest words of a source sentence
+    :param max_words: The most words of a source sentence
+    :return: A generator of (source sentence, target sentence) tuples
+    """
+    rng = random.Random(seed)
+    source_words, target_words = vocabulary or sample_vocabulary()
+    for i in range(count):
+        length = rng.randint(min_words, max_words)
+        source = ' '.join(rng.choice(source_words) for _ in range(length)).capitalize()
+        target = ' '.join(rng.choice(target_words) for _ in range(round(length * TARGET_LENGTH_RATIO)))
+        yield f"{source} {i}.", f"{target.capitalize()} {i}."
+
+
+def write_tmx(file, pairs, source_language='en-GB', target_language='es-ES'):
+    """
+    Writes a utf-8 tmx with one unit per line
+    :param file: The tmx file
+    :param pairs: An iterable of (source sentence, target sentence) tuples
+    :return: The number of units written
+    """
+    count = 0
+    with open(file, 'w', encoding='utf-8') as tmx:
+        tmx.write(f'<?xml version="1.0" encoding="utf-8"?>\n<tmx version="1.4">\n<header srclang="{source_language}"/>'
+                  f'\n<body>\n')
+        for source, target in pairs:
+            tmx.write(f'<tu><tuv xml:lang="{source_language}"><seg>{escape_xml(source)}</seg></tuv>'
+                      f'<tuv xml:lang="{target_language}"><seg>{escape_xml(target)}</seg></tuv></tu>\n')
+            count += 1
+        tmx.write('</body>\n</tmx>\n')
+    return count
+
+
+def escape_xml(text):
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
+def write_text(file, sentences):
+    """
+    Writes a text document with one sentence per line, as the pdf extraction writes them for the aligner
+    """
+    with open(file, 'w', encoding='utf-8') as text:
+        for sentence in sentences:
+            text.write(sentence + '\n')
+
+
+def _pdf_string(line):
+    return b'(' + line.encode('latin-1', 'replace').replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(
+        b')', b'\\)') + b')'
+
+
+def write_pdf(file, lines, lines_per_page=45):
+    """
+    Writes a text only pdf with one Helvetica content stream per page, no pdf library is needed
+    :param file: The pdf file
+    :param lines: The lines of text, characters outside latin-1 are written as ?
+    :param lines_per_page: The number of lines on each page
+    """
+    lines = list(lines)
+    pages = [lines[start:start + lines_per_page] for start in range(0, len(lines), lines_per_page)] or [[]]
+    objects = [b'<< /Type /Catalog /Pages 2 0 R >>',
+               b'<< /Type /Pages /Kids [' + b' '.join(b'%d 0 R' % (4 + 2 * page) for page in range(len(pages))) +
+               b'] /Count %d >>' % len(pages),
+               b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>']
+    for page, page_lines in enumerate(pages):
+        stream = b'BT /F1 10 Tf 12 TL 50 800 Td ' + b' '.join(_pdf_string(line) + b' Tj T*'
+                                                             for line in page_lines) + b' ET'
+        objects.append(b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Resources << /Font << /F1 3 0 R >> '
+                       b'>> /Contents %d 0 R >>' % (5 + 2 * page))
+        objects.append(b'<< /Length %d >>\nstream\n' % len(stream) + stream + b'\nendstream')
+
+    pdf = io.BytesIO()
+    pdf.write(b'%PDF-1.4\n')
+    offsets = []
+    for number, content in enumerate(objects, 1):
+        offsets.append(pdf.tell())
+        pdf.write(b'%d 0 obj\n' % number + content + b'\nendobj\n')
+    xref = pdf.tell()
+    pdf.write(b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1))
+    pdf.write(b''.join(b'%010d 00000 n \n' % offset for offset in offsets))
+    pdf.write(b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref))
+    with open(file, 'wb') as pdf_file:
+        pdf_file.write(pdf.getvalue())
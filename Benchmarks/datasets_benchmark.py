@@ -0,0 +1,142 @@
+import argparse
+import multiprocessing
+import os
+import random
+import resource
+import tempfile
+import time
+from re import search
+
+from ..Analysis.Datasets.build_datasets import ShardedTmxWriter, split_units, write_units, MAX_TRAIN_UNITS, \
+    TEST_TUNE_LIMIT
+from ..common.tmx_reader import iter_tmx_units
+
+WORDS = ['translation', 'model', 'document', 'sentence', 'reference', 'the', 'of', 'and', 'a', 'custom', 'quality',
+         'evaluation', 'language', 'text', 'human', 'machine', 'aligned', 'service', 'category', 'score']
+
+
+def write_tmx(file, units, seed=0):
+    """
+    Writes a one unit per line utf-8 tmx with the bad encodings the notebook repaired, one in every 50 units has a
+    stray ampersand and an invalid character reference and one in every 20 is a duplicate
+    :param file: The tmx file
+    :param units: The number of units
+    :param seed: The random seed of the words
+    """
+    rng = random.Random(seed)
+    with open(file, 'w', encoding='utf-8') as tmx:
+        tmx.write('<?xml version="1.0" encoding="utf-8"?>\n<tmx version="1.4">\n<header srclang="en-GB"/>\n<body>\n')
+        previous = ''
+        for i in range(units):
+            if i % 20 == 19:
+                tmx.write(previous)
+                continue
+            source = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(3, 25))).capitalize()
+            if i % 50 == 0:
+                source += ' & more&#x1E;'
+            previous = (f'<tu><tuv xml:lang="en-GB"><seg>{source} {i}</seg></tuv><tuv xml:lang="es-ES"><seg>'
+                        f'{source.upper()} {i}</seg></tuv></tu>\n')
+            tmx.write(previous)
+        tmx.write('</body>\n</tmx>\n')
+
+
+def legacy_split(master_tmx, output_path):
+    """
+    The notebook loop, the file is repaired line by line into a copy, loaded whole with translate-toolkit and
+    written a unit at a time, without deduplication or filtering
+    """
+    from translate.storage.tmx import tmxfile
+
+    edited_tmx = os.path.join(output_path, 'edited.tmx')
+    with open(edited_tmx, 'ab') as output_file:
+        with open(master_tmx, 'r', encoding='utf-8') as input_file:
+            line = input_file.readline()
+            while line:
+                new_line = line
+                found = search('#x1E;', line)
+                if found is not None:
+                    new_line = line[:int(found.span(0)[0])] + line[int(found.span(0)[1]):]
+                if search('&', new_line) is not None and ('<seg>' in new_line or '</seg>' in new_line):
+                    new_line = new_line.replace('&', ' and ')
+                output_file.write(new_line.encode('utf-8'))
+                line = input_file.readline()
+
+    with open(edited_tmx, 'rb') as tmx:
+        tmx_file = tmxfile(tmx, 'en-GB', 'es-ES')
+
+    f_train = None
+    f_test = open(os.path.join(output_path, 'test.tmx'), 'ab')
+    test_unit_count = 0
+    for i, unit in enumerate(tmx_file.unit_iter()):
+        if i % MAX_TRAIN_UNITS == 0:
+            if f_train is not None:
+                f_train.close()
+            f_train = open(os.path.join(output_path, str(i // MAX_TRAIN_UNITS) + '_train.tmx'), 'ab')
+        if test_unit_count < TEST_TUNE_LIMIT and i % 100 == 0:
+            f_test.write(str(unit).replace('en-GB', 'en-US').encode('utf-8'))
+            test_unit_count += 1
+        else:
+            f_train.write(str(unit).replace('en-GB', 'en-US').encode('utf-8'))
+    f_train.close()
+    f_test.close()
+
+
+def streaming_split(master_tmx, output_path):
+    """
+    The dataset builder, repaired, deduplicated, filtered and split in one streaming pass
+    """
+    with ShardedTmxWriter(os.path.join(output_path, '{}_train.tmx'), 'en-US', 'es-ES', MAX_TRAIN_UNITS) as train:
+        test, tune, _ = split_units(iter_tmx_units(master_tmx, 'en', 'es', repair=True), train, TEST_TUNE_LIMIT,
+                                    TEST_TUNE_LIMIT, tune_min_tokens=7, tune_max_tokens=10)
+    write_units(os.path.join(output_path, 'test.tmx'), test, 'en-US', 'es-ES')
+    write_units(os.path.join(output_path, 'tune.tmx'), tune, 'en-US', 'es-ES')
+
+
+def _run_splitter(splitter, master_tmx, queue):
+    """
+    Runs a splitter in a fresh process so its peak RSS is not shared with the other splitter
+    """
+    started = time.perf_counter()
+    with tempfile.TemporaryDirectory() as output_path:
+        (legacy_split if splitter == 'legacy' else streaming_split)(master_tmx, output_path)
+    # ru_maxrss is in kilobytes on Linux
+    queue.put((time.perf_counter() - started, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024))
+
+
+def benchmark(splitter, master_tmx):
+    """
+    :return: The wall time in seconds and the peak RSS in MB of the splitter
+    """
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=_run_splitter, args=(splitter, master_tmx, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def main():
+    """
+    Compares the wall time and peak RSS of the notebook dataset loop with the streaming dataset builder on generated
+    translation memories
+    """
+    parser = argparse.ArgumentParser(description='Benchmark the translation memory dataset builders')
+    parser.add_argument('--units', type=int, nargs='+', default=[50000, 200000], metavar='N',
+                        help='The number of units of the generated translation memory, one run per value')
+    parser.add_argument('--skip-legacy', action='store_true',
+                        help='Only run the streaming builder, e.g. for a million unit memory')
+    args = parser.parse_args()
+
+    print(f"{'units':>8} {'builder':<10} {'seconds':>9} {'peak MB':>9}")
+    for units in args.units:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            master_tmx = os.path.join(temp_dir, 'master.tmx')
+            write_tmx(master_tmx, units)
+            for splitter in ('streaming',) if args.skip_legacy else ('legacy', 'streaming'):
+                seconds, peak = benchmark(splitter, master_tmx)
+                print(f"{units:>8} {splitter:<10} {seconds:>9.2f} {peak:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
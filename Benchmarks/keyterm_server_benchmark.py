@@ -0,0 +1,157 @@
+import argparse
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+from itertools import islice
+
+from ..common.keyterms import KeytermClient, KeytermServer, pipe_keyterms
+from ..common.common import load_spacy_model
+
+WORDS = ['translation', 'model', 'document', 'sentence', 'reference', 'the', 'of', 'and', 'a', 'custom', 'quality',
+         'evaluation', 'language', 'text', 'human', 'machine', 'aligned', 'service', 'category', 'score']
+VECTOR_WIDTH = 300  # The width of the vectors of the medium spaCy models
+
+
+def word_keyterms(doc):
+    """
+    Stands in for textrank, the benchmark measures the cost of the models rather than of the keyterm extraction
+    """
+    return [(token.lower_, 1.0) for token in doc if token.is_alpha and len(token) > 4]
+
+
+def make_model(path, language, vectors_mb):
+    """
+    Saves a blank spaCy model with a random vectors table of about vectors_mb, standing in for the memory and load
+    time of a medium model
+    """
+    import numpy as np
+    import spacy
+    from spacy.vectors import Vectors
+
+    nlp = spacy.blank(language)
+    rows = vectors_mb * (1 << 20) // (VECTOR_WIDTH * 4)
+    data = np.random.default_rng(0).random((rows, VECTOR_WIDTH), dtype=np.float32)
+    nlp.vocab.vectors = Vectors(strings=nlp.vocab.strings, data=data, keys=list(range(1, rows + 1)))
+    nlp.to_disk(path)
+
+
+def make_texts(count, seed):
+    rng = random.Random(seed)
+    return [' '.join(rng.choice(WORDS) for _ in range(rng.randint(5, 25))).capitalize() for _ in range(count)]
+
+
+def proportional_set_size(pid='self'):
+    """
+    :return: The proportional set size of a process in MB, its shared pages divided between the processes sharing
+    them, so the sizes of processes sharing memory add up to the memory they use together
+    """
+    with open(f'/proc/{pid}/smaps_rollup', 'r') as smaps:
+        for line in smaps:
+            if line.startswith('Pss:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def _batches(texts, batch_size):
+    texts = iter(texts)
+    return iter(lambda: list(islice(texts, batch_size)), [])
+
+
+def _run_shard(models, socket_path, texts, batch_size, launched, queue):
+    """
+    A batch job that either loads the models itself or sends its texts to the keyterm server
+    """
+    if socket_path:
+        client = KeytermClient(socket_path)
+        results = (keyterms for batch in _batches(texts, batch_size) for keyterms in client.keyterms(batch, batch))
+    else:
+        nlp_source, nlp_target = load_spacy_model(models[0]), load_spacy_model(models[1])
+        results = pipe_keyterms(nlp_source, nlp_target, texts, texts, batch_size, extract=word_keyterms)
+    startup = None
+    for _ in results:
+        if startup is None:
+            startup = time.time() - launched
+    queue.put((startup, time.time() - launched, proportional_set_size()))
+
+
+def _run_server(models, socket_path, workers, batch_size, queue, stop):
+    with KeytermServer(socket_path, models[0], models[1], workers, batch_size, word_keyterms) as server:
+        server.start()
+        queue.put([os.getpid()] + [process.pid for process in server._processes])
+        stop.wait()
+
+
+def benchmark(models, shards, units, batch_size, server_workers, temp_dir):
+    """
+    :return: The server load seconds, the mean shard startup and total seconds, and the combined proportional set
+    size in MB of the shards and the server
+    """
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    socket_path, server, server_load, server_pids = None, None, 0.0, []
+    if server_workers:
+        socket_path = os.path.join(temp_dir, 'keyterms.sock')
+        stop = context.Event()
+        started = time.time()
+        server = context.Process(target=_run_server, args=(models, socket_path, server_workers, batch_size, queue,
+                                                           stop))
+        server.start()
+        server_pids = queue.get()
+        server_load = time.time() - started
+
+    launched = time.time()
+    processes = [context.Process(target=_run_shard, args=(models, socket_path, make_texts(units, shard), batch_size,
+                                                          launched, queue))
+                 for shard in range(shards)]
+    for process in processes:
+        process.start()
+    results = [queue.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    memory = sum(pss for _, _, pss in results) + sum(proportional_set_size(pid) for pid in server_pids)
+    if server is not None:
+        stop.set()
+        server.join()
+    return (server_load, sum(startup for startup, _, _ in results) / shards,
+            sum(total for _, total, _ in results) / shards, memory)
+
+
+def main():
+    """
+    Compares phrase dictionary batch jobs that each load both spaCy models with batch jobs sending their units to a
+    keyterm server whose workers share the models copy on write
+    """
+    parser = argparse.ArgumentParser(description='Benchmark the keyterm server against loading the models per shard')
+    parser.add_argument('--shards', type=int, default=4, metavar='N',
+                        help='The number of batch jobs run at once')
+    parser.add_argument('--units', type=int, default=2000, metavar='N',
+                        help='The number of units each batch job parses')
+    parser.add_argument('--server-workers', type=int, default=2, metavar='N',
+                        help='The number of keyterm server workers')
+    parser.add_argument('--vectors-mb', type=int, default=200, metavar='N',
+                        help='The size of the vectors table of each generated model')
+    parser.add_argument('--models', type=str, nargs=2, default=None,
+                        help='Installed source and target spaCy models to use instead of the generated ones')
+    parser.add_argument('--pipe-batch-size', type=int, default=64, metavar='N',
+                        help='The number of texts parsed or sent per batch')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        models = args.models
+        if models is None:
+            models = [os.path.join(temp_dir, language) for language in ('en', 'fr')]
+            for path, language in zip(models, ('en', 'fr')):
+                make_model(path, language, args.vectors_mb)
+
+        print(f"{'mode':<10} {'server load s':>13} {'shard startup s':>15} {'shard total s':>13} {'memory MB':>10}")
+        for mode, workers in (('per shard', 0), ('server', args.server_workers)):
+            server_load, startup, total, memory = benchmark(models, args.shards, args.units, args.pipe_batch_size,
+                                                            workers, temp_dir)
+            print(f"{mode:<10} {server_load:>13.2f} {startup:>15.2f} {total:>13.2f} {memory:>10.0f}")
+
+
+if __name__ == '__main__':
+    main()
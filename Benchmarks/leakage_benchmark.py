@@ -0,0 +1,94 @@
+import argparse
+import os
+import random
+import string
+import tempfile
+import time
+
+import numpy as np
+
+from ..common.leakage import LeakageIndex, SIMILARITY_THRESHOLD, SHINGLE_SIZE, normalise
+
+
+def make_vocabulary(size, seed=0):
+    """
+    :return: size random lower case words of 3 to 9 letters
+    """
+    rng = random.Random(seed)
+    return [''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 9))) for _ in range(size)]
+
+
+def iter_sentences(count, vocabulary, seed=0):
+    """
+    :return: A generator of count random sentences of 6 to 20 words
+    """
+    rng = random.Random(seed)
+    for _ in range(count):
+        yield ' '.join(rng.choice(vocabulary) for _ in range(rng.randint(6, 20))).capitalize() + '.'
+
+
+def near_duplicate(sentence, rng):
+    """
+    :return: The sentence with one word replaced and its case changed, a typical copy edited training segment
+    """
+    words = sentence.split()
+    words[rng.randrange(len(words))] = rng.choice(string.ascii_lowercase) * 4
+    return ' '.join(words).upper()
+
+
+def jaccard(first, second):
+    """
+    :return: The exact Jaccard similarity of the character shingles of two sentences
+    """
+    shingles = [{text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+                for text in (normalise(first), normalise(second))]
+    return len(shingles[0] & shingles[1]) / len(shingles[0] | shingles[1])
+
+
+def main():
+    """
+    Measures the build time and size of the leakage index over generated training segments and the query time. The
+    recall is the share of edited copies whose exact Jaccard similarity to their original is above the threshold that
+    are flagged as seen, the false positives the share of those below it and of unrelated sentences that are
+    """
+    parser = argparse.ArgumentParser(description='Benchmark the leakage index')
+    parser.add_argument('--segments', type=int, nargs='+', default=[100000, 1000000], metavar='N',
+                        help='The number of indexed training segments, one run per value')
+    parser.add_argument('--queries', type=int, default=10000, metavar='N',
+                        help='The number of queries, half near duplicates and half unrelated sentences')
+    args = parser.parse_args()
+
+    vocabulary = make_vocabulary(20000)
+    print(f"{'segments':>9} {'build s':>8} {'index MB':>9} {'query us':>9} {'recall':>7} {'false pos':>9}")
+    for segments in args.segments:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'index')
+            started = time.perf_counter()
+            LeakageIndex.build(path, iter_sentences(segments, vocabulary))
+            build_seconds = time.perf_counter() - started
+            size = sum(os.path.getsize(os.path.join(path, file)) for file in os.listdir(path)) / (1 << 20)
+
+            rng = random.Random(1)
+            planted = sorted(rng.sample(range(segments), args.queries // 2))
+            sentences = iter_sentences(segments, vocabulary)
+            planted_set = set(planted)
+            originals = [sentence for i, sentence in enumerate(sentences) if i in planted_set]
+            duplicates = [near_duplicate(sentence, rng) for sentence in originals]
+            unrelated = list(iter_sentences(args.queries - len(duplicates), vocabulary, seed=2))
+            similar = [jaccard(original, duplicate) >= SIMILARITY_THRESHOLD
+                       for original, duplicate in zip(originals, duplicates)] + [False] * len(unrelated)
+
+            with LeakageIndex(path) as index:
+                started = time.perf_counter()
+                similarities, _ = index.query(duplicates + unrelated)
+                query_seconds = time.perf_counter() - started
+            seen = similarities >= SIMILARITY_THRESHOLD
+            similar = np.array(similar)
+            recall = seen[similar].mean()
+            false_positives = seen[~similar].mean()
+            print(f"{segments:>9} {build_seconds:>8.1f} {size:>9.1f} {query_seconds / args.queries * 1e6:>9.0f} "
+                  f"{recall:>7.3f} {false_positives:>9.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+import argparse
+import io
+import os
+import random
+import tempfile
+import time
+
+from pdfminer.converter import TextConverter
+from pdfminer.layout import LAParams
+from pdfminer.pdfinterp import PDFResourceManager, PDFPageInterpreter
+from pdfminer.pdfpage import PDFPage
+
+from .corpora import write_pdf, WORDS
+from ..common.pdf_text import extract_pdf_texts
+
+
+def write_random_pdf(file, pages, lines_per_page=45, seed=0):
+    """
+    Writes a text only pdf of random words
+    :param file: The pdf file
+    :param pages: The number of pages
+    :param lines_per_page: The number of lines of random words on each page
+    :param seed: The random seed of the words
+    """
+    rng = random.Random(seed)
+    write_pdf(file, (' '.join(rng.choice(WORDS) for _ in range(rng.randint(6, 12))).capitalize() + '.'
+                     for _ in range(pages * lines_per_page)), lines_per_page)
+
+
+def legacy_pdf_parser(data):
+    """
+    The pdf parser as translator_pipeline used it before the extraction stage, the whole text buffer is copied after
+    every page
+    """
+    fp = open(data, 'rb')
+    rsrc_mgr = PDFResourceManager()
+    ret_str = io.StringIO()
+    device = TextConverter(rsrc_mgr, ret_str, laparams=LAParams())
+    interpreter = PDFPageInterpreter(rsrc_mgr, device)
+    for page in PDFPage.get_pages(fp):
+        interpreter.process_page(page)
+        data = ret_str.getvalue()
+    return data
+
+
+def main():
+    """
+    Compares the wall time of the legacy serial pdf parser with the page parallel extraction, cold and from the cache,
+    and checks they extract the same text
+    """
+    parser = argparse.ArgumentParser(description='Benchmark the pdf text extraction')
+    parser.add_argument('--pages', type=int, nargs='+', default=[100, 400], metavar='N',
+                        help='The number of pages of the generated pdf, one run per value')
+    parser.add_argument('--workers', type=int, default=None, metavar='N',
+                        help='The number of extraction processes, defaults to the number of CPUs')
+    args = parser.parse_args()
+
+    print(f"{'pages':>6} {'extractor':<10} {'seconds':>9} {'same':>5}")
+    for pages in args.pages:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            pdf = os.path.join(temp_dir, 'document.pdf')
+            write_random_pdf(pdf, pages)
+
+            started = time.perf_counter()
+            expected = legacy_pdf_parser(pdf)
+            print(f"{pages:>6} {'legacy':<10} {time.perf_counter() - started:>9.2f} {'True':>5}")
+
+            cache_path = os.path.join(temp_dir, 'cache')
+            for extractor in ('parallel', 'cached'):
+                started = time.perf_counter()
+                text = extract_pdf_texts([pdf], args.workers, cache_path)[0]
+                print(f"{pages:>6} {extractor:<10} {time.perf_counter() - started:>9.2f} {str(text == expected):>5}")
+
+
+if __name__ == '__main__':
+    main()
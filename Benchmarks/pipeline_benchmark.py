@@ -0,0 +1,222 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from .corpora import iter_sentence_pairs, sample_vocabulary, write_pdf, write_tmx
+from .translator_stub import TranslatorStub
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CASES = ('evaluate', 'phrases')  # The evaluation pipeline on generated pdfs, the phrase builder on a generated tmx
+CATEGORIES = 'general,custom'  # The models the evaluation case translates against
+TOLERANCE = 0.25  # The fraction a measurement may be worse than its baseline before it counts as a regression
+MIN_COMPARED_SECONDS = 0.5  # Timings shorter than this in the baseline are too noisy to compare
+LOG_TAIL = 2000  # The characters of the log of a failed case that are printed
+
+
+def run_command(arguments, env, log_file):
+    """
+    Runs python -m <package> from the directory above the repository, as the package relative imports need
+    :param arguments: The command and its arguments
+    :param env: The environment of the command
+    :param log_file: The file the output of the command is written to
+    :return: The exit code, the wall time in seconds and the peak RSS in MB of the command
+    """
+    started = time.perf_counter()
+    with open(log_file, 'w') as log:
+        process = subprocess.Popen([sys.executable, '-m', os.path.basename(ROOT)] + arguments,
+                                   cwd=os.path.dirname(ROOT), env=env, stdout=log, stderr=subprocess.STDOUT)
+        # The peak RSS wait4 reports covers the command and the worker processes it waited for
+        _, status, usage = os.wait4(process.pid, 0)
+    seconds = time.perf_counter() - started
+    process.returncode = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status)
+    return process.returncode, seconds, usage.ru_maxrss / 1024
+
+
+def read_metrics(metrics_file):
+    """
+    :param metrics_file: The JSON metrics snapshot a run wrote with --metrics-path
+    :return: The seconds of each stage and histogram, and the value of each counter
+    """
+    with open(metrics_file, 'r') as snapshot_file:
+        snapshot = json.load(snapshot_file)
+    timings, counters = {}, {}
+    for histogram in snapshot['histograms']:
+        if histogram['name'] == 'stage_seconds':
+            name = histogram['labels']['stage']
+        else:
+            name = ':'.join([histogram['name']] + [str(value) for value in histogram['labels'].values()])
+        timings[name] = round(histogram['sum'], 3)
+    for counter in snapshot['counters']:
+        counters[':'.join([counter['name']] + [str(value) for value in counter['labels'].values()])] = counter['value']
+    return timings, counters
+
+
+def run_case(case, arguments, env, items, temp_dir):
+    """
+    Runs a case and gathers its measurements
+    :return: The result of the case, None if it failed
+    """
+    metrics_file = os.path.join(temp_dir, case + '_metrics.json')
+    log_file = os.path.join(temp_dir, case + '.log')
+    returncode, seconds, peak = run_command(arguments + ['--metrics-path', metrics_file], env, log_file)
+    if returncode != 0 or not os.path.isfile(metrics_file):
+        with open(log_file, 'r') as log:
+            print(f"{case} failed with exit code {returncode}\n{log.read()[-LOG_TAIL:]}", file=sys.stderr)
+        return None
+    timings, counters = read_metrics(metrics_file)
+    return {'items': items, 'seconds': round(seconds, 3), 'items_per_second': round(items / seconds, 1),
+            'peak_mb': round(peak, 1), 'timings': timings, 'counters': counters}
+
+
+def evaluate_case(temp_dir, sentences, endpoint, vocabulary, args):
+    """
+    Evaluates two models on a generated source and reference pdf of the given number of sentences
+    """
+    document_dir = os.path.join(temp_dir, 'documents')
+    os.makedirs(document_dir)
+    for side, file in enumerate(('source.pdf', 'reference.pdf')):
+        write_pdf(os.path.join(document_dir, file),
+                  (pair[side] for pair in iter_sentence_pairs(sentences, args.seed, vocabulary)))
+    env = dict(os.environ, CATEGORIES=CATEGORIES, SUBSCRIPTION_KEY='key', REGION='westeurope',
+               TRANSLATOR_ENDPOINT=endpoint, ALIGNER='python', TRANSLATION_CACHE='', PDF_CACHE='', LEAKAGE_INDEX='')
+    arguments = ['evaluate', '--source-path', document_dir, '--source-doc', 'source.pdf', '--translated-path',
+                 document_dir, '--translated-doc', 'reference.pdf', '--output-path', document_dir,
+                 '--target-language', 'es']
+    if args.pdf_workers:
+        arguments += ['--pdf-workers', str(args.pdf_workers)]
+    return run_case('evaluate', arguments, env, sentences, temp_dir)
+
+
+def phrases_case(temp_dir, units, endpoint, vocabulary, args):
+    """
+    Builds a phrase dictionary from a generated translation memory of the given number of units
+    """
+    models = [args.nlp_id, args.nlp_target]
+    if not all(models):
+        # Blank models measure the pipeline around the parsing, installed models such as en_core_web_md give
+        # representative parse and textrank timings
+        import spacy
+
+        models = [os.path.join(temp_dir, language) for language in ('en', 'es')]
+        for path, language in zip(models, ('en', 'es')):
+            spacy.blank(language).to_disk(path)
+    memory = os.path.join(temp_dir, 'memory.tmx')
+    write_tmx(memory, iter_sentence_pairs(units, args.seed, vocabulary))
+    dictionary_dir = os.path.join(temp_dir, 'dictionary')
+    os.makedirs(dictionary_dir)
+    env = dict(os.environ, SUBSCRIPTION_KEY='key', REGION='westeurope', TRANSLATOR_ENDPOINT=endpoint,
+               TRANSLATION_CACHE='', NLP_SERVER='')
+    arguments = ['phrases', '--source-tmx', memory, '--dictionary-path', dictionary_dir, '--target-language', 'es',
+                 '--category-id', 'general', '--nlp-id', models[0], '--nlp-target', models[1], '--batch-start', '0',
+                 '--batch-end', '-1', '--workers', str(args.workers)]
+    return run_case('phrases', arguments, env, units, temp_dir)
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """
+    Compares the results of a run with a baseline run on the same corpus sizes
+    :param results: A dictionary of case to result
+    :param baseline: A dictionary of case to the result of the baseline run
+    :param tolerance: The fraction a measurement may be worse than its baseline
+    :return: A list of the regressions, empty if there are none
+    """
+    regressions = []
+    for case, result in results.items():
+        expected = baseline.get(case)
+        if expected is None:
+            continue
+        if expected['items'] != result['items']:
+            regressions.append(f"{case} was measured on {result['items']} items, the baseline on {expected['items']}")
+            continue
+        checks = [('seconds', result['seconds'], expected['seconds']),
+                  ('peak MB', result['peak_mb'], expected['peak_mb'])]
+        checks += [(name + ' seconds', result['timings'].get(name, 0.0), seconds)
+                   for name, seconds in expected['timings'].items() if seconds >= MIN_COMPARED_SECONDS]
+        for name, value, limit in checks:
+            if value > limit * (1 + tolerance):
+                regressions.append(f"{case} {name} {value:.2f} is more than {tolerance:.0%} above the baseline "
+                                   f"{limit:.2f}")
+    return regressions
+
+
+def main():
+    """
+    Runs the evaluation pipeline and the phrase builder end to end on generated corpora against a local stub of the
+    Translator, offline and repeatably. Reports the throughput, peak RSS and stage timings of each, and exits with an
+    error if a case fails or, given a baseline, is slower or uses more memory than it allows
+    """
+    parser = argparse.ArgumentParser(description='Benchmark the pipelines end to end against a stub Translator')
+    parser.add_argument('--cases', type=str, nargs='+', default=list(CASES), choices=CASES,
+                        help='The cases to run')
+    parser.add_argument('--sentences', type=int, default=2000, metavar='N',
+                        help='The number of sentences of the generated pdfs the evaluation case runs on')
+    parser.add_argument('--units', type=int, default=2000, metavar='N',
+                        help='The number of units of the generated memory the phrase case runs on')
+    parser.add_argument('--latency', type=float, default=0.05,
+                        help='Seconds each stub Translator request takes to answer')
+    parser.add_argument('--throttle-rate', type=float, default=0.02,
+                        help='The fraction of stub Translator requests answered with a 429')
+    parser.add_argument('--error-rate', type=float, default=0.01,
+                        help='The fraction of stub Translator requests answered with a 500')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='The random seed of the generated corpora and of the stub failures')
+    parser.add_argument('--pdf-workers', type=int, default=None, metavar='N',
+                        help='The number of processes the evaluation case extracts the pdfs with')
+    parser.add_argument('--workers', type=int, default=1, metavar='N',
+                        help='The number of worker processes of the phrase case')
+    parser.add_argument('--nlp-id', type=str, default=None,
+                        help='The source spaCy model of the phrase case, blank models are generated if omitted')
+    parser.add_argument('--nlp-target', type=str, default=None,
+                        help='The target spaCy model of the phrase case')
+    parser.add_argument('--baseline', type=str, default=None,
+                        help='The results of an earlier run to check this run against')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE,
+                        help='The fraction a measurement may be worse than its baseline')
+    parser.add_argument('--save', type=str, default=None,
+                        help='Write the results to this file, e.g. as the next baseline')
+    args = parser.parse_args()
+
+    vocabulary = sample_vocabulary()
+    results, failed = {}, []
+    with tempfile.TemporaryDirectory() as temp_dir, \
+            TranslatorStub(args.latency, throttle_rate=args.throttle_rate, error_rate=args.error_rate,
+                           seed=args.seed) as stub:
+        for case in args.cases:
+            case_dir = os.path.join(temp_dir, case)
+            os.makedirs(case_dir)
+            if case == 'evaluate':
+                result = evaluate_case(case_dir, args.sentences, stub.endpoint, vocabulary, args)
+            else:
+                result = phrases_case(case_dir, args.units, stub.endpoint, vocabulary, args)
+            if result is None:
+                failed.append(case)
+            else:
+                results[case] = result
+
+    print(f"{'case':<10} {'items':>8} {'seconds':>9} {'items/s':>9} {'peak MB':>9}  timings")
+    for case, result in results.items():
+        timings = ' '.join(f"{name}={seconds:.2f}" for name, seconds in sorted(result['timings'].items()))
+        print(f"{case:<10} {result['items']:>8} {result['seconds']:>9.2f} {result['items_per_second']:>9.1f} "
+              f"{result['peak_mb']:>9.1f}  {timings}")
+    print(f"Stub requests {stub.requests} throttled {stub.throttled} errors {stub.errors}")
+
+    if args.save:
+        with open(args.save, 'w') as results_file:
+            json.dump(results, results_file, indent=2, sort_keys=True)
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, 'r') as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)
+    if failed or regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
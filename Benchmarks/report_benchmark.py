@@ -0,0 +1,133 @@
+import argparse
+import multiprocessing
+import os
+import random
+import resource
+import tempfile
+import time
+
+import pandas as pd
+
+from ..Evaluation.translator_pipeline import write_reports
+
+WORDS = ['translation', 'model', 'document', 'sentence', 'reference', 'the', 'of', 'and', 'a', '<b>', '&', 'score',
+         'custom', 'evaluation', 'quality', 'language', 'text', 'human', 'machine', 'aligned']
+
+
+def synthetic_document(sentences, categories, seed=0):
+    """
+    :return: The source sentences, reference sentences, translations per model and sentence scores DataFrame
+    """
+    rng = random.Random(seed)
+
+    def sentence():
+        return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(5, 30)))
+
+    source = [sentence() for _ in range(sentences)]
+    reference = [sentence() for _ in range(sentences)]
+    translations = [[sentence() for _ in range(sentences)] for _ in categories]
+    scores = pd.DataFrame({f"{category_id}_{metric}": [rng.uniform(0, 100) for _ in range(sentences)]
+                           for category_id in categories for metric in ('bleu', 'chrf', 'ter')})
+    return source, reference, translations, scores
+
+
+def legacy_reports(categories, source, reference, translations, scores, output_path, source_doc, translated_doc):
+    """
+    The reports as translator_pipeline wrote them before the streaming writers, every column is collected in lists
+    for one DataFrame and the HTML report is reopened in append mode for every sentence
+    """
+    cat_dicts = [{} for _ in categories]
+    with open(os.path.join(output_path, 'MT_' + translated_doc[:-3] + '_all_models.txt'), 'w') as mt_file:
+        for i, etxt in enumerate(source):
+            for cat_ind, category_id in enumerate(categories):
+                mt_file.write(f"\n*** Category {category_id}\n ENG: {etxt}\n REF: {reference[i]}\n MT : "
+                              f"{translations[cat_ind][i]}")
+                cat_dicts[cat_ind][i] = [translations[cat_ind][i], scores[category_id + '_bleu'][i]]
+
+    cat_sentences = [[value[0] for value in cat_dict.values()] for cat_dict in cat_dicts]
+    for cat_id, category_id in enumerate(categories):
+        with open(os.path.join(output_path, 'MT_' + translated_doc[:-3] + '_' + category_id + '.txt'), 'w') as txt:
+            txt.write('\n'.join(cat_sentences[cat_id]))
+
+    data = {'Source': list(source), 'Target': list(reference)}
+    for cat_id, category_id in enumerate(categories):
+        data[category_id + '_score'] = [value[1] for value in cat_dicts[cat_id].values()]
+        data[category_id + '_chrf'] = scores[category_id + '_chrf'].tolist()
+        data[category_id + '_ter'] = scores[category_id + '_ter'].tolist()
+        data[category_id + '_sentence'] = cat_sentences[cat_id]
+    pd.DataFrame(data).to_csv(os.path.join(output_path, 'MT_' + translated_doc[:-3] + 'csv'), sep=',')
+
+    for cat_id, category_id in enumerate(categories):
+        for i, source_text in enumerate(source):
+            html_file = open(os.path.join(output_path, 'MT_' + translated_doc[:-3] + '_' + category_id + '.html'),
+                             'a')
+            if i == 0:
+                html_file.write('<!DOCTYPE html><html lang = "en" ><head><meta charset = "UTF-8"><title>' + 'MT_' +
+                                translated_doc[:-3] + '_' + category_id + '</title></head><div><table id ="' +
+                                source_doc + '"><tr><td><u>' + source_doc + '</u></td></tr>')
+            html_file.write('<tr><td>ENU: ' + source_text + '</td></tr><tr><td>REF: ' + reference[i] + '</td></tr>')
+            if i == len(source) - 1:
+                html_file.write('</table>')
+        html_file.write('<table id ="' + translated_doc + '"><tr><td><u>' + translated_doc + '</u></td></tr>')
+        for j, sentence in enumerate(cat_sentences[cat_id]):
+            html_file.write('<tr><td>MT: ' + sentence + '</td></tr><tr><td>REF: ' + reference[j] + '</td></tr>')
+        html_file.write('</table></div><body></body></html>')
+        html_file.close()
+
+
+def _run_writer(writer, sentences, models, formats, queue):
+    """
+    Writes the reports in a fresh process so its peak RSS is not shared with the other writer
+    """
+    categories = ['model-' + str(i) for i in range(models)]
+    source, reference, translations, scores = synthetic_document(sentences, categories)
+    # ru_maxrss is in kilobytes on Linux, the growth past the synthetic document is what writing the reports took
+    document_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        started = time.perf_counter()
+        if writer == 'legacy':
+            legacy_reports(categories, source, reference, translations, scores, temp_dir, 'source.pdf', 'target.pdf')
+        else:
+            write_reports(categories, source, reference, translations, scores, ['bleu', 'chrf', 'ter'], temp_dir,
+                          'source.pdf', 'target.pdf', formats)
+        seconds = time.perf_counter() - started
+        size = sum(os.path.getsize(os.path.join(temp_dir, file)) for file in os.listdir(temp_dir)) / 2 ** 20
+
+    queue.put((seconds, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 - document_rss, size))
+
+
+def benchmark(writer, sentences, models, formats):
+    """
+    :return: The wall time in seconds, the peak RSS growth in MB and the size in MB of the reports
+    """
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=_run_writer, args=(writer, sentences, models, formats, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def main():
+    """
+    Compares the wall time and peak RSS growth of the legacy report generation with the streaming report writers
+    """
+    parser = argparse.ArgumentParser(description='Benchmark the translation report writers')
+    parser.add_argument('--sentences', type=int, default=50000, metavar='N',
+                        help='The number of sentences in the synthetic document')
+    parser.add_argument('--models', type=int, default=5, metavar='N',
+                        help='The number of models the document is translated with')
+    parser.add_argument('--formats', type=str, nargs='+', default=['csv', 'html', 'txt'],
+                        help='The report formats the streaming writers produce')
+    args = parser.parse_args()
+
+    print(f"{'sentences':>10} {'models':>7} {'writer':<10} {'seconds':>9} {'peak MB':>9} {'output MB':>10}")
+    for writer in ('legacy', 'streaming'):
+        seconds, peak, size = benchmark(writer, args.sentences, args.models, args.formats)
+        print(f"{args.sentences:>10} {args.models:>7} {writer:<10} {seconds:>9.2f} {peak:>9.1f} {size:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+import argparse
+import glob
+import multiprocessing
+import resource
+import time
+
+from ..common.tmx_reader import iter_tmx_units, count_tmx_units
+
+
+def _run_loader(loader, file, start, end, queue):
+    """
+    Runs a loader in a fresh process so its peak RSS is not shared with the other loaders
+    """
+    started = time.perf_counter()
+    units = 0
+
+    if loader == 'translate-toolkit':
+        from translate.storage.tmx import tmxfile
+        with open(file, 'rb') as tmx:
+            tmx_file = tmxfile(tmx)
+        for i, unit in enumerate(tmx_file.getunits()):
+            if i < start:
+                continue
+            if end is not None and i >= end:
+                break
+            unit.getid()
+            unit.gettarget()
+            units += 1
+    elif loader == 'count':
+        units = count_tmx_units(file)
+    else:
+        for unit in iter_tmx_units(file, start=start, end=end):
+            units += 1
+
+    # ru_maxrss is in kilobytes on Linux
+    queue.put((units, time.perf_counter() - started, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024))
+
+
+def benchmark(loader, file, start=0, end=None):
+    """
+    :return: The number of units read, the wall time in seconds and the peak RSS in MB of the loader
+    """
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=_run_loader, args=(loader, file, start, end, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def main():
+    """
+    Compares the peak RSS and wall time of the translate-toolkit loader with the streaming tmx reader
+    """
+    parser = argparse.ArgumentParser(description='Benchmark the tmx loaders')
+    parser.add_argument('--tmx', type=str, default='Data/train/*.tmx',
+                        help='A glob of the tmx files to benchmark')
+    parser.add_argument('--batch-start', type=int, default=0, metavar='N',
+                        help='Start reading at this unit')
+    parser.add_argument('--batch-end', type=int, default=None, metavar='N',
+                        help='Stop reading before this unit')
+    args = parser.parse_args()
+
+    print(f"{'file':<45} {'loader':<18} {'units':>8} {'seconds':>9} {'peak MB':>9}")
+    for file in sorted(glob.glob(args.tmx)):
+        for loader in ('translate-toolkit', 'streaming', 'count'):
+            units, seconds, peak = benchmark(loader, file, args.batch_start, args.batch_end)
+            print(f"{file:<45} {loader:<18} {units:>8} {seconds:>9.3f} {peak:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
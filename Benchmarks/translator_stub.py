@@ -0,0 +1,136 @@
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+
+class TranslatorStub:
+    """
+    A local stand-in for the Translator v3 /translate endpoint, it "translates" by upper casing the text and counts
+    the requests it receives so the tests and benchmarks can measure round trips. Requests can be throttled or failed
+    at random, as the service does under load
+    """
+
+    def __init__(self, latency=0.0, throttle_first=0, retry_after='0', port=0, throttle_rate=0.0, error_rate=0.0,
+                 seed=0, truncate_first=0):
+        """
+        :param latency: Seconds each request takes to answer
+        :param throttle_first: The number of initial requests answered with a 429
+        :param retry_after: The Retry-After header sent with a 429
+        :param port: The local port to listen on, 0 for any free port
+        :param throttle_rate: The fraction of the other requests answered with a 429
+        :param error_rate: The fraction of the other requests answered with a 500
+        :param seed: The random seed of the throttled and failed requests
+        :param truncate_first: The number of initial answered requests whose 200 body is cut short
+        """
+        self.latency = latency
+        self.throttle_first = throttle_first
+        self.retry_after = retry_after
+        self.throttle_rate = throttle_rate
+        self.error_rate = error_rate
+        self.truncate_first = truncate_first
+        self.requests = 0
+        self.elements = 0
+        self.throttled = 0
+        self.errors = 0
+        self.truncated = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.categories = []
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+        self._server = ThreadingHTTPServer(('127.0.0.1', port), self._handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def endpoint(self):
+        return 'http://127.0.0.1:' + str(self._server.server_port) + '/translate'
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_POST(self):
+                query = parse_qs(urlparse(self.path).query)
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                with stub._lock:
+                    stub.requests += 1
+                    draw = stub._random.random()
+                    throttle = stub.requests <= stub.throttle_first or draw < stub.throttle_rate
+                    error = not throttle and draw < stub.throttle_rate + stub.error_rate
+                    stub.in_flight += 1
+                    stub.max_in_flight = max(stub.max_in_flight, stub.in_flight)
+                time.sleep(stub.latency)
+                truncate = False
+                with stub._lock:
+                    stub.in_flight -= 1
+                    if throttle:
+                        stub.throttled += 1
+                    elif error:
+                        stub.errors += 1
+                    elif stub.truncated < stub.truncate_first:
+                        stub.truncated += 1
+                        truncate = True
+                    else:
+                        stub.elements += len(body)
+                        stub.categories.append(query.get('category', [''])[0])
+
+                if throttle:
+                    self.send_response(429)
+                    self.send_header('Retry-After', stub.retry_after)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                if error:
+                    payload = json.dumps({'error': {'code': 500000, 'message': 'Stub error'}}).encode('utf-8')
+                    self.send_response(500)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(payload)))
+                    self.end_headers()
+                    self.wfile.write(payload)
+                    return
+
+                result = [{'translations': [{'text': element['Text'].upper(), 'to': query['to'][0]}]}
+                          for element in body]
+                payload = json.dumps(result).encode('utf-8')
+                if truncate:
+                    payload = payload[:len(payload) // 2]
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+if __name__ == '__main__':
+    # Serves the stub until interrupted, so the pipeline and the evaluation orchestrator can run without the service
+    parser = argparse.ArgumentParser(description='A local stand-in for the Translator v3 translate endpoint')
+    parser.add_argument('--port', type=int, default=8080, help='The local port to listen on')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds each request takes to answer')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='The fraction of requests answered with a 429')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='The fraction of requests answered with a 500')
+    args = parser.parse_args()
+    with TranslatorStub(args.latency, port=args.port, throttle_rate=args.throttle_rate,
+                        error_rate=args.error_rate) as stub:
+        print(f"Translator stub listening on {stub.endpoint}")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,312 @@
+import argparse
+import logging
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from ..common.common import set_log_level, load_alignment_manifest, RunJournal
+from ..common.reports import REPORT_FORMATS
+from ..common.scoring import score_translations, METRICS, DEFAULT_METRICS, BOOTSTRAP_SAMPLES
+from ..common.leakage import SIMILARITY_THRESHOLD
+from ..common.translator import TranslationClient
+from .translator_pipeline import Config, DEFAULT_REPORT_FORMATS, extract_documents, align_documents, \
+    translate_document, document_run, open_translation_cache, write_reports, training_leakage, score_unseen
+
+STAGES = ('extract', 'align', 'translate', 'score', 'report')
+PROCESS_STAGES = ('extract', 'align', 'score')  # CPU bound stages, the others wait on the network or the disk
+DEFAULT_PAIRING = r'(.+)\.pdf$'  # Pairs a source and reference pdf with the same file name
+
+
+def pair_documents(source_path, reference_path, pairing=DEFAULT_PAIRING):
+    """
+    Pairs the source and reference pdfs of two folders, the first group of the pairing pattern is the document name
+    and documents with the same name in both folders are paired, e.g. (.+)_(?:en|fr)\\.pdf$ pairs report_en.pdf with
+    report_fr.pdf
+    :param source_path: The folder of source documents
+    :param reference_path: The folder of human translated reference documents
+    :param pairing: The regular expression matched against each file name
+    :return: A list of (document name, source pdf, reference pdf) tuples sorted by name
+    """
+    pattern = re.compile(pairing)
+    folders = []
+    for path in (source_path, reference_path):
+        documents = {}
+        for file in sorted(os.listdir(path)):
+            match = pattern.fullmatch(file)
+            if match:
+                documents[match.group(1)] = os.path.join(path, file)
+        folders.append(documents)
+
+    sources, references = folders
+    for name in sorted(set(sources) ^ set(references)):
+        logging.warning(f"Document {name} is only in the {'source' if name in sources else 'reference'} folder")
+    return [(name, sources[name], references[name]) for name in sorted(set(sources) & set(references))]
+
+
+def manifest_documents(manifest):
+    """
+    Names the pairs of a manifest by the path of their source pdf relative to the folder holding every source, so
+    sources with the same file name in different folders get their own output folder
+    :param manifest: A tab separated file of source and reference pdfs
+    :return: A list of (document name, source pdf, reference pdf) tuples
+    """
+    pairs = load_alignment_manifest(manifest)
+    if not pairs:
+        return []
+    root = os.path.commonpath([os.path.dirname(source) for source, _ in pairs])
+    return [(os.path.splitext(os.path.relpath(source, root))[0], source, reference) for source, reference in pairs]
+
+
+def _extract_stage(document, settings):
+    os.makedirs(document['output_path'], exist_ok=True)
+    document['source_text'], document['reference_text'] = extract_documents(
+        document['source'], document['reference'], os.path.join(document['output_path'], 'source.txt'),
+        os.path.join(document['output_path'], 'reference.txt'), 1, settings['pdf_cache'])
+    return document
+
+
+def _align_stage(document, settings):
+    document['source_sentences'], document['reference_sentences'] = align_documents(
+        document['source_text'], document['reference_text'], settings['aligner_path'], settings['aligner'])
+    return document
+
+
+def _translate_stage(document, settings):
+    categories = settings['categories']
+    run = document_run(os.path.basename(document['source']), os.path.basename(document['reference']),
+                       settings['target_language'], categories, document['source_sentences'])
+    with RunJournal(os.path.join(document['output_path'], 'journal.jsonl'), run, settings['resume']) as journal, \
+            TranslationClient(settings['subscription_key'], settings['region'], settings['endpoint'],
+                              settings['max_concurrency'], cache=settings['cache']) as client:
+        document['translations'] = translate_document(client, journal, document['source_sentences'],
+                                                      settings['target_language'], categories,
+                                                      settings['batch_size'])
+    logging.info(f"Translation stats {document['name']} {client.stats.snapshot()}")
+    return document
+
+
+def _score_stage(document, settings):
+    document['sentence_scores'], document['corpus_scores'] = score_translations(
+        document['reference_sentences'][:len(document['source_sentences'])],
+        dict(zip(settings['categories'], document['translations'])), settings['metrics'],
+        samples=settings['bootstrap_samples'])
+    document['training_similarity'] = document['unseen_scores'] = None
+    if settings['leakage_index']:
+        document['training_similarity'] = training_leakage(document['source_sentences'], settings['leakage_index'])
+        document['unseen_scores'] = score_unseen(
+            document['reference_sentences'], settings['categories'], document['translations'],
+            document['training_similarity'] >= settings['leakage_threshold'], settings['metrics'])
+    return document
+
+
+def _report_stage(document, settings):
+    reference_doc = os.path.basename(document['reference'])
+    document['corpus_scores'].to_csv(os.path.join(document['output_path'], 'MT_' + reference_doc[:-4] + '_scores.csv'),
+                                     sep=',')
+    if document['unseen_scores'] is not None:
+        document['unseen_scores'].to_csv(
+            os.path.join(document['output_path'], 'MT_' + reference_doc[:-4] + '_unseen_scores.csv'), sep=',')
+    write_reports(settings['categories'], document['source_sentences'], document['reference_sentences'],
+                  document['translations'], document['sentence_scores'], settings['metrics'],
+                  document['output_path'], os.path.basename(document['source']), reference_doc,
+                  settings['report_formats'], document['training_similarity'], settings['leakage_threshold'])
+    return document
+
+
+STAGE_FUNCTIONS = {'extract': _extract_stage, 'align': _align_stage, 'translate': _translate_stage,
+                   'score': _score_stage, 'report': _report_stage}
+
+
+def run_documents(documents, settings, limits):
+    """
+    Runs every document through extract, align, translate, score and report. A document moves to its next stage as
+    soon as the previous one finishes, so documents overlap in different stages, and each stage has its own pool so
+    CPU bound and network bound work are limited separately
+    :param documents: A list of document dictionaries with name, source, reference and output_path
+    :param settings: The settings of the stages
+    :param limits: A dictionary of stage to the number of documents it handles at once
+    :return: The completed documents and a dictionary of document name to the error of each failed document
+    """
+    # Process pools are spawned so a worker never forks a copy of the translation threads' locks
+    context = multiprocessing.get_context('spawn')
+    pool_settings = {key: value for key, value in settings.items() if key != 'cache'}
+    executors = {stage: ProcessPoolExecutor(limits[stage], mp_context=context) if stage in PROCESS_STAGES
+                 else ThreadPoolExecutor(limits[stage], thread_name_prefix=stage) for stage in STAGES}
+
+    def submit(document, stage_index):
+        stage = STAGES[stage_index]
+        logging.info(f"Document {document['name']} {stage}")
+        # The translation cache connection stays in this process, the process stages do not use it
+        stage_settings = pool_settings if stage in PROCESS_STAGES else settings
+        pending[executors[stage].submit(STAGE_FUNCTIONS[stage], document, stage_settings)] = (document, stage_index)
+
+    completed, failed = [], {}
+    pending = {}
+    try:
+        for document in documents:
+            submit(document, 0)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                document, stage_index = pending.pop(future)
+                try:
+                    document = future.result()
+                except Exception as e:
+                    logging.error(f"Document {document['name']} failed in {STAGES[stage_index]} {e!r}")
+                    failed[document['name']] = f"{STAGES[stage_index]}: {e!r}"
+                    continue
+                if stage_index + 1 < len(STAGES):
+                    submit(document, stage_index + 1)
+                else:
+                    completed.append(document)
+    finally:
+        # Stages still queued after a failure are cancelled, shutdown(cancel_futures=True) needs Python 3.9
+        for future in pending:
+            future.cancel()
+        for executor in executors.values():
+            executor.shutdown(wait=True)
+
+    return sorted(completed, key=lambda document: document['name']), failed
+
+
+def build_leaderboard(documents, categories, metrics, samples=BOOTSTRAP_SAMPLES):
+    """
+    Merges the results of every document into one model leaderboard. The corpus scores are computed over the
+    sentences of all documents together, as one test set, with paired bootstrap resampling against the first model,
+    and each model is credited with the documents it scored best on
+    :param documents: The completed documents
+    :param categories: The category Ids of the models
+    :param metrics: The metrics
+    :param samples: The number of bootstrap resamples
+    :return: The leaderboard, indexed by model and sorted on the first metric, and the scores of each document
+    """
+    # The stage workers import this module, pandas is only needed here and by the scoring stage
+    import pandas as pd
+
+    references = [sentence for document in documents
+                  for sentence in document['reference_sentences'][:len(document['source_sentences'])]]
+    hypotheses = {category_id: [sentence for document in documents for sentence in document['translations'][i]]
+                  for i, category_id in enumerate(categories)}
+    _, leaderboard = score_translations(references, hypotheses, metrics, samples=samples)
+
+    document_scores = pd.concat({document['name']: document['corpus_scores'] for document in documents},
+                                names=['document'])
+    metric = metrics[0]
+    lower_is_better = metric == 'ter'
+    per_document = document_scores[metric].unstack('model').reindex(columns=categories)
+    best = per_document.idxmin(axis=1) if lower_is_better else per_document.idxmax(axis=1)
+
+    leaderboard['documents'] = len(documents)
+    leaderboard[f'{metric}_document_mean'] = per_document.mean(axis=0)
+    leaderboard['wins'] = best.value_counts().reindex(categories, fill_value=0)
+    leaderboard = leaderboard.sort_values(metric, ascending=lower_is_better)
+    leaderboard.insert(0, 'rank', range(1, len(leaderboard) + 1))
+    return leaderboard, document_scores
+
+
+def main():
+    """
+    Evaluates every pair of source and reference documents in two folders against all models, scheduling the
+    extract, align, translate, score and report stages of the documents over separate local pools, and merges the
+    results into one cross document model leaderboard
+    """
+    parser = argparse.ArgumentParser(description='Evaluate machine translation models over folders of documents')
+    parser.add_argument('--source-path', type=str,
+                        help='The folder of source documents')
+    parser.add_argument('--reference-path', type=str,
+                        help='The folder of human translated reference documents')
+    parser.add_argument('--pairing', type=str, default=DEFAULT_PAIRING,
+                        help='A regular expression on the file names whose first group names the document, source '
+                             'and reference documents with the same name are paired')
+    parser.add_argument('--manifest', type=str, default=None,
+                        help='A tab separated file of source and reference pdfs, used instead of the folders')
+    parser.add_argument('--output-path', type=str, default='',
+                        help='The output path, each document gets a folder of reports and the leaderboard is written '
+                             'here')
+    parser.add_argument('--target-language', type=str, default='',
+                        help='es or fr')
+    parser.add_argument('--translator-endpoint', type=str, default=Config.TRANSLATOR_ENDPOINT,
+                        help='The Translator endpoint, e.g. a local stub service')
+    parser.add_argument('--extract-workers', type=int, default=2, metavar='N',
+                        help='The number of documents extracted from pdf at once, in processes')
+    parser.add_argument('--align-workers', type=int, default=os.cpu_count() or 1, metavar='N',
+                        help='The number of documents aligned at once, in processes')
+    parser.add_argument('--translate-workers', type=int, default=4, metavar='N',
+                        help='The number of documents translated at once, each with --max-concurrency requests')
+    parser.add_argument('--score-workers', type=int, default=2, metavar='N',
+                        help='The number of documents scored at once, in processes')
+    parser.add_argument('--report-workers', type=int, default=2, metavar='N',
+                        help='The number of documents whose reports are written at once')
+    parser.add_argument('--batch-size', type=int, default=Config.BATCH_SIZE, metavar='N',
+                        help='The number of sentences sent per translation request, up to 100')
+    parser.add_argument('--max-concurrency', type=int, default=Config.MAX_CONCURRENCY, metavar='N',
+                        help='The number of translation requests in flight at once for each document')
+    parser.add_argument('--cache-path', type=str, default=Config.TRANSLATION_CACHE,
+                        help='The SQLite translation cache file shared by every document')
+    parser.add_argument('--cache-read-only', action='store_true', default=Config.CACHE_READ_ONLY,
+                        help='Read from the translation cache without writing to it')
+    parser.add_argument('--pdf-cache', type=str, default=Config.PDF_CACHE,
+                        help='The directory caching the text of each pdf by its contents')
+    parser.add_argument('--aligner', type=str, default=Config.ALIGNER, choices=['perl', 'python'],
+                        help='Align with the perl scripts in ALIGNER_PATH or the in process python port')
+    parser.add_argument('--metrics', type=str, nargs='+', default=list(DEFAULT_METRICS), choices=METRICS,
+                        help='The metrics the translations are scored with, the leaderboard is ranked on the first')
+    parser.add_argument('--bootstrap-samples', type=int, default=BOOTSTRAP_SAMPLES, metavar='N',
+                        help='The number of paired bootstrap resamples against the first model, 0 to skip')
+    parser.add_argument('--report-formats', type=str, nargs='+', default=list(DEFAULT_REPORT_FORMATS),
+                        choices=REPORT_FORMATS, help='The reports written for each document')
+    parser.add_argument('--resume', action='store_true',
+                        help='Resume each document from its journal, only the missing translations are sent')
+    parser.add_argument('--leakage-index', type=str, default=Config.LEAKAGE_INDEX,
+                        help='A near duplicate index of the training memories, flags the source sentences seen in '
+                             'training and scores the unseen sentences separately')
+    parser.add_argument('--leakage-threshold', type=float, default=SIMILARITY_THRESHOLD,
+                        help='The estimated Jaccard similarity from which a sentence counts as seen in training')
+
+    args = parser.parse_args()
+    set_log_level(Config.DEBUG)
+
+    if args.manifest:
+        pairs = manifest_documents(args.manifest)
+    else:
+        pairs = pair_documents(args.source_path, args.reference_path, args.pairing)
+    if not pairs:
+        parser.error('No source and reference documents were paired')
+
+    categories = [category_id.strip() for category_id in Config.CATEGORIES.strip().split(',')]
+    cache = open_translation_cache(args.cache_path, args.cache_read_only)
+    settings = {'categories': categories, 'target_language': args.target_language,
+                'subscription_key': Config.SUBSCRIPTION_KEY, 'region': Config.REGION,
+                'endpoint': args.translator_endpoint, 'max_concurrency': args.max_concurrency,
+                'batch_size': args.batch_size, 'cache': cache, 'pdf_cache': args.pdf_cache,
+                'aligner_path': Config.ALIGNER_PATH, 'aligner': args.aligner, 'metrics': args.metrics,
+                'bootstrap_samples': args.bootstrap_samples, 'report_formats': args.report_formats,
+                'resume': args.resume, 'leakage_index': args.leakage_index,
+                'leakage_threshold': args.leakage_threshold}
+    limits = {'extract': args.extract_workers, 'align': args.align_workers, 'translate': args.translate_workers,
+              'score': args.score_workers, 'report': args.report_workers}
+    documents = [{'name': name, 'source': source, 'reference': reference,
+                  'output_path': os.path.join(args.output_path, name)} for name, source, reference in pairs]
+
+    try:
+        completed, failed = run_documents(documents, settings, limits)
+    finally:
+        if cache:
+            cache.close()
+
+    for name, error in failed.items():
+        logging.error(f"Document {name} was not evaluated, {error}")
+    if not completed:
+        raise SystemExit('No document was evaluated')
+
+    leaderboard, document_scores = build_leaderboard(completed, categories, args.metrics, args.bootstrap_samples)
+    leaderboard.to_csv(os.path.join(args.output_path, 'leaderboard.csv'), sep=',')
+    document_scores.to_csv(os.path.join(args.output_path, 'document_scores.csv'), sep=',')
+    print(leaderboard.round(2).to_string())
+    if failed:
+        raise SystemExit(f"{len(failed)} of {len(documents)} documents failed: {', '.join(failed)}")
+
+
+if __name__ == '__main__':
+    main()
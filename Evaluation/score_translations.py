@@ -0,0 +1,65 @@
+import argparse
+import logging
+import os
+
+from dotenv import load_dotenv
+from ..common.common import set_log_level, read_lines
+from ..common.scoring import score_translations, METRICS, DEFAULT_METRICS, BOOTSTRAP_SAMPLES, BOOTSTRAP_SEED
+
+load_dotenv()
+
+
+class Config:
+    """
+    Read from .env file - These are params that are static across parallel jobs
+    """
+    DEBUG = bool(os.environ.get("DEBUG"))  # Activate debugging
+
+
+def main():
+    """
+    Scores the translations of one or more models against a reference document, both with one sentence per line, and
+    writes the sentence and corpus scores. As the translations are read from files rather than the Translator API this
+    reruns the scoring of a pipeline run offline, e.g. from the MT_<document>_<category>.txt files it writes
+    """
+    parser = argparse.ArgumentParser(description='Score machine translations against a reference translation')
+    parser.add_argument('--reference', type=str,
+                        help='The reference translation, one sentence per line')
+    parser.add_argument('--hypotheses', type=str, nargs='+',
+                        help='The machine translation of each model, one sentence per line')
+    parser.add_argument('--categories', type=str, nargs='+', default=None,
+                        help='The name of each model, defaults to the hypothesis file names')
+    parser.add_argument('--output-path', type=str, default='',
+                        help='The output path for the sentence_scores.csv and corpus_scores.csv files')
+    parser.add_argument('--metrics', type=str, nargs='+', default=list(DEFAULT_METRICS), choices=METRICS,
+                        help='The metrics to compute')
+    parser.add_argument('--baseline', type=str, default=None,
+                        help='The model the others are tested against for significance, defaults to the first')
+    parser.add_argument('--bootstrap-samples', type=int, default=BOOTSTRAP_SAMPLES, metavar='N',
+                        help='The number of paired bootstrap resamples, 0 to skip the significance test')
+    parser.add_argument('--seed', type=int, default=BOOTSTRAP_SEED, metavar='N',
+                        help='The paired bootstrap random seed')
+    parser.add_argument('--workers', type=int, default=1, metavar='N',
+                        help='The number of processes TER is computed in')
+
+    args = parser.parse_args()
+    set_log_level(Config.DEBUG)
+
+    categories = args.categories or [os.path.splitext(os.path.basename(file))[0] for file in args.hypotheses]
+    if len(categories) != len(args.hypotheses):
+        parser.error('--categories needs one name per hypothesis file')
+
+    references = read_lines(args.reference)
+    hypotheses = {category_id: read_lines(file) for category_id, file in zip(categories, args.hypotheses)}
+    sentence_scores, corpus_scores = score_translations(references, hypotheses, args.metrics, args.baseline,
+                                                        args.bootstrap_samples, args.seed, args.workers)
+
+    sentence_scores.insert(0, 'Target', references)
+    sentence_scores.to_csv(os.path.join(args.output_path, 'sentence_scores.csv'), sep=',')
+    corpus_scores.to_csv(os.path.join(args.output_path, 'corpus_scores.csv'), sep=',')
+    logging.debug(f"Scored {len(references)} sentences of {len(categories)} models")
+    print(corpus_scores.round(2).to_string())
+
+
+if __name__ == '__main__':
+    main()
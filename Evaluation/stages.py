@@ -0,0 +1,123 @@
+import argparse
+import logging
+import os
+
+from ..common.common import set_log_level, read_lines, RunJournal
+from ..common.reports import TextReport
+from .translator_pipeline import Config, extract_documents, align_documents, translate_document, document_run, \
+    open_translation_cache
+
+
+def _text_file(pdf_file):
+    return os.path.splitext(pdf_file)[0] + '.txt'
+
+
+def extract_main():
+    """
+    Converts a source and a reference pdf to text documents, the first stage of the translator pipeline run on its own
+    """
+    parser = argparse.ArgumentParser(description='Extract the text of a source and a reference pdf')
+    parser.add_argument('--source-pdf', type=str, required=True,
+                        help='The source pdf')
+    parser.add_argument('--reference-pdf', type=str, required=True,
+                        help='The human translated reference pdf')
+    parser.add_argument('--source-text', type=str, default=None,
+                        help='The source text document, defaults to the source pdf with a .txt extension')
+    parser.add_argument('--reference-text', type=str, default=None,
+                        help='The reference text document, defaults to the reference pdf with a .txt extension')
+    parser.add_argument('--pdf-cache', type=str, default=Config.PDF_CACHE,
+                        help='The directory caching the text of each pdf by its contents, no caching if omitted')
+    parser.add_argument('--pdf-workers', type=int, default=Config.PDF_WORKERS, metavar='N',
+                        help='The number of processes the pages of both pdfs are extracted in')
+
+    args = parser.parse_args()
+    set_log_level(Config.DEBUG)
+
+    source_text, reference_text = extract_documents(args.source_pdf, args.reference_pdf,
+                                                    args.source_text or _text_file(args.source_pdf),
+                                                    args.reference_text or _text_file(args.reference_pdf),
+                                                    args.pdf_workers, args.pdf_cache)
+    print(f"Extracted {source_text} and {reference_text}")
+
+
+def align_main():
+    """
+    Sentence aligns a source and a reference text document, writing <document>.aligned next to each
+    """
+    parser = argparse.ArgumentParser(description='Sentence align a source and a reference text document')
+    parser.add_argument('--source-text', type=str, required=True,
+                        help='The source text document')
+    parser.add_argument('--reference-text', type=str, required=True,
+                        help='The reference text document')
+    parser.add_argument('--aligner', type=str, default=Config.ALIGNER, choices=['perl', 'python'],
+                        help='Align with the perl scripts in ALIGNER_PATH or the in process python port')
+    parser.add_argument('--aligner-path', type=str, default=Config.ALIGNER_PATH,
+                        help='The location of the Bilingual Sentence Aligner scripts for the perl aligner')
+
+    args = parser.parse_args()
+    set_log_level(Config.DEBUG)
+
+    source_sentences, _ = align_documents(args.source_text, args.reference_text, args.aligner_path, args.aligner)
+    print(f"Aligned {len(source_sentences)} sentences into {args.source_text}.aligned and "
+          f"{args.reference_text}.aligned")
+
+
+def translate_main():
+    """
+    Translates an aligned source document against every model in CATEGORIES, writing MT_<document>_<category>.txt
+    with one translated sentence per line, which the score command takes as its hypotheses
+    """
+    parser = argparse.ArgumentParser(description='Translate an aligned document against every model')
+    parser.add_argument('--source-aligned', type=str, required=True,
+                        help='The aligned source document, one sentence per line')
+    parser.add_argument('--target-language', type=str, required=True,
+                        help='es or fr')
+    parser.add_argument('--output-path', type=str, default='',
+                        help='The output path for the translations and the run journal')
+    parser.add_argument('--categories', type=str, default=Config.CATEGORIES,
+                        help='The comma separated category Ids of the models, defaults to CATEGORIES')
+    parser.add_argument('--translator-endpoint', type=str, default=Config.TRANSLATOR_ENDPOINT,
+                        help='The Translator translate endpoint, override to point at a local stub service')
+    parser.add_argument('--batch-size', type=int, default=Config.BATCH_SIZE, metavar='N',
+                        help='The number of sentences sent per translation request, up to 100')
+    parser.add_argument('--max-concurrency', type=int, default=Config.MAX_CONCURRENCY, metavar='N',
+                        help='The number of translation requests in flight at once across all models')
+    parser.add_argument('--cache-path', type=str, default=Config.TRANSLATION_CACHE,
+                        help='The SQLite translation cache file, translations are not cached if omitted')
+    parser.add_argument('--cache-read-only', action='store_true', default=Config.CACHE_READ_ONLY,
+                        help='Read from the translation cache without writing to it')
+    parser.add_argument('--journal-path', type=str, default=None,
+                        help='The run journal file, defaults to MT_<document>_journal.jsonl in the output path')
+    parser.add_argument('--resume', action='store_true',
+                        help='Resume the run in the journal, only the sentences it has not translated are sent')
+
+    args = parser.parse_args()
+    set_log_level(Config.DEBUG)
+    if not args.categories:
+        parser.error('--categories or CATEGORIES is required')
+
+    # requests is imported once the arguments are parsed, so --help and argument errors return straight away
+    from ..common.translator import TranslationClient
+
+    categories = [category_id.strip() for category_id in args.categories.strip().split(',')]
+    source_sentences = read_lines(args.source_aligned)
+    document = os.path.basename(args.source_aligned).split('.')[0]
+    report = os.path.join(args.output_path, 'MT_' + document)
+
+    cache = open_translation_cache(args.cache_path, args.cache_read_only)
+
+    run = document_run(os.path.basename(args.source_aligned), '', args.target_language, categories, source_sentences)
+    with RunJournal(args.journal_path or report + '_journal.jsonl', run, args.resume) as journal, \
+            TranslationClient(Config.SUBSCRIPTION_KEY, Config.REGION, args.translator_endpoint, args.max_concurrency,
+                              cache=cache) as client:
+        cat_translations = translate_document(client, journal, source_sentences, args.target_language, categories,
+                                              args.batch_size)
+    logging.info(f"Translation stats {client.stats.snapshot()}")
+    if cache:
+        cache.close()
+
+    for category_id, translations in zip(categories, cat_translations):
+        with TextReport(report + '_' + category_id + '.txt') as text_file:
+            for translated_text in translations:
+                text_file.write_row(translated_text)
+    print(f"Translated {len(source_sentences)} sentences against {len(categories)} models into {report}_*.txt")
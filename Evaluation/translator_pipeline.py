@@ -1,20 +1,20 @@
 import argparse
-import io
+import hashlib
 import os
 import os.path
+from contextlib import ExitStack
 
-import pandas as pd
-import sacrebleu
 from dotenv import load_dotenv
-from pdfminer.converter import TextConverter
-from pdfminer.layout import LAParams
-from pdfminer.pdfinterp import PDFResourceManager, PDFPageInterpreter
-from pdfminer.pdfpage import PDFPage
-from ..common.common import call_translation, set_log_level, load_tmx_file, call_sentence_alignment
+from ..common.common import set_log_level, call_sentence_alignment, MAX_ELEMENTS_PER_REQUEST, TRANSLATOR_ENDPOINT, \
+    TranslationCache, RunJournal, read_lines
+from ..common.metrics import Metrics, profile
+from ..common.reports import HTMLReport, TextReport, open_table_reports, REPORT_FORMATS
 import logging
 
 load_dotenv()
 
+DEFAULT_REPORT_FORMATS = ('csv', 'html', 'txt')  # The reports written unless --report-formats says otherwise
+
 
 class Config:
     """
@@ -24,98 +24,296 @@ class Config:
     CATEGORIES = os.environ.get("CATEGORIES")  # The categories/model ids we are evaluating
     REGION = os.environ.get("REGION")  # The region our model is deployed in
     ALIGNER_PATH = os.environ.get("ALIGNER_PATH")  # The location of the alignment script
+    ALIGNER = os.environ.get("ALIGNER", 'perl')  # perl for the alignment script or python for the NumPy port
     # https://www.microsoft.com/en-us/download/details.aspx?id=52608&from=https%3A%2F%2Fresearch.microsoft.com%2Fen-us%2Fdownloads%2Faafd5dcf-4dcc-49b2-8a22-f7055113e656%2F
     DEBUG = bool(os.environ.get("DEBUG"))  # Activate debugging
+    BATCH_SIZE = int(os.environ.get("BATCH_SIZE", MAX_ELEMENTS_PER_REQUEST))  # Sentences per translation request
+    TRANSLATOR_ENDPOINT = os.environ.get("TRANSLATOR_ENDPOINT", TRANSLATOR_ENDPOINT)  # Override for a local stub
+    MAX_CONCURRENCY = int(os.environ.get("MAX_CONCURRENCY", 8))  # Translation requests in flight at once
+    TRANSLATION_CACHE = os.environ.get("TRANSLATION_CACHE")  # Optional SQLite translation cache file
+    CACHE_READ_ONLY = bool(os.environ.get("CACHE_READ_ONLY"))  # Never write to the translation cache e.g. in CI
+    CACHE_MAX_ENTRIES = os.environ.get("CACHE_MAX_ENTRIES")  # Evict the oldest cache entries above this many
+    CACHE_MAX_AGE_DAYS = os.environ.get("CACHE_MAX_AGE_DAYS")  # Evict cache entries older than this many days
+    PDF_CACHE = os.environ.get("PDF_CACHE")  # Optional directory caching the text extracted from each pdf
+    PDF_WORKERS = int(os.environ.get("PDF_WORKERS", 0)) or None  # Processes extracting pdf pages, defaults to CPUs
+    LEAKAGE_INDEX = os.environ.get("LEAKAGE_INDEX")  # Optional near duplicate index of the training memories
+    METRICS_PATH = os.environ.get("METRICS_PATH")  # Optional metrics snapshot file, .prom for the Prometheus format
+    PROFILE = os.environ.get("PROFILE")  # Optional profile file, .html for pyinstrument and cProfile otherwise
+
+
+def extract_documents(source_file, translated_file, source_text_file, translated_text_file, workers=None,
+                      cache_path=None):
+    """
+    Converts the source and reference pdfs to text documents, the pages of both are extracted in one pool or read from
+    the cache if they were extracted before
+    :param source_file: The source pdf
+    :param translated_file: The human translated reference pdf
+    :param source_text_file: The text document written for the source
+    :param translated_text_file: The text document written for the reference
+    :param workers: The number of processes extracting pages
+    :param cache_path: An optional directory caching the text of each pdf by its contents
+    :return: The source and reference text documents
+    """
+    # Each stage imports its heavy dependencies when it runs, so a run of one stage does not pay for the others
+    from ..common.pdf_text import extract_pdf_texts
+
+    fr_text, en_text = extract_pdf_texts([translated_file, source_file], workers, cache_path)
+
+    with open(translated_text_file, 'w') as fr:
+        fr.write(fr_text)
+
+    with open(source_text_file, 'w') as en:
+        en.write(en_text)
+
+    return source_text_file, translated_text_file
+
+
+def align_documents(source_text_file, translated_text_file, aligner_path, engine):
+    """
+    Sentence aligns the source and reference text documents
+    :param source_text_file: The source text document
+    :param translated_text_file: The reference text document
+    :param aligner_path: The location of the Bilingual Sentence Aligner scripts
+    :param engine: perl for the aligner scripts or python for the NumPy port
+    :return: The aligned source and reference sentences
+    """
+    alignment_results = call_sentence_alignment(source_text_file, translated_text_file, aligner_path, engine)
+    logging.info(f"Sentence Alignment {alignment_results}")
+
+    # Read as the translate command reads them, so a final newline is not sent and scored as an empty sentence
+    return read_lines(source_text_file + '.aligned'), read_lines(translated_text_file + '.aligned')
 
 
-def pdf_parser(data):
+def translate_document(client, journal, lst_en_aligned, target_language, categories, batch_size):
     """
+    Translates the aligned source sentences against every model, journaling each batch as it completes and only
+    sending the sentences the journal does not already have
+    :param client: The TranslationClient
+    :param journal: The RunJournal of the document
+    :param lst_en_aligned: The aligned source sentences
+    :param target_language: The target language code
+    :param categories: The category Ids of the models
+    :param batch_size: The number of sentences per request
+    :return: A list per category of the translated text per sentence, built from the journal
+    """
+    client.translate_categories(lst_en_aligned, target_language, categories, batch_size,
+                                [journal.completed(category_id) for category_id in categories],
+                                lambda cat_ind, batch: journal.record(categories[cat_ind], batch))
+    # The reports are built from the journal, which holds this run's translations and any resumed ones
+    missing = len(categories) * len(lst_en_aligned) - len(journal.translations)
+    if missing:
+        logging.warning(f"{missing} translations failed, rerun with --resume to retry only those")
+    return journal.category_translations(categories, len(lst_en_aligned))
+
 
-    :param data: The file stream
-    :return: The converted text
+def document_run(source_doc, translated_doc, target_language, categories, lst_en_aligned):
+    """
+    :return: The run journal header identifying an evaluation of a document
     """
-    fp = open(data, 'rb')
-    rsrc_mgr = PDFResourceManager()
-    ret_str = io.StringIO()
-    la_params = LAParams()
-    device = TextConverter(rsrc_mgr, ret_str, laparams=la_params)
-    # Create a PDF interpreter object.
-    interpreter = PDFPageInterpreter(rsrc_mgr, device)
-    # Process each page contained in the document.
+    return {'source_doc': source_doc, 'translated_doc': translated_doc, 'target_language': target_language,
+            'categories': list(categories),
+            'source_hash': hashlib.sha256('\n'.join(lst_en_aligned).encode('utf-8')).hexdigest()}
 
-    for page in PDFPage.get_pages(fp):
-        interpreter.process_page(page)
-        data = ret_str.getvalue()
 
-    return data
+def open_translation_cache(cache_path, read_only=False):
+    """
+    Opens the translation cache with the CACHE_MAX_ENTRIES and CACHE_MAX_AGE_DAYS eviction settings
+    :param cache_path: The SQLite translation cache file
+    :param read_only: Read from the cache without writing to it
+    :return: The TranslationCache, None without a cache path
+    """
+    if not cache_path:
+        return None
+    return TranslationCache(cache_path,
+                            int(Config.CACHE_MAX_ENTRIES) if Config.CACHE_MAX_ENTRIES else None,
+                            float(Config.CACHE_MAX_AGE_DAYS) * 86400 if Config.CACHE_MAX_AGE_DAYS else None,
+                            read_only)
 
 
-def build_HTML_aligned_report(categories, cat_sentences, lst_source_text, lst_target_txt, output_path, source_doc,
-                              translated_doc):
+def training_leakage(lst_source_text, leakage_index):
     """
-    This function generates a simple HTML page that is sentence aligned, per model, containing the HYP, REF and MT text
+    :param lst_source_text: The source sentences
+    :param leakage_index: The directory of a LeakageIndex of the training memories
+    :return: The estimated Jaccard similarity of each source sentence to its closest training segment
+    """
+    from ..common.leakage import LeakageIndex
+
+    with LeakageIndex(leakage_index) as index:
+        return index.query(lst_source_text)[0]
+
+
+def score_unseen(references, categories, cat_translations, seen, metrics):
+    """
+    Scores the models on the sentences that were not seen in training, as leaked sentences inflate the scores
+    :param references: The reference sentences
     :param categories: The models we are evaluating
-    :param cat_sentences: The translated sentences per model
-    :param lst_source_text: The HYP text
-    :param lst_target_txt: The REF text
-    :param output_path: The path we want to write to
-    :param source_doc: The source document HYP we are translating
-    :param translated_doc: The human translated REF doc
-    :return:
+    :param cat_translations: The translated sentences per model
+    :param seen: A boolean per sentence, True if it was seen in training
+    :param metrics: The metrics the sentences are scored with
+    :return: The corpus scores DataFrame of the unseen sentences, None if every sentence was seen
     """
+    from ..common.scoring import score_translations
+
+    unseen = [i for i, sentence_seen in enumerate(seen) if not sentence_seen]
+    if not unseen:
+        return None
+    _, corpus_scores = score_translations(
+        [references[i] for i in unseen],
+        {category_id: [cat_translations[cat_ind][i] for i in unseen] for cat_ind, category_id in enumerate(categories)},
+        metrics, samples=0)
+    return corpus_scores
+
 
+def write_reports(categories, lst_source_text, lst_target_txt, cat_translations, sentence_scores, metrics,
+                  output_path, source_doc, translated_doc, formats=DEFAULT_REPORT_FORMATS, training_similarity=None,
+                  leakage_threshold=None):
+    """
+    Streams the sentence aligned reports a row at a time, each report has one buffered writer so memory use does not
+    grow with the document:
+    * MT_<doc>.csv (and .jsonl, .parquet) with the source, reference and per model scores and translations
+    * MT_<doc>_<category>.html per model with the source, reference and machine translated text, HTML escaped
+    * MT_<doc>_<category>.txt per model with one translated sentence per line, and MT_<doc>_all_models.txt
+    :param categories: The models we are evaluating
+    :param lst_source_text: The source sentences
+    :param lst_target_txt: The reference sentences
+    :param cat_translations: The translated sentences per model
+    :param sentence_scores: The sentence scores DataFrame with a <category>_<metric> column per model and metric
+    :param metrics: The metrics the sentences were scored with
+    :param output_path: The path we want to write to
+    :param source_doc: The source document we are translating
+    :param translated_doc: The human translated reference document
+    :param formats: Any of csv, html, txt, jsonl and parquet
+    :param training_similarity: The similarity of each source sentence to the training memories, adds the
+    training_similarity and seen_in_training columns to the tables
+    :param leakage_threshold: The similarity from which a sentence counts as seen in training, defaults to the
+    leakage index SIMILARITY_THRESHOLD
+    :return: None
+    """
+    if training_similarity is not None and leakage_threshold is None:
+        from ..common.leakage import SIMILARITY_THRESHOLD
+        leakage_threshold = SIMILARITY_THRESHOLD
+    report = os.path.join(output_path, 'MT_' + translated_doc[:-3])
+    # The first score column keeps the <category>_score name of the BLEU score, the other metrics are named after them
+    score_metrics = [(metric, '_score' if metric == 'bleu' else '_' + metric) for metric in metrics]
+    columns = ['Source', 'Target']
+    scores = []
     for cat_id, category_id in enumerate(categories):
+        columns += [category_id + suffix for _, suffix in score_metrics] + [category_id + '_sentence']
+        scores.append([sentence_scores[category_id + '_' + metric].tolist() for metric, _ in score_metrics])
+    if training_similarity is not None:
+        columns += ['training_similarity', 'seen_in_training']
+
+    with ExitStack() as stack:
+        tables = [stack.enter_context(table) for table in open_table_reports(report[:-1], columns, formats)]
+        html_files, text_files = [], []
+        if 'html' in formats:
+            html_files = [stack.enter_context(HTMLReport(report + '_' + category_id + '.html',
+                                                         'MT_' + translated_doc[:-3] + '_' + category_id, source_doc,
+                                                         translated_doc))
+                          for category_id in categories]
+        if 'txt' in formats:
+            text_files = [stack.enter_context(TextReport(report + '_' + category_id + '.txt'))
+                          for category_id in categories]
+            all_models = stack.enter_context(TextReport(report + '_all_models.txt'))
+
+        for i, (source_text, reference) in enumerate(zip(lst_source_text, lst_target_txt)):
+            row = [source_text, reference]
+            for cat_id, category_id in enumerate(categories):
+                translated_text = cat_translations[cat_id][i]
+                row += [metric_scores[i] for metric_scores in scores[cat_id]] + [translated_text]
+                if html_files:
+                    html_files[cat_id].write_row(source_text, reference, translated_text)
+                if text_files:
+                    # One sentence per line, like the aligned reference, so score_translations can rescore it
+                    text_files[cat_id].write_row(translated_text)
+                    all_models.write_row(f"*** Category {category_id}\n ENG: {source_text}\n REF: {reference}\n"
+                                         f" MT : {translated_text}")
+            if training_similarity is not None:
+                row += [float(training_similarity[i]), bool(training_similarity[i] >= leakage_threshold)]
+            for table in tables:
+                table.write_row(row)
+
+    logging.debug(f"Generated {', '.join(formats)} reports for {len(lst_source_text)} sentences in {output_path}")
+
+
+def evaluate_document(args, metrics):
+    """
+    Extracts, aligns, translates and scores the document and writes the reports, timing each stage
+    :param args: The parsed arguments
+    :param metrics: The Metrics the stages, translation requests and cache hits are recorded in
+    """
+    from ..common.scoring import score_translations
+    from ..common.translator import TranslationClient
 
-        for i, source_text in enumerate(lst_source_text):
-
-            # Create a simple aligned html report
-            html_file = open(os.path.join(output_path, 'MT_' + translated_doc[:-3] + '_' + category_id + '.html'), 'a')
-
-            if i == 0:
-                html = """<!DOCTYPE html><html lang = "en" ><head><meta charset = "UTF-8">"""
-                html_file.write(html)
-
-                html = """<title>""" + 'MT_' + translated_doc[:-3] + '_' + category_id + """</title>"""
-                html_file.write(html)
-                html = """</head><div>"""
-                html_file.write(html)
-
-                html = """<table id =""" + '"' + source_doc + '"' + """style = "border:1px solid; width:50%; 
-                float:left" frame=void rules=rows><tr>"""
-                html_file.write(html)
-                html = """<td><u>""" + source_doc + """</u></td></tr>"""
-                html_file.write(html)
-
-            # Now we add a table row
-            html = """<tr><td>ENU: """ + source_text + """</td></tr>"""
-            html_file.write(html)
-            html = """<tr><td>REF: """ + lst_target_txt[i] + """</td></tr>"""
-            html_file.write(html)
-
-            if i == len(lst_source_text) - 1:
-                html = """</table>"""
-                html_file.write(html)
-
-        html = """<table id =""" + '"' + translated_doc + '"' + """style = "border:1px solid; width:50%; float:left"
-        frame=void rules=rows><tr>"""
-        html_file.write(html)
-        html = """<td><u>""" + translated_doc + """</u></td></tr>"""
-        html_file.write(html)
-
-        # Now we add a table row
-        for j, sentence in enumerate(cat_sentences[cat_id]):
-            html = """<tr><td>MT: """ + sentence + """</td></tr>"""
-            html_file.write(html)
-            html = """<tr><td>REF: """ + lst_target_txt[j] + """</td></tr>"""
-            html_file.write(html)
-
-        html = """</table>"""
-        html_file.write(html)
-        html = """</div><body></body></html>"""
-        html_file.write(html)
-        html_file.close()
-        logging.debug(f"Generated HTML report "
-                      f"{str(os.path.join(output_path, 'MT_' + translated_doc[:-3] + '_' + category_id + '.html'))}")
+    translated_path = args.translated_path
+    translated_doc = args.translated_doc
+    source_path = args.source_path
+    source_doc = args.source_doc
+    output_path = args.output_path
+
+    # The pages of both documents are extracted in one pool, or read from the cache if they were extracted before
+    with metrics.stage('extract'):
+        source_aligner, target_aligner = extract_documents(
+            os.path.join(source_path, source_doc), os.path.join(translated_path, translated_doc),
+            os.path.join(source_path, source_doc[:-3] + 'txt'),
+            os.path.join(translated_path, translated_doc[:-3] + 'txt'), args.pdf_workers, args.pdf_cache)
+
+    # Now we call the Microsoft Bilingual Sentence Alignment script
+    with metrics.stage('align'):
+        lst_en_aligned, lst_fr_aligned = align_documents(source_aligner, target_aligner, Config.ALIGNER_PATH,
+                                                         args.aligner)
+    metrics.increment('sentences_total', len(lst_en_aligned))
+
+    subscription_key = Config.SUBSCRIPTION_KEY
+
+    categories = Config.CATEGORIES
+    categories = [category_id.strip() for category_id in categories.strip().split(',')]
+
+    cache = open_translation_cache(args.cache_path, args.cache_read_only)
+
+    # Every translation is journaled as its batch completes, a resumed run only sends what the journal is missing
+    journal_path = args.journal_path or os.path.join(output_path, 'MT_' + translated_doc[:-4] + '_journal.jsonl')
+    run = document_run(source_doc, translated_doc, args.target_language, categories, lst_en_aligned)
+
+    # Translate the whole aligned document against all models at once, packing the sentences into as few
+    # requests as possible
+    with RunJournal(journal_path, run, args.resume) as journal, \
+            TranslationClient(subscription_key, Config.REGION, Config.TRANSLATOR_ENDPOINT, args.max_concurrency,
+                              cache=cache, metrics=metrics) as client, \
+            metrics.stage('translate'):
+        cat_translations = translate_document(client, journal, lst_en_aligned, args.target_language, categories,
+                                              args.batch_size)
+    logging.info(f"Translation stats {client.stats.snapshot()}")
+    if cache:
+        metrics.increment('translation_cache_total', cache.hits, result='hit')
+        metrics.increment('translation_cache_total', cache.misses, result='miss')
+        cache.close()
+
+    # Score every model against the reference sentences in one pass, the references are tokenized once
+    with metrics.stage('score'):
+        sentence_scores, corpus_scores = score_translations(
+            lst_fr_aligned[:len(lst_en_aligned)],
+            {category_id: cat_translations[cat_ind] for cat_ind, category_id in enumerate(categories)},
+            args.metrics, samples=args.bootstrap_samples)
+    corpus_scores.to_csv(os.path.join(output_path, 'MT_' + translated_doc[:-4] + '_scores.csv'), sep=',')
+    logging.info(f"Corpus scores\n{corpus_scores}")
+
+    training_similarity = None
+    if args.leakage_index:
+        with metrics.stage('leakage'):
+            training_similarity = training_leakage(lst_en_aligned, args.leakage_index)
+        seen = training_similarity >= args.leakage_threshold
+        logging.info(f"{seen.sum()} of {len(seen)} source sentences were seen in training")
+        with metrics.stage('score_unseen'):
+            unseen_scores = score_unseen(lst_fr_aligned, categories, cat_translations, seen, args.metrics)
+        if unseen_scores is not None:
+            unseen_scores.to_csv(os.path.join(output_path, 'MT_' + translated_doc[:-4] + '_unseen_scores.csv'),
+                                 sep=',')
+
+    with metrics.stage('report'):
+        write_reports(categories, lst_en_aligned, lst_fr_aligned, cat_translations, sentence_scores, args.metrics,
+                      output_path, args.source_doc, args.translated_doc, args.report_formats, training_similarity,
+                      args.leakage_threshold)
 
 
 def main():
@@ -127,6 +325,9 @@ def main():
     * Generates various reports
     :return: Full text translation, CSV file with BLEU scores and text, HTML report with sentences only
     """
+    from ..common.leakage import SIMILARITY_THRESHOLD
+    from ..common.scoring import METRICS, DEFAULT_METRICS, BOOTSTRAP_SAMPLES
+
     # We pass these dynamic arguments in for parallel jobs
     parser = argparse.ArgumentParser(description='Process docs for machine translation')
     parser.add_argument('--translated-path', type=str,
@@ -141,120 +342,51 @@ def main():
                         help='The output path for our translation scores and results')
     parser.add_argument('--target-language', type=str, default='',
                         help='es or fr')
+    parser.add_argument('--batch-size', type=int, default=Config.BATCH_SIZE, metavar='N',
+                        help='The number of sentences sent per translation request, up to 100')
+    parser.add_argument('--max-concurrency', type=int, default=Config.MAX_CONCURRENCY, metavar='N',
+                        help='The number of translation requests in flight at once across all models')
+    parser.add_argument('--cache-path', type=str, default=Config.TRANSLATION_CACHE,
+                        help='The SQLite translation cache file, translations are not cached if omitted')
+    parser.add_argument('--cache-read-only', action='store_true', default=Config.CACHE_READ_ONLY,
+                        help='Read from the translation cache without writing to it')
+    parser.add_argument('--aligner', type=str, default=Config.ALIGNER, choices=['perl', 'python'],
+                        help='Align with the perl scripts in ALIGNER_PATH or the in process python port')
+    parser.add_argument('--metrics', type=str, nargs='+', default=list(DEFAULT_METRICS), choices=METRICS,
+                        help='The metrics the translations are scored with')
+    parser.add_argument('--bootstrap-samples', type=int, default=BOOTSTRAP_SAMPLES, metavar='N',
+                        help='The number of paired bootstrap resamples against the first model, 0 to skip')
+    parser.add_argument('--journal-path', type=str, default=None,
+                        help='The run journal file, defaults to MT_<translated doc>_journal.jsonl in the output path')
+    parser.add_argument('--resume', action='store_true',
+                        help='Resume the run in the journal, only the sentences it has not translated are sent')
+    parser.add_argument('--report-formats', type=str, nargs='+', default=list(DEFAULT_REPORT_FORMATS),
+                        choices=REPORT_FORMATS, help='The reports to write, parquet needs pyarrow')
+    parser.add_argument('--pdf-cache', type=str, default=Config.PDF_CACHE,
+                        help='The directory caching the text of each pdf by its contents, no caching if omitted')
+    parser.add_argument('--pdf-workers', type=int, default=Config.PDF_WORKERS, metavar='N',
+                        help='The number of processes the pages of both pdfs are extracted in')
+    parser.add_argument('--leakage-index', type=str, default=Config.LEAKAGE_INDEX,
+                        help='A near duplicate index of the training memories, flags the source sentences seen in '
+                             'training and scores the unseen sentences separately')
+    parser.add_argument('--leakage-threshold', type=float, default=SIMILARITY_THRESHOLD,
+                        help='The estimated Jaccard similarity from which a sentence counts as seen in training')
+    parser.add_argument('--metrics-path', type=str, default=Config.METRICS_PATH,
+                        help='Write the stage timings, translation requests, bytes sent, characters billed and cache '
+                             'hits of the run to this file, in the Prometheus text format if it ends in .prom and as '
+                             'JSON otherwise')
+    parser.add_argument('--profile', type=str, default=Config.PROFILE,
+                        help='Profile the run to this file, with pyinstrument if it ends in .html and cProfile '
+                             'otherwise')
 
     args = parser.parse_args()
     set_log_level(Config.DEBUG)
 
-    translated_path = args.translated_path
-    translated_doc = args.translated_doc
-    source_path = args.source_path
-    source_doc = args.source_doc
-    output_path = args.output_path
-
-    fr_text = pdf_parser(os.path.join(translated_path, translated_doc))
-    en_text = pdf_parser(os.path.join(source_path, source_doc))
-
-    source_text_doc = source_doc[:-3] + 'txt'
-    translated_text_doc = translated_doc[:-3] + 'txt'
-
-    with open(os.path.join(translated_path, translated_text_doc), 'w') as fr:
-        fr.write(fr_text)
-
-    with open(os.path.join(source_path, source_text_doc), 'w') as en:
-        en.write(en_text)
-
-    target_aligner = os.path.join(translated_path, translated_text_doc)
-    source_aligner = os.path.join(source_path, source_text_doc)
-
-    # Now we call the Microsoft Bilingual Sentence Alignment script
-    alignment_results = call_sentence_alignment(source_aligner, target_aligner, Config.ALIGNER_PATH)
-    logging.info(f"Sentence Alignment {alignment_results}")
-
-    source_aligned_doc = source_text_doc + '.aligned'
-    translated_aligned_doc = translated_text_doc + '.aligned'
-
-    with open(os.path.join(translated_path, translated_aligned_doc), 'r') as fr:
-        fr_aligned = fr.read()
-
-    with open(os.path.join(source_path, source_aligned_doc), 'r') as en:
-        en_aligned = en.read()
-
-    lst_fr_aligned = fr_aligned.split('\n')
-    lst_en_aligned = en_aligned.split('\n')
-
-    subscription_key = Config.SUBSCRIPTION_KEY
-
-    categories = Config.CATEGORIES
-    categories = categories.strip().split(',')
-
-    cat_dicts = [{} for category_id in categories]
-    lst_target_txt = []
-    lst_source_text = []
-
-    with open(os.path.join(output_path, 'MT_' + translated_doc[:-3] + '_all_models' + '.txt'),
-              'w') as mt_file:
-
-        for i, etxt in enumerate(lst_en_aligned):
-            logging.debug(f"Processing {i} of {len(lst_en_aligned)}")
-            hypothesis = lst_fr_aligned[i]
-            lst_source_text.append(etxt)
-            lst_target_txt.append(hypothesis)
-            for cat_ind, category_id in enumerate(categories):
-                category_id = category_id.strip()
-                translation_results = call_translation([{'Text': etxt}], args.target_language, category_id,
-                                                       subscription_key, Config.REGION)
-
-                for translations in translation_results:
-                    logging.info(f"CategoryId {category_id} translation {translations}")
-                    for translation in translations['translations']:
-                        translated_text = translation['text']
-                        if len(translated_text) == 0:
-                            bleu_score = 0
-                            bleu_scores = 0
-                        else:
-                            bleu_scores = sacrebleu.corpus_bleu(hypothesis, translated_text)
-                            bleu_score = bleu_scores.score
-                        logging.info(f"*** Category {category_id}")
-                        mt_file.write(f"\n*** Category {category_id}")
-                        logging.info(f"ENG: {etxt}")
-                        mt_file.write(f"\n ENG: {etxt}")
-                        logging.info(f"REF: {hypothesis}")
-                        mt_file.write(f"\n REF: {hypothesis}")
-                        logging.info(f"MT : {translated_text}")
-                        mt_file.write(f"\n MT : {translated_text}")
-                        logging.info(f"{bleu_scores}")
-                        logging.info(f"\n********************************")
-                        cat_dicts[cat_ind][i] = []
-                        cat_dicts[cat_ind][i].append(translated_text)
-                        cat_dicts[cat_ind][i].append(bleu_score)
-                        logging.info(f"_____________________")
-                        logging.info('\n')
-
-    cat_scores = [[] for category_id in categories]
-    cat_sentences = [[] for category_id in categories]
-
-    # This creates a text file for the translated document for each model
-    for cat_id, category_id in enumerate(categories):
-        with open(os.path.join(output_path, 'MT_' + translated_doc[:-3] + '_' + category_id + '.txt'),
-                  'w') as mt_file:
-            for key, value in cat_dicts[cat_id].items():
-                cat_sentences[cat_id].append(value[0])
-                cat_scores[cat_id].append(value[1])
-                mt_file.write(value[0])
-
-    data = {'Source': lst_source_text, 'Target': lst_target_txt}
-
-    for cat_id, category_id in enumerate(categories):
-        data[categories[cat_id] + '_score'] = cat_scores[cat_id]
-        data[categories[cat_id] + '_sentence'] = cat_sentences[cat_id]
-
-    df_translated = pd.DataFrame(data)
-
-    df_translated.to_csv(os.path.join(output_path, 'MT_' + translated_doc[:-3] + 'csv'), sep=',')
-    logging.debug(f"Generated CSV file {str(os.path.join(output_path, 'MT_' + translated_doc[:-3] + 'csv'))}")
-
-    build_HTML_aligned_report(categories, cat_sentences, lst_source_text, lst_target_txt, output_path, args.source_doc,
-                              args.translated_doc)
+    metrics = Metrics()
+    with profile(args.profile):
+        evaluate_document(args, metrics)
+    if args.metrics_path:
+        metrics.write(args.metrics_path)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,148 @@
+import os
+import shutil
+import subprocess
+import tempfile
+from unittest import TestCase, skipUnless
+
+from common.aligner import align_sentences, read_sentences, train_model_one
+from common.common import call_batch_sentence_alignment, load_alignment_manifest
+from common.tmx_reader import iter_tmx_units
+
+PERL = shutil.which('perl')
+
+
+def run_perl_aligner(source_file, target_file):
+    """
+    Runs the Perl aligner scripts on a pair of documents
+    """
+    subprocess.run(['perl', 'align-sents-all.pl', os.path.abspath(source_file), os.path.abspath(target_file)],
+                   cwd='Aligner', stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+
+
+def read_aligned(file):
+    with open(file + '.aligned', 'rb') as aligned:
+        return aligned.read()
+
+
+class TestAligner(TestCase):
+
+    def align_both(self, source_lines, target_lines):
+        """
+        Aligns the same documents with the Perl scripts and the python port in separate directories
+        :return: The (source, target) .aligned contents of the Perl and the python run
+        """
+        results = []
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for engine in ('perl', 'python'):
+                os.mkdir(os.path.join(temp_dir, engine))
+                source_file = os.path.join(temp_dir, engine, 'source.txt')
+                target_file = os.path.join(temp_dir, engine, 'target.txt')
+                with open(source_file, 'wb') as source:
+                    source.write(source_lines)
+                with open(target_file, 'wb') as target:
+                    target.write(target_lines)
+                if engine == 'perl':
+                    run_perl_aligner(source_file, target_file)
+                else:
+                    align_sentences(source_file, target_file)
+                results.append((read_aligned(source_file), read_aligned(target_file)))
+        return results
+
+    @skipUnless(PERL, 'perl is not installed')
+    def test_parity_test_data(self):
+        """
+        The python port writes the same aligned sentences as the Perl scripts for the test documents
+        """
+        with open('Tests/Data/english.txt', 'rb') as source:
+            source_lines = source.read()
+        with open('Tests/Data/spanish.txt', 'rb') as target:
+            target_lines = target.read()
+
+        perl, python = self.align_both(source_lines, target_lines)
+        assert python == perl
+        assert python == (source_lines, target_lines)
+
+    @skipUnless(PERL, 'perl is not installed')
+    def test_parity_with_deletions_and_merges(self):
+        """
+        Drops sentences from either side and merges target sentences so every bead type is exercised
+        """
+        source_lines, target_lines = [], []
+        for i, unit in enumerate(iter_tmx_units('Data/train/EAC_FORMS.en_es.tmx', end=600)):
+            if i % 13 != 5:
+                source_lines.append(' '.join(unit.getid().split()))
+            if i % 17 != 3:
+                target_lines.append(' '.join(unit.gettarget().split()))
+            if i % 29 == 7:
+                target_lines[-1] += ' ' + ' '.join(unit.gettarget().split())
+
+        perl, python = self.align_both(('\n'.join(source_lines) + '\n').encode('utf-8'),
+                                       ('\n'.join(target_lines) + '\n').encode('utf-8'))
+        assert python == perl
+        assert len(python[0].splitlines()) > 450
+
+    @skipUnless(PERL, 'perl is not installed')
+    def test_batch_parity_with_shared_model(self):
+        """
+        Aligning a manifest of pairs in a pool writes the same aligned sentences as the multi file Perl scripts and the
+        one word model trained on every pair makes the result differ from aligning each pair on its own
+        """
+        units = list(iter_tmx_units('Data/train/EAC_FORMS.en_es.tmx', end=700))
+        results = {}
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for engine in ('perl', 'python'):
+                os.mkdir(os.path.join(temp_dir, engine))
+                manifest = ['# source\ttarget']
+                for k, (start, end) in enumerate(((0, 250), (250, 550), (550, 700))):
+                    source_lines = [' '.join(unit.getid().split()) for i, unit in enumerate(units[start:end])
+                                    if i % 13 != 5 + k]
+                    target_lines = [' '.join(unit.gettarget().split()) for i, unit in enumerate(units[start:end])
+                                    if i % 17 != 3]
+                    for name, lines in ((f'source{k}.txt', source_lines), (f'target{k}.txt', target_lines)):
+                        with open(os.path.join(temp_dir, engine, name), 'w') as document:
+                            document.write('\n'.join(lines) + '\n')
+                    manifest.append(f'source{k}.txt\ttarget{k}.txt')
+                with open(os.path.join(temp_dir, engine, 'manifest.tsv'), 'w') as manifest_file:
+                    manifest_file.write('\n'.join(manifest) + '\n')
+
+                pairs = load_alignment_manifest(os.path.join(temp_dir, engine, 'manifest.tsv'))
+                aligned = call_batch_sentence_alignment(pairs, 'Aligner', engine, workers=2)
+                assert [result[:2] for result in aligned] == [(source + '.aligned', target + '.aligned')
+                                                              for source, target in pairs]
+                results[engine] = [(read_aligned(source), read_aligned(target)) for source, target in pairs]
+
+            single = []
+            for source, target in pairs:
+                align_sentences(source, target)
+                single.append((read_aligned(source), read_aligned(target)))
+
+        assert results['python'] == results['perl']
+        assert results['python'] != single
+
+    def test_read_sentences(self):
+        """
+        Blank lines and lines between skip markers are not sentences
+        """
+        with tempfile.TemporaryDirectory() as temp_dir:
+            file = os.path.join(temp_dir, 'document.txt')
+            with open(file, 'w') as document:
+                document.write("First sentence (one)\n\n*|*|*\nSkipped line\n*|*|*\nSecond well-known_sentence 0\n")
+
+            assert read_sentences(file) == [[b'First', b'sentence', b'one)'],
+                                             [b'Second', b'well', b'known', b'sentence']]
+
+    def test_train_model_one(self):
+        """
+        The word model learns the translations that co-occur and its probabilities are normalised per source token
+        """
+        sentences_1 = [[b'the', b'house'], [b'the', b'book'], [b'a', b'book'], [b'a', b'house']] * 2
+        sentences_2 = [[b'la', b'casa'], [b'el', b'libro'], [b'un', b'libro'], [b'una', b'casa']] * 2
+
+        trans_probs = train_model_one(sentences_1, sentences_2)
+
+        totals = {}
+        for (token_1, _), prob in trans_probs.items():
+            totals[token_1] = totals.get(token_1, 0) + prob
+        assert all(abs(total - 1) < 1e-9 for total in totals.values())
+        assert trans_probs[(b'house', b'casa')] > trans_probs.get((b'house', b'la'), 0)
+        assert trans_probs[(b'book', b'libro')] > trans_probs.get((b'book', b'el'), 0)
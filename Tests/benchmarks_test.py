@@ -0,0 +1,47 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from common.pdf_text import extract_pdf_texts
+from common.tmx_reader import iter_tmx_units
+from recipes.Benchmarks.corpora import iter_sentence_pairs, sample_vocabulary, write_pdf, write_tmx
+from recipes.Benchmarks.pipeline_benchmark import compare
+
+
+class TestCorpora(TestCase):
+
+    def test_generated_corpora_read_back(self):
+        """
+        The generated memory and pdf read back as the pairs they were generated from, in the sample vocabulary
+        """
+        vocabulary = sample_vocabulary()
+        pairs = list(iter_sentence_pairs(100, seed=3, vocabulary=vocabulary))
+        assert pairs == list(iter_sentence_pairs(100, seed=3, vocabulary=vocabulary))
+        assert len(set(pairs)) == 100
+        assert 'régimen' in vocabulary[1]
+        assert {word for source, _ in pairs for word in source.lower().split()[:-1]} <= set(vocabulary[0])
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            memory, pdf = os.path.join(temp_dir, 'memory.tmx'), os.path.join(temp_dir, 'source.pdf')
+            assert write_tmx(memory, pairs + [('A < B & C', 'A (B) \\ C')]) == 101
+            assert [(unit.getid(), unit.gettarget()) for unit in iter_tmx_units(memory)][-1] == ('A < B & C',
+                                                                                                'A (B) \\ C')
+            write_pdf(pdf, [source for source, _ in pairs] + ['A (B) \\ C'], lines_per_page=30)
+            text = extract_pdf_texts([pdf], workers=1)[0]
+        # Pages are separated by form feeds
+        lines = [line.strip('\x0c') for line in text.split('\n') if line.strip()]
+        assert lines == [source for source, _ in pairs] + ['A (B) \\ C']
+
+
+class TestRegressions(TestCase):
+
+    def test_compare_with_baseline(self):
+        baseline = {'evaluate': {'items': 1000, 'seconds': 10.0, 'peak_mb': 100.0,
+                                 'timings': {'extract': 4.0, 'report': 0.1}}}
+        result = {'items': 1000, 'seconds': 11.0, 'peak_mb': 90.0, 'timings': {'extract': 6.0, 'report': 0.3}}
+        # Only the extract stage regressed, the report stage is too short to compare
+        regressions = compare({'evaluate': result}, baseline, tolerance=0.25)
+        assert len(regressions) == 1 and regressions[0].startswith('evaluate extract seconds 6.00')
+        assert compare({'evaluate': result, 'phrases': result}, baseline, tolerance=0.6) == []
+        assert compare({'evaluate': dict(result, items=10)}, baseline) == [
+            'evaluate was measured on 10 items, the baseline on 1000']
@@ -0,0 +1,113 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from unittest import TestCase
+
+import pandas as pd
+
+from Benchmarks.translator_stub import TranslatorStub
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE_PDF = os.path.join(ROOT, 'Tests', 'Data', 'pdf', 'sample.pdf')
+HEAVY_MODULES = ('spacy', 'textacy', 'pandas', 'numpy', 'requests', 'pdfminer', 'translate')
+
+
+def run_python(arguments, env=None):
+    """
+    Runs a fresh interpreter from the directory above the repository, as the package relative imports need
+    """
+    return subprocess.run([sys.executable] + arguments, cwd=os.path.dirname(ROOT), env=env, capture_output=True,
+                          text=True)
+
+
+class TestCommandLine(TestCase):
+
+    def test_entry_points_import_without_heavy_dependencies(self):
+        """
+        Importing the shared helpers and the entry points leaves spaCy, pandas, requests and pdfminer to the stages
+        that use them
+        """
+        package = os.path.basename(ROOT)
+        modules = ['__main__', 'common.common', 'Evaluation.stages', 'Evaluation.translator_pipeline',
+                   'Analysis.Phrase_Dictionary.build_phrase_dictionary_spacy']
+        imports = '; '.join(f'import {package}.{module}' for module in modules)
+        result = run_python(['-c', f'import sys; {imports}; '
+                                   f'print(" ".join(sorted({{name.split(".")[0] for name in sys.modules}})))'])
+        assert result.returncode == 0, result.stderr
+        loaded = set(result.stdout.split())
+        assert not loaded & set(HEAVY_MODULES), loaded & set(HEAVY_MODULES)
+
+    def test_stages_run_as_commands(self):
+        """
+        A document is extracted, aligned, translated against a local stub and scored one command at a time, each
+        command reading the files the one before it wrote
+        """
+        package = os.path.basename(ROOT)
+        with tempfile.TemporaryDirectory() as tmp:
+            source_pdf = shutil.copy(SAMPLE_PDF, os.path.join(tmp, 'source.pdf'))
+            reference_pdf = shutil.copy(SAMPLE_PDF, os.path.join(tmp, 'reference.pdf'))
+            env = dict(os.environ, CATEGORIES='general,custom', SUBSCRIPTION_KEY='key', REGION='westeurope')
+
+            extracted = run_python(['-m', package, 'extract', '--source-pdf', source_pdf, '--reference-pdf',
+                                    reference_pdf, '--pdf-workers', '1'], env)
+            assert extracted.returncode == 0, extracted.stderr
+            source_text, reference_text = os.path.join(tmp, 'source.txt'), os.path.join(tmp, 'reference.txt')
+
+            aligned = run_python(['-m', package, 'align', '--source-text', source_text, '--reference-text',
+                                  reference_text, '--aligner', 'python'], env)
+            assert aligned.returncode == 0, aligned.stderr
+
+            with TranslatorStub() as stub:
+                translated = run_python(['-m', package, 'translate', '--source-aligned', source_text + '.aligned',
+                                         '--target-language', 'fr', '--output-path', tmp, '--translator-endpoint',
+                                         stub.endpoint], env)
+                assert translated.returncode == 0, translated.stderr
+                assert stub.requests == 2  # One batch per model
+            hypotheses = [os.path.join(tmp, 'MT_source_' + category_id + '.txt')
+                          for category_id in ('general', 'custom')]
+            with open(hypotheses[0], 'r') as translations, open(source_text + '.aligned', 'r') as source:
+                assert translations.read().split('\n') == source.read().upper().rstrip('\n').split('\n')
+
+            scored = run_python(['-m', package, 'score', '--reference', reference_text + '.aligned', '--hypotheses']
+                                + hypotheses + ['--output-path', tmp, '--bootstrap-samples', '0'], env)
+            assert scored.returncode == 0, scored.stderr
+            corpus_scores = pd.read_csv(os.path.join(tmp, 'corpus_scores.csv'), index_col=0)
+            assert list(corpus_scores.index) == ['MT_source_general', 'MT_source_custom']
+
+    def test_jsonl_report_and_journal_resume(self):
+        """
+        The JSONL report is written next to the run journal rather than over it, so the run can be resumed
+        """
+        package = os.path.basename(ROOT)
+        with tempfile.TemporaryDirectory() as tmp:
+            shutil.copy(SAMPLE_PDF, os.path.join(tmp, 'source.pdf'))
+            shutil.copy(SAMPLE_PDF, os.path.join(tmp, 'reference.pdf'))
+            with TranslatorStub() as stub:
+                env = dict(os.environ, CATEGORIES='general,custom', SUBSCRIPTION_KEY='key', REGION='westeurope',
+                           TRANSLATOR_ENDPOINT=stub.endpoint, ALIGNER='python', TRANSLATION_CACHE='', PDF_CACHE='',
+                           LEAKAGE_INDEX='')
+                arguments = ['-m', package, 'evaluate', '--source-path', tmp, '--source-doc', 'source.pdf',
+                             '--translated-path', tmp, '--translated-doc', 'reference.pdf', '--output-path', tmp,
+                             '--target-language', 'fr', '--bootstrap-samples', '0', '--report-formats', 'csv',
+                             'jsonl']
+                evaluated = run_python(arguments, env)
+                assert evaluated.returncode == 0, evaluated.stderr
+                requests = stub.requests
+                resumed = run_python(arguments + ['--resume'], env)
+                assert resumed.returncode == 0, resumed.stderr
+                assert stub.requests == requests  # Every translation came from the journal
+
+            report = pd.read_json(os.path.join(tmp, 'MT_reference.jsonl'), lines=True)
+            assert len(report) == len(pd.read_csv(os.path.join(tmp, 'MT_reference.csv')))
+            # One row per aligned sentence, the final newline of the aligned file is not an empty sentence
+            with open(os.path.join(tmp, 'source.txt.aligned'), 'r') as aligned:
+                assert len(report) == aligned.read().count('\n')
+            assert report.iloc[:, 0].astype(str).str.strip().ne('').all()
+            assert os.path.isfile(os.path.join(tmp, 'MT_reference_journal.jsonl'))
+
+    def test_unknown_command_is_rejected(self):
+        result = run_python(['-m', os.path.basename(ROOT), 'transalte'])
+        assert result.returncode == 2
+        assert 'invalid choice' in result.stderr
@@ -0,0 +1,17 @@
+import importlib.util
+import os
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# The tests import the shared modules from the repository root
+sys.path.insert(0, ROOT)
+
+# The entry points use package relative imports, so the repository root is also registered as the recipes package
+# whatever the checkout directory is called
+if 'recipes' not in sys.modules:
+    spec = importlib.util.spec_from_file_location('recipes', os.path.join(ROOT, '__init__.py'),
+                                                  submodule_search_locations=[ROOT])
+    recipes = importlib.util.module_from_spec(spec)
+    sys.modules['recipes'] = recipes
+    spec.loader.exec_module(recipes)
@@ -0,0 +1,76 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from common.leakage import LeakageIndex
+from common.tmx_reader import TmxUnit, iter_tmx_units
+from recipes.Analysis.Datasets.build_datasets import ShardedTmxWriter, split_units, drop_seen
+
+
+def make_units(count):
+    units = [TmxUnit(i, ' '.join(['source'] * (1 + i % 12)) + ' ' + str(i), 'target & ' + str(i),
+                     {'Txt::Doc. No.': str(i)}) for i in range(count)]
+    units.append(TmxUnit(count, ' source  0', 'target & 0', {}))  # A duplicate of the first unit
+    units.append(TmxUnit(count + 1, 'source', '', {}))  # No target
+    return units
+
+
+class TestBuildDatasets(TestCase):
+
+    def test_split_units_is_exclusive_and_seeded(self):
+        """
+        Every kept unit lands in exactly one dataset, the samples honour their sizes and token limits and the same
+        seed draws the same samples
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            with ShardedTmxWriter(os.path.join(tmp, 'train_{}.tmx'), 'en-US', 'es-ES', max_units=300) as train:
+                test, tune, counts = split_units(make_units(1000), train, test_size=50, tune_size=40,
+                                                 tune_min_tokens=7, tune_max_tokens=10, seed=1)
+
+            assert counts == {'read': 1002, 'duplicate': 1, 'filtered': 1, 'train': 910, 'test': 50, 'tune': 40}
+            assert train.files == [os.path.join(tmp, 'train_' + str(i) + '.tmx') for i in range(4)]
+            train_units = [unit for file in train.files for unit in iter_tmx_units(file, 'en', 'es')]
+            assert len(train_units) == 910
+            assert all(unit.target == 'target & ' + unit.props['Txt::Doc. No.'] for unit in train_units)
+
+            indices = [unit.props['Txt::Doc. No.'] for unit in train_units] + [str(unit.index) for unit in test + tune]
+            assert sorted(indices, key=int) == [str(i) for i in range(1000)]
+            assert all(7 <= len(unit.source.split()) <= 10 for unit in tune)
+            assert [unit.index for unit in test] == sorted(unit.index for unit in test)
+
+            with ShardedTmxWriter(os.path.join(tmp, 'again_{}.tmx'), 'en-US', 'es-ES') as again:
+                same_test, same_tune, _ = split_units(make_units(1000), again, test_size=50, tune_size=40,
+                                                      tune_min_tokens=7, tune_max_tokens=10, seed=1)
+            assert [unit.index for unit in same_test] == [unit.index for unit in test]
+            assert [unit.index for unit in same_tune] == [unit.index for unit in tune]
+
+    def test_shards_honour_the_size_cap(self):
+        """
+        A new shard is started before a unit would take the current one over the byte cap
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            with ShardedTmxWriter(os.path.join(tmp, 'train_{}.tmx'), 'en-US', 'es-ES', max_bytes=4096) as train:
+                split_units(make_units(200), train)
+
+            assert len(train.files) > 1
+            assert all(os.path.getsize(file) <= 4096 for file in train.files)
+            assert sum(1 for file in train.files for _ in iter_tmx_units(file)) == 200
+
+    def test_drop_seen_filters_leaked_units(self):
+        """
+        Units whose source is a near duplicate of an indexed segment are dropped and counted
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'index')
+            LeakageIndex.build(path, ['The applicant must submit the form before the deadline.',
+                                      'Culture and language of the host country'])
+            units = [TmxUnit(0, 'The applicant must submit the form before the deadline!', 'a', {}),
+                     TmxUnit(1, 'Please describe the objectives of the mobility project.', 'b', {}),
+                     TmxUnit(2, 'Total real cost expenditure incurred in Euros', 'c', {}),
+                     TmxUnit(3, 'CULTURE and language of the host country', 'd', {})]
+            counts = {}
+            with LeakageIndex(path) as index:
+                kept = list(drop_seen(units, index, 0.8, counts, batch_size=3))
+
+        assert counts == {'seen': 2}
+        assert [unit.index for unit in kept] == [1, 2]
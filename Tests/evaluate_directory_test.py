@@ -0,0 +1,107 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from unittest import TestCase
+
+import pandas as pd
+
+from common.leakage import LeakageIndex
+from Benchmarks.translator_stub import TranslatorStub
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE_PDF = os.path.join(ROOT, 'Tests', 'Data', 'pdf', 'sample.pdf')
+
+
+def run_module(module, arguments, env):
+    """
+    Runs an entry point of the repository as a module from the directory above it, as its relative imports need
+    """
+    return subprocess.run([sys.executable, '-m', os.path.basename(ROOT) + '.' + module] + arguments,
+                          cwd=os.path.dirname(ROOT), env=env, capture_output=True, text=True)
+
+
+class TestEvaluateDirectory(TestCase):
+
+    def test_folders_are_evaluated_against_a_stub(self):
+        """
+        Paired documents run through every stage against a local stub and are merged into one leaderboard, an
+        unpaired document is skipped, the sentences are flagged against a leakage index and a resumed run sends no
+        translations again
+        """
+        categories = ['general', 'custom']
+        with tempfile.TemporaryDirectory() as tmp:
+            for folder, names in (('en', ['alpha_en.pdf', 'beta_en.pdf', 'gamma_en.pdf']),
+                                  ('fr', ['alpha_fr.pdf', 'beta_fr.pdf'])):
+                os.mkdir(os.path.join(tmp, folder))
+                for name in names:
+                    shutil.copy(SAMPLE_PDF, os.path.join(tmp, folder, name))
+            output_path = os.path.join(tmp, 'output')
+            os.mkdir(output_path)
+            leakage_index = os.path.join(tmp, 'leakage')
+            LeakageIndex.build(leakage_index, ['A training segment that is not in the documents.'])
+
+            env = dict(os.environ, CATEGORIES=','.join(categories), SUBSCRIPTION_KEY='key', REGION='westeurope')
+            arguments = ['--source-path', os.path.join(tmp, 'en'), '--reference-path', os.path.join(tmp, 'fr'),
+                         '--pairing', r'(.+)_(?:en|fr)\.pdf', '--output-path', output_path, '--target-language', 'fr',
+                         '--aligner', 'python', '--align-workers', '2', '--bootstrap-samples', '50',
+                         '--leakage-index', leakage_index]
+            with TranslatorStub() as stub:
+                result = run_module('Evaluation.evaluate_directory', arguments + ['--translator-endpoint',
+                                                                                  stub.endpoint], env)
+                assert result.returncode == 0, result.stderr
+                requests = stub.requests
+
+                resumed = run_module('Evaluation.evaluate_directory', arguments + [
+                    '--translator-endpoint', stub.endpoint, '--resume'], env)
+                assert resumed.returncode == 0, resumed.stderr
+                assert stub.requests == requests
+
+            assert requests == 4  # One batch per model for each of the two paired documents
+            assert 'gamma' in result.stderr  # The unpaired document is reported
+            leaderboard = pd.read_csv(os.path.join(output_path, 'leaderboard.csv'), index_col=0)
+            assert sorted(leaderboard.index) == sorted(categories)
+            assert list(leaderboard['rank']) == [1, 2]
+            assert (leaderboard['documents'] == 2).all()
+            assert leaderboard['wins'].sum() == 2
+            assert {'bleu', 'chrf', 'bleu_p'} <= set(leaderboard.columns) and 'ter' not in leaderboard.columns
+
+            document_scores = pd.read_csv(os.path.join(output_path, 'document_scores.csv'), index_col=[0, 1])
+            assert len(document_scores) == 4
+            for name in ('alpha', 'beta'):
+                files = os.listdir(os.path.join(output_path, name))
+                assert {'journal.jsonl', 'MT_' + name + '_fr.csv', 'MT_' + name + '_fr_unseen_scores.csv',
+                        'MT_' + name + '_fr._general.html'} <= set(files)
+                sentences = pd.read_csv(os.path.join(output_path, name, 'MT_' + name + '_fr.csv'), index_col=0)
+                assert not sentences['seen_in_training'].any()
+
+    def test_manifest_sources_with_the_same_name(self):
+        """
+        Sources with the same file name in different folders of a manifest are evaluated into their own folders
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            lines = []
+            for folder in ('a', 'b'):
+                os.makedirs(os.path.join(tmp, folder, 'fr'))
+                shutil.copy(SAMPLE_PDF, os.path.join(tmp, folder, 'report.pdf'))
+                shutil.copy(SAMPLE_PDF, os.path.join(tmp, folder, 'fr', 'report.pdf'))
+                lines.append(f'{folder}/report.pdf\t{folder}/fr/report.pdf\n')
+            manifest = os.path.join(tmp, 'manifest.tsv')
+            with open(manifest, 'w') as file:
+                file.writelines(lines)
+            output_path = os.path.join(tmp, 'output')
+            os.mkdir(output_path)
+
+            env = dict(os.environ, CATEGORIES='general', SUBSCRIPTION_KEY='key', REGION='westeurope')
+            with TranslatorStub() as stub:
+                result = run_module('Evaluation.evaluate_directory', [
+                    '--manifest', manifest, '--output-path', output_path, '--target-language', 'fr',
+                    '--aligner', 'python', '--bootstrap-samples', '0', '--translator-endpoint', stub.endpoint], env)
+            assert result.returncode == 0, result.stderr
+            assert stub.requests == 2
+
+            document_scores = pd.read_csv(os.path.join(output_path, 'document_scores.csv'), index_col=[0, 1])
+            assert sorted(set(document_scores.index.get_level_values(0))) == ['a/report', 'b/report']
+            for folder in ('a', 'b'):
+                assert 'MT_report_scores.csv' in os.listdir(os.path.join(output_path, folder, 'report'))
@@ -0,0 +1,73 @@
+import os
+import tempfile
+from unittest import TestCase
+
+import spacy
+
+from common.keyterms import KeytermClient, KeytermServer, pipe_keyterms
+from common.tmx_reader import TmxUnit
+from recipes.Analysis.Phrase_Dictionary.build_phrase_dictionary_spacy import request_unit_keyterms
+
+SOURCE_TEXTS = ['The translation memory holds aligned segments', 'Custom models are trained on the memory', '']
+TARGET_TEXTS = ['La mémoire de traduction contient des segments', 'Les modèles sont entraînés', 'Vide']
+
+
+def word_keyterms(doc):
+    """
+    Stands in for textrank, the keyterms are the longer words of the document
+    """
+    return [(token.lower_, 1.0) for token in doc if token.is_alpha and len(token) > 4]
+
+
+class FakeClient:
+
+    def __init__(self):
+        self.requests = []
+
+    def keyterms(self, source_texts, target_texts):
+        self.requests.append(len(source_texts))
+        return [([(source, 1.0)], [(target, 1.0)]) for source, target in zip(source_texts, target_texts)]
+
+
+class TestKeytermServer(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.temp_dir = tempfile.TemporaryDirectory()
+        cls.models = []
+        for language in ('en', 'fr'):
+            path = os.path.join(cls.temp_dir.name, language)
+            spacy.blank(language).to_disk(path)
+            cls.models.append(path)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.temp_dir.cleanup()
+
+    def test_server_answers_as_the_models_would_locally(self):
+        """
+        Batches sent by several clients are parsed by the forked workers and answered in order, errors are reported
+        to the client and the workers keep serving
+        """
+        socket_path = os.path.join(self.temp_dir.name, 'keyterms.sock')
+        expected = list(pipe_keyterms(spacy.load(self.models[0]), spacy.load(self.models[1]), SOURCE_TEXTS,
+                                      TARGET_TEXTS, extract=word_keyterms))
+        with KeytermServer(socket_path, self.models[0], self.models[1], workers=2, extract=word_keyterms) as server:
+            server.start()
+            assert oct(os.stat(socket_path).st_mode & 0o777) == oct(0o600)
+            client = KeytermClient(socket_path)
+            assert client.models() == tuple(self.models)
+            for _ in range(3):
+                assert [tuple(keyterms) for keyterms in client.keyterms(SOURCE_TEXTS, TARGET_TEXTS)] == expected
+            with self.assertRaises(RuntimeError):
+                client._request('parse')
+            assert client.keyterms([], []) == []
+        assert not os.path.exists(socket_path)
+
+    def test_units_are_requested_in_batches(self):
+        units = [TmxUnit(i, 'source ' + str(i), 'target ' + str(i), {}) for i in range(5)]
+        client = FakeClient()
+        results = list(request_unit_keyterms(units, client, batch_size=2))
+        assert client.requests == [2, 2, 1]
+        assert [unit.index for unit, _, _ in results] == list(range(5))
+        assert results[4][1] == [('source 4', 1.0)] and results[4][2] == [('target 4', 1.0)]
@@ -0,0 +1,64 @@
+import os
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+
+from common.leakage import LeakageIndex, minhash_signatures
+
+TRAINING = ['The applicant must submit the form before the deadline.',
+            'Please describe the objectives of the mobility project.',
+            'Total real cost expenditure incurred in Euros',
+            'Culture and language of the host country']
+
+
+class TestLeakageIndex(TestCase):
+
+    def test_near_duplicates_are_found(self):
+        """
+        Exact, case and whitespace variants and near duplicates of indexed segments are found, unrelated and empty
+        segments are not, whatever the batch size
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'index')
+            assert LeakageIndex.build(path, iter(TRAINING * 50), batch_size=7) == 200
+
+            queries = ['THE APPLICANT must submit  the form before the deadline.',
+                       'Please describe the objectives of the mobility project!',
+                       'Culture and language of the host country',
+                       'A sentence about something else entirely.',
+                       '']
+            with LeakageIndex(path) as index:
+                assert len(index) == 200
+                similarities, ids = index.query(queries, batch_size=2)
+                assert list(index.seen(queries)) == [True, True, True, False, False]
+
+            assert similarities[0] == 1.0
+            assert 0.8 <= similarities[1] < 1.0
+            assert [TRAINING[i % len(TRAINING)] for i in ids[:3]] == [TRAINING[0], TRAINING[1], TRAINING[3]]
+            assert list(ids[3:]) == [-1, -1]
+            assert sorted(os.listdir(tmp)) == ['index']
+
+    def test_signatures_estimate_jaccard_similarity(self):
+        """
+        The fraction of equal MinHash values tracks the Jaccard similarity of the character shingles
+        """
+        texts = ['abcdefghijklmnopqrstuvwxyz', 'abcdefghijklmnopqrstuvwxyZ0123', 'ab']
+        signatures = minhash_signatures(texts, num_perm=256)
+
+        shingles = [{text.casefold()[i:i + 5] for i in range(len(text) - 4)} for text in texts[:2]]
+        jaccard = len(shingles[0] & shingles[1]) / len(shingles[0] | shingles[1])
+        assert signatures.shape == (3, 256) and signatures.dtype == np.uint32
+        assert abs((signatures[0] == signatures[1]).mean() - jaccard) < 0.1
+        assert (minhash_signatures(texts[:1], num_perm=256) == signatures[:1]).all()
+
+    def test_empty_index(self):
+        """
+        An index of no segments can be opened and finds nothing
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'index')
+            assert LeakageIndex.build(path, []) == 0
+            with LeakageIndex(path) as index:
+                similarities, ids = index.query(['anything'])
+            assert list(similarities) == [0] and list(ids) == [-1]
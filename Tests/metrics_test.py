@@ -0,0 +1,117 @@
+import json
+import os
+import pstats
+import tempfile
+from unittest import TestCase
+
+import spacy
+
+from common.keyterms import pipe_keyterms
+from common.metrics import Metrics, profile
+from common.translator import TranslationClient
+from Benchmarks.translator_stub import TranslatorStub
+
+
+def word_keyterms(doc):
+    return [(token.lower_, 1.0) for token in doc if token.is_alpha and len(token) > 4]
+
+
+class TestMetrics(TestCase):
+
+    def test_counters_histograms_and_merge(self):
+        """
+        Worker snapshots merge into the run, and the snapshot survives a round trip through JSON
+        """
+        metrics, worker = Metrics(buckets=(0.1, 1.0)), Metrics(buckets=(0.1, 1.0))
+        metrics.increment('translation_requests_total', status=200)
+        worker.increment('translation_requests_total', 2, status=200)
+        worker.increment('translation_requests_total', status=429)
+        for seconds in (0.05, 0.5, 0.5, 5.0):
+            worker.observe('stage_seconds', seconds, stage='translate')
+        with metrics.stage('report'):
+            pass
+
+        metrics.merge(json.loads(json.dumps(worker.snapshot())))
+        assert metrics.counter('translation_requests_total', status=200) == 3
+        assert metrics.counter('translation_requests_total', status='429') == 1
+        assert metrics.counter('translation_cache_total', result='hit') == 0
+        histograms = {histogram['labels']['stage']: histogram for histogram in metrics.snapshot()['histograms']}
+        assert histograms['translate']['counts'] == [1, 2, 1]
+        assert histograms['translate']['sum'] == 6.05
+        assert histograms['translate']['p50'] == 1.0
+        assert histograms['translate']['p95'] is None  # In the unbounded bucket
+        assert histograms['report']['count'] == 1
+        with self.assertRaises(ValueError):
+            metrics.merge(Metrics().snapshot())
+
+    def test_prometheus_and_json_files(self):
+        metrics = Metrics(buckets=(0.1, 1.0))
+        metrics.increment('translation_bytes_sent_total', 120)
+        metrics.observe('stage_seconds', 0.5, stage='align')
+        with tempfile.TemporaryDirectory() as temp_dir:
+            metrics.write(os.path.join(temp_dir, 'run.prom'))
+            metrics.write(os.path.join(temp_dir, 'run.json'))
+            with open(os.path.join(temp_dir, 'run.prom'), 'r') as prom_file:
+                lines = prom_file.read().splitlines()
+            with open(os.path.join(temp_dir, 'run.json'), 'r') as json_file:
+                snapshot = json.load(json_file)
+            assert sorted(os.listdir(temp_dir)) == ['run.json', 'run.prom']
+
+        assert lines == ['# TYPE translation_bytes_sent_total counter',
+                         'translation_bytes_sent_total 120',
+                         '# TYPE stage_seconds histogram',
+                         'stage_seconds_bucket{stage="align",le="0.1"} 0',
+                         'stage_seconds_bucket{stage="align",le="1.0"} 1',
+                         'stage_seconds_bucket{stage="align",le="+Inf"} 1',
+                         'stage_seconds_sum{stage="align"} 0.5',
+                         'stage_seconds_count{stage="align"} 1']
+        assert snapshot['counters'] == [{'name': 'translation_bytes_sent_total', 'labels': {}, 'value': 120}]
+
+    def test_prometheus_label_values_are_escaped(self):
+        metrics = Metrics()
+        metrics.increment('documents_total', document='The "C:\\docs" report\nv2')
+        assert metrics.prometheus().splitlines()[1] == 'documents_total{document="The \\"C:\\\\docs\\" report\\nv2"} 1'
+
+    def test_cprofile(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'run.prof')
+            with profile(path):
+                sorted(range(1000), key=lambda i: -i)
+            assert pstats.Stats(path).total_calls > 0
+        with profile(None):
+            pass
+
+
+class TestInstrumentation(TestCase):
+
+    def test_translation_client_metrics(self):
+        """
+        Every request is counted by status, only the answered requests are billed
+        """
+        metrics = Metrics()
+        with TranslatorStub(throttle_first=1, retry_after='0') as stub, \
+                TranslationClient('key', 'westeurope', stub.endpoint, backoff=0.01, metrics=metrics) as client:
+            assert client.translate(['hola', 'mundo'], 'es', 'general') == ['HOLA', 'MUNDO']
+
+        body = len(json.dumps([{'Text': 'hola'}, {'Text': 'mundo'}]).encode('utf-8'))
+        assert metrics.counter('translation_requests_total', status=429) == 1
+        assert metrics.counter('translation_requests_total', status=200) == 1
+        assert metrics.counter('translation_retries_total') == 1
+        assert metrics.counter('translation_bytes_sent_total') == 2 * body
+        assert metrics.counter('translation_characters_billed_total') == 9
+        assert metrics.counter('translation_segments_total') == 2
+        histogram, = metrics.snapshot()['histograms']
+        assert histogram['name'] == 'translation_request_seconds' and histogram['count'] == 2
+
+    def test_pipe_keyterms_metrics(self):
+        metrics = Metrics()
+        texts = ['The translation memory holds aligned segments', 'Custom models are trained']
+        keyterms = list(pipe_keyterms(spacy.blank('en'), spacy.blank('en'), texts, texts, extract=word_keyterms,
+                                      metrics=metrics))
+
+        assert keyterms == list(pipe_keyterms(spacy.blank('en'), spacy.blank('en'), texts, texts,
+                                              extract=word_keyterms))
+        counts = {(histogram['name'], histogram['labels'].get('side')): histogram['count']
+                  for histogram in metrics.snapshot()['histograms']}
+        assert counts == {('spacy_parse_seconds', 'source'): 2, ('spacy_parse_seconds', 'target'): 2,
+                          ('keyterm_extract_seconds', None): 2}
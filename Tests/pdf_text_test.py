@@ -0,0 +1,44 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase, mock
+
+from common.pdf_text import count_pages, extract_pages, extract_pdf_texts
+
+SAMPLE_PDF = os.path.join('Tests', 'Data', 'pdf', 'sample.pdf')
+
+
+class TestPdfText(TestCase):
+
+    def test_parallel_extraction_keeps_page_order(self):
+        """
+        Pages extracted across workers are joined back into the same text as a serial extraction
+        """
+        expected = extract_pages(SAMPLE_PDF)
+        assert count_pages(SAMPLE_PDF) == 7
+        assert expected.count('\f') == 7
+
+        with tempfile.TemporaryDirectory() as tmp:
+            copy = os.path.join(tmp, 'copy.pdf')
+            shutil.copy(SAMPLE_PDF, copy)
+            texts = extract_pdf_texts([SAMPLE_PDF, copy], workers=3)
+
+        assert texts == [expected, expected]
+        assert extract_pdf_texts([SAMPLE_PDF], workers=1) == [expected]
+        assert extract_pages(SAMPLE_PDF, {5, 6}) == '\f'.join(expected.split('\f')[5:7]) + '\f'
+
+    def test_cache_skips_extraction(self):
+        """
+        A pdf with the same contents is read from the cache, whatever it is called
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            cache_path = os.path.join(tmp, 'cache')
+            expected = extract_pdf_texts([SAMPLE_PDF], workers=1, cache_path=cache_path)
+
+            copy = os.path.join(tmp, 'renamed.pdf')
+            shutil.copy(SAMPLE_PDF, copy)
+            with mock.patch('common.pdf_text.extract_pages') as extract:
+                texts = extract_pdf_texts([copy], workers=2, cache_path=cache_path)
+                assert not extract.called
+            assert texts == expected
+            assert len(os.listdir(cache_path)) == 1
@@ -0,0 +1,146 @@
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase
+
+from common.common import TranslationCache
+from common.metrics import Metrics
+from common.phrase_dictionary import PhraseDictionary
+from common.translator import TranslationClient
+from Benchmarks.translator_stub import TranslatorStub
+from recipes.Analysis.Phrase_Dictionary.build_phrase_dictionary_spacy import build_shards, candidate_keyterms, \
+    match_phrases, open_phrase_dictionary, translate_keyterms
+
+
+def add_phrases(task):
+    dictionary_file, worker = task
+    with PhraseDictionary(dictionary_file) as phrases:
+        return sum(phrases.add_many([('phrase ' + str(i), 'target ' + str(worker))]) for i in range(20))
+
+
+class TestPhraseDictionary(TestCase):
+
+    def test_build_shards_covers_batch(self):
+        """
+        The shards cover the inclusive batch range exactly once
+        """
+        shards = build_shards('memory.tmx', 10, 109, 3, 64, 1)
+
+        assert len(shards) == 12
+        covered = [i for _, start, end, _, _ in shards for i in range(start, end)]
+        assert covered == list(range(10, 110))
+
+    def test_match_phrases_exact_matches_only(self):
+        """
+        Only multi word keyterms whose translation matches a target keyterm are kept, known phrases are not translated
+        """
+        unit_keyterms = [([('custom model', 0.5), ('open call', 0.4), ('model', 0.3), ('known phrase', 0.2)],
+                          [('Modelo personalizado ', 0.5), ('convocatoria', 0.4)]),
+                         ([('custom model', 0.5), ('data set', 0.4)], [('modelo', 0.5)]),
+                         ([('open call', 0.5)], [('Convocatoria  ABIERTA', 0.5)])]
+        candidates = candidate_keyterms(unit_keyterms, {'known phrase': 'frase conocida'})
+        translations = {'custom model': 'modelo personalizado', 'open call': 'convocatoria abierta'}
+        found = match_phrases(unit_keyterms, translations)
+
+        # The second unit has no multi word target keyterm, so its data set is not worth translating
+        assert candidates == ['custom model', 'open call']
+        assert found == {'custom model': 'Modelo personalizado', 'open call': 'Convocatoria  ABIERTA'}
+
+    def test_match_phrases_fuzzy_matches(self):
+        """
+        A keyterm without an exact match is matched to the target keyterm of its unit its translation is closest to
+        """
+        unit_keyterms = [([('custom models', 0.5), ('open call', 0.4)],
+                          [('modelos personalizados', 0.5), ('fecha limite', 0.4)]),
+                         ([('open call', 0.5)], [('convocatoria abierta', 0.5)])]
+        translations = {'custom models': 'los modelos personalizados', 'open call': 'convocatoria abierta'}
+
+        assert match_phrases(unit_keyterms, translations) == {'open call': 'convocatoria abierta'}
+        assert match_phrases(unit_keyterms, translations, fuzzy_threshold=60) == {
+            'open call': 'convocatoria abierta', 'custom models': 'modelos personalizados'}
+        assert match_phrases(unit_keyterms, translations, fuzzy_threshold=99) == {'open call': 'convocatoria abierta'}
+
+    def test_translate_keyterms_in_batches(self):
+        """
+        The keyterms are translated in one request per batch, and cached keyterms are not sent again
+        """
+        keyterms = [f'custom model {i}' for i in range(150)]
+        metrics = Metrics()
+        with tempfile.TemporaryDirectory() as tmp, TranslatorStub() as stub, \
+                TranslationClient('key', 'westeurope', stub.endpoint) as translator:
+            cache = TranslationCache(os.path.join(tmp, 'cache.sqlite'))
+            translations = translate_keyterms(keyterms[:120], 'es', 'general', translator, cache, metrics)
+            assert stub.requests == 2
+            translations.update(translate_keyterms(keyterms, 'es', 'general', translator, cache, metrics))
+            assert stub.requests == 3
+            cache.close()
+
+        assert translations == {keyterm: keyterm.upper() for keyterm in keyterms}
+        assert metrics.counter('translation_cache_total', result='hit') == 120
+        assert metrics.counter('translation_cache_total', result='miss') == 150
+
+    def test_legacy_dictionary_is_imported_once(self):
+        """
+        A new phrase dictionary imports the legacy comma separated file next to it, keeping commas in target phrases
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            with open(os.path.join(tmp, 'es_phrase_dictionary.txt'), 'w', encoding='utf-8') as legacy:
+                legacy.write('custom model, modelo personalizado\n\nopen call, convocatoria, abierta')
+
+            with open_phrase_dictionary(tmp, 'es') as phrases:
+                assert list(phrases.items()) == [('custom model', 'modelo personalizado'),
+                                                 ('open call', 'convocatoria, abierta')]
+                phrases.add_many([('new phrase', 'frase nueva')])
+            with open_phrase_dictionary(tmp, 'es') as phrases:
+                assert len(phrases) == 3
+
+
+class TestPhraseDictionaryStore(TestCase):
+
+    def test_lookups_keep_case_variants(self):
+        """
+        Whitespace variants of a phrase share one entry and the first target phrase added is kept, the dictionary is
+        case sensitive so case variants are entries of their own
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            with PhraseDictionary(os.path.join(tmp, 'es.sqlite')) as phrases:
+                assert phrases.add_many([('custom  model', 'modelo personalizado'), (' custom model', 'otro')]) == 1
+                assert phrases.add_many([('Custom Model', 'Modelo personalizado'), ('open call', 'convocatoria')]) == 2
+                assert 'custom model' in phrases
+                assert 'CUSTOM MODEL' not in phrases
+                assert phrases.get(' custom\tmodel ') == 'modelo personalizado'
+                assert phrases.get('Custom Model') == 'Modelo personalizado'
+                assert phrases.get('model') is None
+                assert list(phrases.items()) == [('custom model', 'modelo personalizado'),
+                                                 ('Custom Model', 'Modelo personalizado'),
+                                                 ('open call', 'convocatoria')]
+
+    def test_export_text_writes_aligned_files(self):
+        """
+        The export is a pair of line aligned files, a comma in a phrase is kept as it is
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            with PhraseDictionary(os.path.join(tmp, 'es.sqlite')) as phrases:
+                phrases.add_many([('custom model', 'modelo personalizado'),
+                                  ('terms, conditions', 'términos, condiciones')])
+                source_file, target_file = os.path.join(tmp, 'en.txt'), os.path.join(tmp, 'es.txt')
+                assert phrases.export_text(source_file, target_file) == 2
+
+            assert sorted(os.listdir(tmp)) == ['en.txt', 'es.sqlite', 'es.txt']
+            with open(source_file, encoding='utf-8') as source, open(target_file, encoding='utf-8') as target:
+                assert source.read() == 'custom model\nterms, conditions\n'
+                assert target.read() == 'modelo personalizado\ntérminos, condiciones\n'
+
+    def test_concurrent_workers_add_each_phrase_once(self):
+        """
+        Workers adding the same phrases to one dictionary through their own connections add each of them exactly once
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            dictionary_file = os.path.join(tmp, 'es.sqlite')
+            PhraseDictionary(dictionary_file).close()
+            with ThreadPoolExecutor(3) as executor:
+                added = list(executor.map(add_phrases, [(dictionary_file, worker) for worker in range(3)]))
+
+            assert sum(added) == 20
+            with PhraseDictionary(dictionary_file, read_only=True) as phrases:
+                assert len(phrases) == 20
@@ -0,0 +1,106 @@
+import json
+import os
+import tempfile
+from html.parser import HTMLParser
+from unittest import TestCase, skipUnless
+
+import pandas as pd
+
+from common.reports import CSVReport, HTMLReport, JSONLReport, TextReport, open_table_reports
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+COLUMNS = ['Source', 'Target', 'general_score', 'general_sentence']
+ROWS = [['Hello, "world"', 'Hola, "mundo"', 45.5, 'Hola mundo'],
+        ['<b>Bold</b> & co', '<b>Negrita</b> & co', 0.0, ''],
+        ['Two\nlines', 'Dos\nlíneas', 100.0, 'Dos\nlíneas']]
+
+
+class TextCollector(HTMLParser):
+
+    def __init__(self):
+        super().__init__()
+        self.cells = []
+
+    def handle_data(self, data):
+        self.cells.append(data)
+
+
+class TestReports(TestCase):
+
+    def test_csv_matches_pandas(self):
+        """
+        The streamed CSV is read back exactly as the DataFrame it replaces
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'report.csv')
+            with CSVReport(path, COLUMNS) as report:
+                for row in ROWS:
+                    report.write_row(row)
+            expected = pd.DataFrame(ROWS, columns=COLUMNS)
+            expected.to_csv(os.path.join(tmp, 'expected.csv'), sep=',')
+
+            with open(path, 'rb') as streamed, open(os.path.join(tmp, 'expected.csv'), 'rb') as written:
+                assert streamed.read() == written.read()
+
+    def test_html_is_escaped(self):
+        """
+        Markup in the sentences is escaped and the source table comes before the translation table
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'report.html')
+            with HTMLReport(path, 'MT_<doc>', 'source "en".pdf', 'target.pdf') as report:
+                for source, target, _, translation in ROWS:
+                    report.write_row(source, target, translation)
+            with open(path) as html:
+                content = html.read()
+
+        assert '<b>' not in content
+        assert content.count('<table') == content.count('</table>') == 2
+        parser = TextCollector()
+        parser.feed(content)
+        cells = parser.cells
+        assert cells[0] == 'MT_<doc>'
+        assert 'ENU: <b>Bold</b> & co' in cells
+        assert cells.index('ENU: Hello, "world"') < cells.index('target.pdf') < cells.index('MT: Hola mundo')
+
+    def test_text_and_jsonl(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            with TextReport(os.path.join(tmp, 'report.txt')) as report:
+                for row in ROWS[:2]:
+                    report.write_row(row[3])
+            with JSONLReport(os.path.join(tmp, 'report.jsonl'), COLUMNS) as report:
+                for row in ROWS:
+                    report.write_row(row)
+
+            with open(os.path.join(tmp, 'report.txt')) as text:
+                assert text.read() == 'Hola mundo\n'
+            with open(os.path.join(tmp, 'report.jsonl')) as jsonl:
+                assert [json.loads(line) for line in jsonl] == [dict(zip(COLUMNS, row)) for row in ROWS]
+
+    def test_reports_replace_earlier_runs(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            for run in range(2):
+                reports = open_table_reports(os.path.join(tmp, 'report'), COLUMNS, ['csv', 'html', 'jsonl'])
+                assert len(reports) == 2
+                for report in reports:
+                    report.write_row(ROWS[run])
+                    report.close()
+
+            assert len(pd.read_csv(os.path.join(tmp, 'report.csv'), index_col=0)) == 1
+            assert len(pd.read_json(os.path.join(tmp, 'report.jsonl'), lines=True)) == 1
+
+    @skipUnless(pyarrow, 'pyarrow is not installed')
+    def test_parquet_row_groups(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'report')
+            reports = open_table_reports(path, COLUMNS, ['parquet'])
+            reports[0].row_group = 2
+            for row in ROWS:
+                reports[0].write_row(row)
+            reports[0].close()
+
+            assert pd.read_parquet(path + '.parquet').equals(pd.DataFrame(ROWS, columns=COLUMNS))
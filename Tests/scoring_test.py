@@ -0,0 +1,124 @@
+import os
+from unittest import TestCase
+
+import numpy as np
+import sacrebleu
+
+from common.scoring import METRICS, ReferenceStatistics, score_translations, tokenize_13a, translation_edit_rate
+
+DATA = os.path.join('Tests', 'Data', 'scoring')
+
+
+def read_lines(name):
+    with open(os.path.join(DATA, name)) as document:
+        return document.read().split('\n')[:-1]
+
+
+class TestScoring(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.references = read_lines('reference.txt')
+        cls.hypotheses = {'model_a': read_lines('model_a.txt'), 'model_b': read_lines('model_b.txt')}
+
+    def test_tokenize_13a(self):
+        tokenize = sacrebleu.TOKENIZERS['13a']
+        for sentence in self.references + self.hypotheses['model_a'] + ['a&quot;b &amp; c-\n1.5, 2,3 (x).']:
+            assert tokenize_13a(sentence) == tokenize(sentence).split()
+
+    def test_corpus_scores_match_sacrebleu(self):
+        _, corpus_scores = score_translations(self.references, self.hypotheses, METRICS, samples=0)
+        for model, hypotheses in self.hypotheses.items():
+            bleu = sacrebleu.corpus_bleu(hypotheses, [self.references]).score
+            chrf = sacrebleu.corpus_chrf(hypotheses, self.references).score * 100
+            assert abs(corpus_scores.loc[model, 'bleu'] - bleu) < 1e-9
+            assert abs(corpus_scores.loc[model, 'chrf'] - chrf) < 1e-9
+        assert np.allclose(corpus_scores['ter'], [8.957952468007313, 42.23034734917733])
+
+    def test_sentence_scores_match_sacrebleu(self):
+        sentence_scores, _ = score_translations(self.references, self.hypotheses, ['bleu', 'chrf'], samples=0)
+        for model, hypotheses in self.hypotheses.items():
+            for i, (hypothesis, reference) in enumerate(zip(hypotheses, self.references)):
+                bleu = sacrebleu.corpus_bleu([hypothesis], [[reference]], use_effective_order=True).score
+                chrf = sacrebleu.corpus_chrf([hypothesis], [reference]).score * 100
+                assert abs(sentence_scores[f'{model}_bleu'][i] - bleu) < 1e-9
+                assert abs(sentence_scores[f'{model}_chrf'][i] - chrf) < 1e-9
+        assert abs(sentence_scores['model_a_bleu'][7] - 100) < 1e-9
+        assert sentence_scores['model_b_bleu'][11] == 0
+
+    def test_translation_edit_rate(self):
+        assert translation_edit_rate('a b c d e'.split(), 'c d e a b'.split()) == 1
+        assert translation_edit_rate('the cat sat'.split(), 'the cat sat'.split()) == 0
+        assert translation_edit_rate('the big cat sat'.split(), 'the cat sat down'.split()) == 2
+        assert translation_edit_rate([], 'the cat'.split()) == 2
+        assert translation_edit_rate('the cat'.split(), []) == 2
+
+        sentence_scores, corpus_scores = score_translations(['c d e a b', ''], {'model': ['a b c d e', '']}, ['ter'],
+                                                            samples=0)
+        assert list(sentence_scores['model_ter']) == [20, 0]
+        assert corpus_scores.loc['model', 'ter'] == 20
+
+    def test_translation_edit_rate_matches_sacrebleu(self):
+        try:
+            from sacrebleu.metrics import TER
+        except ImportError:
+            self.skipTest('TER needs sacrebleu 2')
+        ter = TER()
+        sentence_scores, corpus_scores = score_translations(self.references, self.hypotheses, ['ter'], samples=0)
+        for model, hypotheses in self.hypotheses.items():
+            for i, (hypothesis, reference) in enumerate(zip(hypotheses, self.references)):
+                score = ter.sentence_score(hypothesis, [reference]).score
+                assert abs(sentence_scores[f'{model}_ter'][i] - score) < 1e-9
+            assert abs(corpus_scores.loc[model, 'ter'] - ter.corpus_score(hypotheses, [self.references]).score) < 1e-9
+
+    def test_blank_references(self):
+        references = ['', '   ', 'the cat sat on the mat']
+        hypotheses = {'model': ['a cat', 'the dog', 'the cat sat on a mat']}
+        sentence_scores, corpus_scores = score_translations(references, hypotheses, METRICS, samples=0)
+        for i, (hypothesis, reference) in enumerate(zip(hypotheses['model'], references)):
+            bleu = sacrebleu.corpus_bleu([hypothesis], [[reference]], use_effective_order=True).score
+            chrf = sacrebleu.corpus_chrf([hypothesis], [reference]).score * 100
+            assert abs(sentence_scores['model_bleu'][i] - bleu) < 1e-9
+            assert abs(sentence_scores['model_chrf'][i] - chrf) < 1e-9
+        # Every edit of a hypothesis against a blank reference counts in full
+        assert list(sentence_scores['model_ter'][:2]) == [100, 100]
+
+        bleu = sacrebleu.corpus_bleu(hypotheses['model'], [references]).score
+        chrf = sacrebleu.corpus_chrf(hypotheses['model'], references).score * 100
+        assert abs(corpus_scores.loc['model', 'bleu'] - bleu) < 1e-9
+        assert abs(corpus_scores.loc['model', 'chrf'] - chrf) < 1e-9
+
+        # Not a single reference has an n-gram
+        sentence_scores, corpus_scores = score_translations(['', ' '], {'model': ['a cat', '']}, METRICS, samples=0)
+        assert list(sentence_scores['model_chrf']) == [0, 0] and corpus_scores.loc['model', 'chrf'] == 0
+        assert corpus_scores.loc['model', 'bleu'] == 0 and list(sentence_scores['model_ter']) == [100, 0]
+
+    def test_paired_bootstrap(self):
+        hypotheses = dict(self.hypotheses, model_c=self.hypotheses['model_a'][:-1] + self.references[-1:])
+        _, corpus_scores = score_translations(self.references, hypotheses, METRICS, samples=200, seed=1)
+        _, repeated = score_translations(self.references, hypotheses, METRICS, samples=200, seed=1)
+        assert corpus_scores.equals(repeated)
+
+        for metric in ('bleu', 'chrf', 'ter'):
+            assert np.isnan(corpus_scores.loc['model_a', f'{metric}_p'])
+            assert corpus_scores.loc['model_b', f'{metric}_p'] < 0.05
+            assert corpus_scores.loc['model_c', f'{metric}_p'] > 0.05
+            assert (corpus_scores[f'{metric}_ci'] > 0).all()
+
+        _, against_b = score_translations(self.references, hypotheses, ['bleu'], baseline='model_b', samples=200)
+        assert np.isnan(against_b.loc['model_b', 'bleu_p'])
+
+    def test_reference_statistics_reused(self):
+        references = ReferenceStatistics(self.references)
+        first, _ = score_translations(references, {'model_a': self.hypotheses['model_a']}, METRICS, samples=0)
+        second, _ = score_translations(references, self.hypotheses, METRICS, samples=0)
+        assert first['model_a_bleu'].equals(second['model_a_bleu'])
+        assert first['model_a_ter'].equals(second['model_a_ter'])
+
+    def test_invalid_input(self):
+        with self.assertRaises(ValueError):
+            score_translations(self.references, {'model': self.hypotheses['model_a'][1:]})
+        with self.assertRaises(ValueError):
+            ReferenceStatistics(self.references, ['bleu']).statistics('ter', self.hypotheses['model_a'])
+        sentence_scores, corpus_scores = score_translations(self.references, {})
+        assert sentence_scores.empty and corpus_scores.empty
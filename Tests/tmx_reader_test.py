@@ -0,0 +1,56 @@
+import os
+import tempfile
+from unittest import TestCase, mock
+
+from translate.storage.tmx import tmxfile
+
+from common.tmx_reader import iter_tmx_units, count_tmx_units, repair_xml
+
+
+class TestTmxReader(TestCase):
+
+    def test_iter_tmx_units_utf16(self):
+        """
+        Streams the utf-16 test memory, including the unit properties
+        """
+        units = list(iter_tmx_units('Tests/Data/en_es.tmx', 'en', 'es'))
+
+        assert count_tmx_units('Tests/Data/en_es.tmx') == 2
+        assert len(units) == 2
+        assert units[0].getid() == "CONVENTION ON A COMMON TRANSIT PROCEDURE"
+        assert units[0].gettarget() == "CONVENIO RELATIVO A UN RÉGIMEN COMÚN DE TRÁNSITO"
+        assert units[0].props == {'Txt::Doc. No.': '21987A0813(01)'}
+
+    def test_iter_tmx_units_matches_translate_toolkit(self):
+        """
+        The streaming reader returns the same units as the full translate-toolkit load, and seeks to a batch
+        """
+        file = 'Data/train/EAC_FORMS.en_fr.tmx'
+        with open(file, 'rb') as tmx:
+            expected = [(unit.getid(), unit.gettarget()) for unit in tmxfile(tmx).getunits()]
+
+        assert count_tmx_units(file) == len(expected)
+        assert [(unit.source, unit.target) for unit in iter_tmx_units(file)] == expected
+
+        batch = list(iter_tmx_units(file, start=1000, end=1010))
+        assert [unit.index for unit in batch] == list(range(1000, 1010))
+        assert [(unit.source, unit.target) for unit in batch] == expected[1000:1010]
+
+    def test_iter_tmx_units_repairs_bad_encodings(self):
+        """
+        Invalid character references and stray ampersands are repaired, including across chunk boundaries
+        """
+        units = ''.join(f'<tu><tuv xml:lang="en"><seg>Fish & chips {i}&#x1E;</seg></tuv><tuv xml:lang="fr"><seg>'
+                        f'Poisson &amp; frites {i}</seg></tuv></tu>\n' for i in range(20))
+        with tempfile.TemporaryDirectory() as tmp:
+            file = os.path.join(tmp, 'bad.tmx')
+            with open(file, 'w', encoding='utf-8') as tmx:
+                tmx.write('<?xml version="1.0" encoding="utf-8"?><tmx version="1.4"><header/><body>\n' + units +
+                          '</body></tmx>')
+
+            with mock.patch('common.tmx_reader.CHUNK_SIZE', 7):
+                repaired = list(iter_tmx_units(file, repair=True))
+
+        assert repair_xml('A &#x1E;&#31;B & C &amp; D &#233;\x1e') == 'A B &amp; C &amp; D &#233;'
+        assert [(unit.source, unit.target) for unit in repaired] == [
+            ('Fish & chips ' + str(i), 'Poisson & frites ' + str(i)) for i in range(20)]
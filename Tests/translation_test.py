@@ -0,0 +1,249 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from common.common import batch_segments, call_translation_batched, TranslationCache, RunJournal
+from common.translator import TranslationClient
+from Benchmarks.translator_stub import TranslatorStub
+from recipes.Evaluation import translator_pipeline
+
+
+class TestBatchedTranslation(TestCase):
+
+    def test_batch_segments_limits(self):
+        """
+        Batches must respect both the element and the character limits and keep every segment index
+        """
+        segments = ['a' * 10] * 250 + ['b' * 4000] * 5
+        batches = list(batch_segments(segments, batch_size=100, max_characters=10000))
+
+        assert [i for batch in batches for i, _ in batch] == list(range(len(segments)))
+        assert all(len(batch) <= 100 for batch in batches)
+        assert all(sum(len(text) for _, text in batch) <= 10000 for batch in batches)
+        assert len(batches) == 5
+
+    def test_call_translation_batched_round_trips(self):
+        """
+        Translates against a local stub service and checks the responses map back to the sentence indices
+        """
+        segments = ['sentence ' + str(i) for i in range(250)]
+
+        with TranslatorStub() as stub:
+            translated = call_translation_batched(segments, 'es', 'general', 'key', 'westeurope',
+                                                  batch_size=100, endpoint=stub.endpoint)
+
+        assert translated == [segment.upper() for segment in segments]
+        assert stub.requests == 3  # One request per sentence would have taken 250 round trips
+        assert stub.elements == len(segments)
+
+
+class TestTranslationClient(TestCase):
+
+    def test_translate_categories_concurrently(self):
+        """
+        All categories are translated at once, in order, within the concurrency limit
+        """
+        segments = ['sentence ' + str(i) for i in range(200)]
+        categories = ['model-' + str(i) for i in range(5)]
+
+        with TranslatorStub(latency=0.2) as stub, TranslationClient('key', 'westeurope', stub.endpoint,
+                                                                     max_concurrency=4) as client:
+            results = client.translate_categories(segments, 'es', categories, batch_size=100)
+
+        assert results == [[segment.upper() for segment in segments]] * len(categories)
+        assert stub.requests == 10
+        assert stub.max_in_flight <= 4
+        stats = client.stats.snapshot()
+        assert stats['segments'] == len(segments) * len(categories)
+        assert stats['elapsed'] < 10 * 0.2  # Serial requests would take at least two seconds
+        assert stats['latency_p50'] >= 0.2
+
+    def test_translate_retries_throttled_requests(self):
+        """
+        429 responses are retried after Retry-After and counted
+        """
+        with TranslatorStub(throttle_first=2, retry_after='0') as stub, \
+                TranslationClient('key', 'westeurope', stub.endpoint, backoff=0.01) as client:
+            translated = client.translate(['hola', 'mundo'], 'es', 'general')
+
+        assert translated == ['HOLA', 'MUNDO']
+        assert stub.throttled == 2
+        stats = client.stats.snapshot()
+        assert stats['throttled'] == 2
+        assert stats['retries'] == 2
+        assert stats['requests'] == 3
+        assert stats['failures'] == 0
+
+    def test_translate_retries_truncated_responses(self):
+        """
+        A 200 response whose body is cut short is retried rather than raised
+        """
+        with TranslatorStub(truncate_first=1) as stub, \
+                TranslationClient('key', 'westeurope', stub.endpoint, backoff=0.01) as client:
+            translated = client.translate(['hola', 'mundo'], 'es', 'general')
+
+        assert translated == ['HOLA', 'MUNDO']
+        assert stub.truncated == 1
+        stats = client.stats.snapshot()
+        assert stats['retries'] == 1 and stats['requests'] == 2 and stats['failures'] == 0
+
+    def test_retry_after_is_clamped(self):
+        client = TranslationClient('key', 'westeurope', backoff=0.5, max_backoff=60)
+        assert client._retry_delay(0, '86400') <= 60
+        assert 2 <= client._retry_delay(0, '2') <= 2.5
+        assert client._retry_delay(0, '-5') <= 0.5
+        client.close()
+
+    def test_translate_categories_through_random_failures(self):
+        """
+        Randomly throttled and failed requests are retried until every batch is translated
+        """
+        segments = ['sentence ' + str(i) for i in range(100)]
+        with TranslatorStub(throttle_rate=0.2, error_rate=0.2, seed=1) as stub, \
+                TranslationClient('key', 'westeurope', stub.endpoint, backoff=0.001, max_retries=20) as client:
+            results = client.translate_categories(segments, 'es', ['general', 'custom'], batch_size=10)
+
+        assert results == [[segment.upper() for segment in segments]] * 2
+        assert stub.throttled > 0 and stub.errors > 0
+        stats = client.stats.snapshot()
+        assert stats['requests'] == stub.requests == 20 + stub.throttled + stub.errors
+        assert stats['failures'] == 0
+
+
+class TestTranslationCache(TestCase):
+
+    def test_cache_hits_and_eviction(self):
+        """
+        Lookups are normalised on whitespace, keyed on language and category, and evicted above max_entries
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'cache.sqlite')
+            cache = TranslationCache(path)
+            cache.put('hello  world ', 'es', 'general', 'hola mundo')
+            assert cache.get('hello world', 'es', 'general') == 'hola mundo'
+            assert cache.get('hello world', 'fr', 'general') is None
+            assert cache.get('hello world', 'es', 'custom') is None
+            assert (cache.hits, cache.misses) == (1, 2)
+            cache.close()
+
+            read_only = TranslationCache(path, read_only=True)
+            read_only.put('goodbye', 'es', 'general', 'adios')
+            assert read_only.get('goodbye', 'es', 'general') is None
+            assert read_only.get('hello world', 'es', 'general') == 'hola mundo'
+            read_only.close()
+
+            cache = TranslationCache(path, max_entries=1)
+            cache.put('goodbye', 'es', 'general', 'adios')
+            cache.evict()
+            assert cache.get('goodbye', 'es', 'general') == 'adios'
+            assert cache.get('hello world', 'es', 'general') is None
+            cache.close()
+
+    def test_entry_points_open_the_cache_with_the_eviction_settings(self):
+        """
+        The evaluation entry points evict with CACHE_MAX_ENTRIES and CACHE_MAX_AGE_DAYS unless the cache is read only
+        """
+        config = translator_pipeline.Config
+        settings = config.CACHE_MAX_ENTRIES, config.CACHE_MAX_AGE_DAYS
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'cache.sqlite')
+            for text, translation in (('hello', 'hola'), ('goodbye', 'adios')):
+                cache = TranslationCache(path)
+                cache.put(text, 'es', 'general', translation)
+                cache.close()
+            try:
+                config.CACHE_MAX_ENTRIES, config.CACHE_MAX_AGE_DAYS = '1', None
+                read_only = translator_pipeline.open_translation_cache(path, read_only=True)
+                assert read_only.get('hello', 'es', 'general') == 'hola'
+                read_only.close()
+
+                cache = translator_pipeline.open_translation_cache(path)
+                assert cache.get('hello', 'es', 'general') is None
+                assert cache.get('goodbye', 'es', 'general') == 'adios'
+                cache.close()
+            finally:
+                config.CACHE_MAX_ENTRIES, config.CACHE_MAX_AGE_DAYS = settings
+        assert translator_pipeline.open_translation_cache(None) is None
+
+    def test_client_skips_cached_translations(self):
+        """
+        A second run over the same segments is served from the cache without any requests
+        """
+        segments = ['sentence ' + str(i) for i in range(150)]
+
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = TranslationCache(os.path.join(tmp, 'cache.sqlite'))
+            with TranslatorStub() as stub:
+                with TranslationClient('key', 'westeurope', stub.endpoint, cache=cache) as client:
+                    first = client.translate_categories(segments[:100], 'es', ['general'])
+                with TranslationClient('key', 'westeurope', stub.endpoint, cache=cache) as client:
+                    second = client.translate_categories(segments, 'es', ['general'])
+            cache.close()
+
+        assert first[0] == second[0][:100]
+        assert second[0] == [segment.upper() for segment in segments]
+        assert stub.requests == 2  # The second run only sends the 50 segments it has not seen
+        assert stub.elements == len(segments)
+        assert cache.hits == 100
+
+
+class TestRunJournal(TestCase):
+
+    def translate(self, journal, segments, categories, throttle_first=0):
+        """
+        Translates against a local stub, journaling as the batches complete, without retrying throttled requests
+        """
+        with TranslatorStub(throttle_first=throttle_first) as stub, \
+                TranslationClient('key', 'westeurope', stub.endpoint, max_concurrency=1, max_retries=0) as client:
+            client.translate_categories(segments, 'es', categories, 50,
+                                        [journal.completed(category_id) for category_id in categories],
+                                        lambda cat_ind, batch: journal.record(categories[cat_ind], batch))
+        return stub
+
+    def test_resume_only_sends_missing_translations(self):
+        """
+        A run that loses a batch is resumed from its journal, only the lost batch is sent again
+        """
+        segments = ['sentence ' + str(i) for i in range(200)]
+        categories = ['general', 'custom']
+        run = {'source_hash': 'abc', 'categories': categories}
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'run.jsonl')
+            with RunJournal(path, run) as journal:
+                stub = self.translate(journal, segments, categories, throttle_first=1)
+                assert stub.requests == 8
+                assert len(journal.translations) == 350
+
+            with RunJournal(path, run, resume=True) as journal:
+                assert len(journal.translations) == 350
+                stub = self.translate(journal, segments, categories)
+                translations = journal.category_translations(categories, len(segments))
+
+            assert stub.requests == 1
+            assert stub.elements == 50
+            assert translations == [[segment.upper() for segment in segments]] * len(categories)
+
+            # Without --resume the journal starts again
+            with RunJournal(path, run) as journal:
+                assert journal.translations == {}
+
+    def test_journal_recovers_from_a_torn_write(self):
+        """
+        A record cut short by a crash is dropped, a journal of another run is refused
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'run.jsonl')
+            with RunJournal(path, {'run': 1}) as journal:
+                journal.record('general', [(0, 'HOLA'), (1, 'MUNDO')])
+            with open(path, 'a') as journal_file:
+                journal_file.write('{"c": "general", "i": 2, "t": "AD')
+
+            with RunJournal(path, {'run': 1}, resume=True) as journal:
+                assert journal.completed('general') == {0: 'HOLA', 1: 'MUNDO'}
+                journal.record('general', [(2, 'ADIOS')])
+            with RunJournal(path, {'run': 1}, resume=True) as journal:
+                assert journal.category_translations(['general'], 3) == [['HOLA', 'MUNDO', 'ADIOS']]
+
+            with self.assertRaises(ValueError):
+                RunJournal(path, {'run': 2}, resume=True)
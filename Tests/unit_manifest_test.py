@@ -0,0 +1,136 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from common.metrics import Metrics
+from common.unit_manifest import UnitManifest
+from Benchmarks.translator_stub import TranslatorStub
+from recipes.Analysis.Phrase_Dictionary import build_phrase_dictionary_spacy as builder
+from recipes.Benchmarks.corpora import write_tmx
+
+
+class FakeClient:
+    """
+    Stands in for the keyterm server, the keyterms of a text are the text itself
+    """
+
+    def __init__(self):
+        self.texts = []
+
+    def keyterms(self, source_texts, target_texts):
+        self.texts += source_texts
+        return [([(source.lower(), 1.0)], [(target.lower(), 1.0)])
+                for source, target in zip(source_texts, target_texts)]
+
+
+def unit_pairs(start, end):
+    return [(f'custom model {i}', f'CUSTOM MODEL {i}') for i in range(start, end)]
+
+
+class TestUnitManifest(TestCase):
+
+    def test_units_are_recorded_per_models_and_category(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'manifest.sqlite')
+            first, second = UnitManifest.fingerprint('A  unit', 'Une unité'), UnitManifest.fingerprint('B', 'C')
+            assert first == UnitManifest.fingerprint(' A unit', 'Une\tunité')
+            with UnitManifest(path, 'en_core_web_md', 'fr_core_news_md', 'general') as manifest:
+                manifest.record([first], [(first, [('unit', 0.5)], [('unité', 0.5)])])
+                assert manifest.processed([first, second]) == {first}
+                assert manifest.keyterms([first, second]) == {first: ([('unit', 0.5)], [('unité', 0.5)])}
+            # Another category mines the unit again but reuses the keyterms of the same models
+            with UnitManifest(path, 'en_core_web_md', 'fr_core_news_md', 'custom') as manifest:
+                assert manifest.processed([first]) == set()
+                assert first in manifest.keyterms([first])
+            with UnitManifest(path, 'en_core_web_lg', 'fr_core_news_md', 'general') as manifest:
+                assert manifest.processed([first]) == set() and manifest.keyterms([first]) == {}
+
+    def test_pending_units_keep_their_order(self):
+        """
+        Units with kept keyterms are not parsed and are streamed in order with the units that are
+        """
+        with tempfile.TemporaryDirectory() as temp_dir:
+            memory = os.path.join(temp_dir, 'memory.tmx')
+            write_tmx(memory, unit_pairs(0, 10))
+            units = list(builder.iter_tmx_units(memory))
+            fingerprints = [UnitManifest.fingerprint(unit.getid(), unit.gettarget()) for unit in units]
+            client = FakeClient()
+            metrics = Metrics()
+            with UnitManifest(os.path.join(temp_dir, 'manifest.sqlite'), 'en', 'fr', 'general') as manifest:
+                manifest.record(fingerprints[:2], [(fingerprints[5], [('kept', 1.0)], [('gardé', 1.0)])])
+                results = list(builder.parse_pending_units(
+                    builder.pending_units(units, manifest, 3, cached_keyterms=True, metrics=metrics),
+                    lambda pending: builder.request_unit_keyterms(pending, client, 3)))
+
+        assert [unit.index for unit, _, _, _, _ in results] == list(range(2, 10))
+        assert [parsed for _, _, _, _, parsed in results] == [True] * 3 + [False] + [True] * 4
+        assert results[3][2:4] == ([('kept', 1.0)], [('gardé', 1.0)])
+        assert client.texts == [source for source, _ in unit_pairs(2, 10) if source != 'custom model 5']
+        assert metrics.counter('units_skipped_total') == 2
+
+
+class TestIncrementalMining(TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.memory = os.path.join(self.temp_dir.name, 'memory.tmx')
+        self.manifest = os.path.join(self.temp_dir.name, 'manifest.sqlite')
+        self.dictionary = os.path.join(self.temp_dir.name, 'fr_phrase_dictionary.sqlite')
+        self.endpoint = builder.Config.TRANSLATOR_ENDPOINT
+
+    def tearDown(self):
+        builder.Config.TRANSLATOR_ENDPOINT = self.endpoint
+        builder._worker.clear()
+        self.temp_dir.cleanup()
+
+    def mine(self, category_id, units, cache_keyterms=False, **stub_options):
+        """
+        :param stub_options: The options of the stub Translator of the run
+        :return: The texts sent to the keyterm server, the metrics and the translation requests of a run
+        """
+        builder.init_worker('en', 'fr', self.dictionary, 'fr', category_id, None, False, 'unused.sock', self.manifest,
+                            cache_keyterms)
+        client = builder._worker['client'] = FakeClient()
+        with TranslatorStub(**stub_options) as stub:
+            builder.Config.TRANSLATOR_ENDPOINT = stub.endpoint
+            added, snapshot = builder.process_shard((self.memory, 0, units, 4, 1))
+        builder._worker['phrases'].close()
+        builder._worker['manifest'].close()
+        metrics = Metrics()
+        metrics.merge(snapshot)
+        return client.texts, added, metrics, stub.requests
+
+    def test_rerun_mines_only_new_and_changed_units(self):
+        write_tmx(self.memory, unit_pairs(0, 10))
+        texts, added, metrics, requests = self.mine('general', 10, cache_keyterms=True)
+        # The keyterms of each batch of four units are translated in one request
+        assert len(texts) == 10 and added == 10 and requests == 3
+
+        # The memory grew by five units and one unit was edited
+        pairs = unit_pairs(0, 15)
+        pairs[3] = ('custom model three', 'CUSTOM MODEL THREE')
+        write_tmx(self.memory, pairs)
+        texts, added, metrics, requests = self.mine('general', 15, cache_keyterms=True)
+        assert texts == ['custom model three'] + [source for source, _ in unit_pairs(10, 15)]
+        assert added == 6 and requests == 2
+        assert metrics.counter('units_skipped_total') == 9 and metrics.counter('units_total') == 6
+
+        # Another category mines every unit again from the kept keyterms without parsing them
+        texts, added, metrics, requests = self.mine('custom', 15, cache_keyterms=True)
+        assert texts == [] and added == 0 and requests == 0 and metrics.counter('units_total') == 15
+        assert metrics.counter('keyterm_cache_total', result='hit') == 15
+
+    def test_units_with_failed_translations_are_mined_again(self):
+        """
+        A unit whose keyterms could not be translated, e.g. past the translation quota, is not recorded as mined
+        """
+        write_tmx(self.memory, unit_pairs(0, 4))
+        # Every request is throttled, so the batch fails after all its retries
+        texts, added, metrics, _ = self.mine('general', 4, cache_keyterms=True, throttle_rate=1.0, retry_after='0')
+        assert len(texts) == 4 and added == 0
+        assert metrics.counter('units_incomplete_total') == 4
+
+        # The keyterms were kept, so the rerun translates them without parsing the units again
+        texts, added, metrics, requests = self.mine('general', 4, cache_keyterms=True)
+        assert texts == [] and added == 4 and requests == 1
+        assert metrics.counter('units_skipped_total') == 0 and metrics.counter('units_incomplete_total') == 0
@@ -0,0 +1,49 @@
+import argparse
+import importlib
+import sys
+
+# Each command runs the main function of its entry point, which is only imported once the command is chosen so a
+# command pays for the dependencies of its own stage alone
+COMMANDS = {
+    'extract': ('.Evaluation.stages', 'extract_main', 'Extract the text of a source and a reference pdf'),
+    'align': ('.Evaluation.stages', 'align_main', 'Sentence align a source and a reference text document'),
+    'translate': ('.Evaluation.stages', 'translate_main', 'Translate an aligned document against every model'),
+    'score': ('.Evaluation.score_translations', 'main', 'Score translations against a reference translation'),
+    'evaluate': ('.Evaluation.translator_pipeline', 'main', 'Run the whole evaluation pipeline on a document'),
+    'evaluate-directory': ('.Evaluation.evaluate_directory', 'main',
+                           'Evaluate folders of documents and build a model leaderboard'),
+    'phrases': ('.Analysis.Phrase_Dictionary.build_phrase_dictionary_spacy', 'main',
+                'Build a phrase dictionary from a translation memory'),
+    'keyterm-server': ('.Analysis.Phrase_Dictionary.keyterm_server', 'main',
+                       'Serve spaCy keyterms to the phrase dictionary builders from models loaded once'),
+    'datasets': ('.Analysis.Datasets.build_datasets', 'main',
+                 'Split a translation memory into train, test and tune datasets'),
+    'leakage': ('.Analysis.Datasets.build_leakage_index', 'main',
+                'Build a near duplicate index of the training memories and check test sets against it'),
+}
+
+
+def main(argv=None):
+    """
+    Runs a pipeline stage, e.g. python -m recipes align --source-text en.txt --reference-text fr.txt, the arguments
+    after the command are those of the stage's own entry point
+    :param argv: The command and its arguments, defaults to the command line
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    prog = 'python -m ' + (__package__ or 'recipes')
+    commands = '\n'.join(f'  {command:<20}{description}' for command, (_, _, description) in COMMANDS.items())
+    parser = argparse.ArgumentParser(prog=prog, usage='%(prog)s [-h] command [arguments]',
+                                     description=f'Custom machine translation recipes\n\ncommands:\n{commands}',
+                                     epilog='Run %(prog)s <command> --help for the arguments of a command',
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=list(COMMANDS), metavar='command',
+                        help='The pipeline stage to run')
+    args = parser.parse_args(argv[:1])
+
+    module, function, _ = COMMANDS[args.command]
+    sys.argv = [f'{prog} {args.command}'] + argv[1:]
+    getattr(importlib.import_module(module, __package__), function)()
+
+
+if __name__ == '__main__':
+    main()
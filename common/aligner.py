@@ -0,0 +1,712 @@
+import logging
+import math
+import os
+import re
+from collections import Counter
+from multiprocessing import Pool
+
+import numpy as np
+
+SEARCH_DEVIATION = 20  # Sentences either side of the diagonal the first length based search covers
+SEARCH_INCREMENT_RATIO = 1.5  # Growth of the search band between length based passes
+CONF_THRESHOLD = -20  # Log probability below which forward-backward nodes are pruned
+CONF_INCREMENT_RATIO = 1.15  # Loosening of the length based pruning threshold per pass
+HIGH_PROB_THRESHOLD = 0.99  # Length based matches above this probability train the word model
+EM_ITERATIONS = 4  # IBM Model 1 training iterations
+LEX_SIZE_CUTOFF = 5000  # Tokens kept per language in the word model, rarer tokens become (other)
+
+DELETE, INSERT, MATCH, CONTRACT, EXPAND = range(5)
+BEAD_TYPES = ('delete', 'insert', 'match', 'contract', 'expand')
+# The prior of each bead type as a negative log probability, 1-0, 0-1, 1-1, 2-1 and 1-2
+BEAD_SCORES = (-math.log(.01), -math.log(.01), -math.log(.94), -math.log(.02), -math.log(.02))
+
+SKIP_MARKER = b'*|*|*'  # Lines between a pair of these markers are left out of the alignment
+WORD_SEPARATOR = re.compile(rb'\s+\(?|\(|-|_')
+WORD_CHARACTER = re.compile(rb'\w')
+WORD_CORE = re.compile(rb'\W*(\w.*\w|\w)')
+NON_WORD = re.compile(rb'[^)]*')
+EMPTY = b'(empty)'
+OTHER = b'(other)'
+
+_worker = {}  # The word model shipped once to each worker process of align_document_pairs
+
+
+def _split_words(line):
+    """
+    Splits a line into words the way the Perl scripts do, Perl treats '0' as false so those words are dropped too
+    :param line: The line as bytes
+    :return: The list of words
+    """
+    return [word for word in WORD_SEPARATOR.split(line) if word and word != b'0']
+
+
+def _normalise_word(word):
+    """
+    :return: The lowercase word stripped of leading and trailing punctuation, as the word model sees it
+    """
+    if WORD_CHARACTER.search(word):
+        return WORD_CORE.search(word).group(1).lower()
+    return NON_WORD.match(word).group(0) or b'(null)'
+
+
+def read_sentences(file):
+    """
+    Reads the sentences of a document with one sentence per line, blank lines are not sentences
+    :param file: The document
+    :return: The list of words of each sentence
+    """
+    sentences = []
+    skipping = False
+    with open(file, 'rb') as lines:
+        for line in lines:
+            if line.endswith(b'\n'):
+                line = line[:-1]
+            if line == SKIP_MARKER:
+                skipping = not skipping
+                continue
+            if skipping:
+                continue
+            words = _split_words(line)
+            if words:
+                sentences.append(words)
+    return sentences
+
+
+def _select_lines(file, positions):
+    """
+    Picks sentences out of a document by position, counting sentences the way the Perl filter scripts do
+    :param file: The document
+    :param positions: The ascending sentence positions to pick
+    :return: The raw line of each position, with its line ending
+    """
+    selected = []
+    line = b''
+    file_position = 0
+    with open(file, 'rb') as lines:
+        for position in positions:
+            while file_position <= position:
+                line = lines.readline()
+                if not line:
+                    raise ValueError(f"Sentence {position} is past the end of {file}")
+                if _split_words(line):
+                    file_position += 1
+            selected.append(line)
+    return selected
+
+
+def _lookup(row, positions, default=-np.inf):
+    """
+    :param row: A (positions, values) pair for one row of the search, positions ascending
+    :param positions: The ascending positions to look up
+    :return: The values at positions, default where the row has no value
+    """
+    found = np.full(len(positions), default)
+    if row is None or len(row[0]) == 0 or len(positions) == 0:
+        return found
+    row_positions, values = row
+    first, last = int(row_positions[0]), int(row_positions[-1])
+    start, end = int(positions[0]), int(positions[-1])
+    if last - first + 1 == len(row_positions) and end - start + 1 == len(positions):
+        # Both are contiguous ranges, which is always the case for the length based search, so copy the overlap
+        low, high = max(first, start), min(last, end)
+        if low <= high:
+            found[low - start:high - start + 1] = values[low - first:high - first + 1]
+        return found
+    index = np.minimum(np.searchsorted(row_positions, positions), len(row_positions) - 1)
+    match = row_positions[index] == positions
+    found[match] = values[index[match]]
+    return found
+
+
+def _log_scan(base, step, floor=None):
+    """
+    Runs the in-row recurrence out[j] = log(exp(base[j]) + exp(out[j - 1] + step[j])) as a cumulative log-add.
+    Where out[j] does not exceed floor[j] it is pruned and does not carry over to out[j + 1]
+    :param base: The log probability of each cell from the other rows
+    :param step: The log probability of moving from the previous cell to each cell
+    :param floor: Optional pruning thresholds per cell
+    :return: The log probability of each cell and whether the cell was kept
+    """
+    out = np.full(len(base), -np.inf)
+    start = 0
+    while start < len(base):
+        cumulative = np.concatenate(([0.0], np.cumsum(step[start + 1:])))
+        with np.errstate(invalid='ignore'):
+            out[start:] = np.logaddexp.accumulate(base[start:] - cumulative) + cumulative
+        if floor is None:
+            break
+        # A pruned cell ends the chain, the cells after it are worked out again without it
+        pruned = np.flatnonzero(~(out[start:-1] > floor[start:-1]))
+        if len(pruned) == 0:
+            break
+        start += pruned[0] + 1
+        # The cells straight after a pruned cell only have their own base, skip past those that are pruned too
+        while start < len(base) - 1 and not base[start] > floor[start]:
+            out[start] = base[start]
+            start += 1
+    kept = np.ones(len(base), dtype=bool) if floor is None else out > floor
+    return out, kept
+
+
+def _runs(positions):
+    """
+    :return: The (start, end) slices of the runs of consecutive positions
+    """
+    breaks = np.flatnonzero(np.diff(positions) != 1) + 1
+    bounds = np.concatenate(([0], breaks, [len(positions)]))
+    return zip(bounds[:-1], bounds[1:])
+
+
+class _LengthModel:
+    """
+    The sentence length statistics shared by the length based and the word based alignment
+    """
+
+    def __init__(self, sentences_1, sentences_2):
+        self.n1 = len(sentences_1)
+        self.n2 = len(sentences_2)
+        if self.n1 == 0 or self.n2 == 0:
+            raise ValueError("Both documents need at least one sentence to align")
+        lengths_1 = np.array([len(words) for words in sentences_1])
+        lengths_2 = np.array([len(words) for words in sentences_2])
+        self.ratio = self.n2 / self.n1
+        self.mean_ratio = (lengths_2.sum() / self.n2) / (lengths_1.sum() / self.n1)
+
+        length_scores_1 = self._length_scores(lengths_1)
+        length_scores_2 = self._length_scores(lengths_2)
+        # Pad past both ends so the vectorised look ups of neighbouring sentences stay in bounds
+        self.lengths_1 = np.concatenate((lengths_1, [0, 0]))
+        self.lengths_2 = np.concatenate((lengths_2, [0, 0]))
+        self.scores_1 = np.concatenate((length_scores_1[lengths_1], [0, 0]))
+        self.scores_2 = np.concatenate((length_scores_2[lengths_2], [0, 0]))
+        self.log_factorials = np.concatenate(([0.0], np.cumsum(np.log(np.arange(1, 2 * lengths_2.max() + 2)))))
+
+        # The score of two adjacent target sentences is normalised over all the ways of splitting their length
+        pairs = set(zip(lengths_2[:-1], lengths_2[1:]))
+        normalising = {}
+        for length_sum in {first + second for first, second in pairs}:
+            splits = [length_scores_2[i] + length_scores_2[length_sum - i] for i in range(1, length_sum)
+                      if i < len(length_scores_2) and length_sum - i < len(length_scores_2)
+                      and length_scores_2[i] < np.inf and length_scores_2[length_sum - i] < np.inf]
+            normalising[length_sum] = -math.log(sum(math.exp(-score) for score in splits))
+        pair_scores = {(first, second): length_scores_2[first] + length_scores_2[second] - normalising[first + second]
+                       for first, second in pairs}
+        self.pair_scores_2 = np.array([pair_scores[pair] for pair in zip(lengths_2[:-1], lengths_2[1:])] + [0, 0, 0])
+
+    @staticmethod
+    def _length_scores(lengths):
+        """
+        :return: The negative log probability of each sentence length, infinite for unseen lengths
+        """
+        counts = np.bincount(lengths)
+        with np.errstate(divide='ignore'):
+            return -np.log(counts / len(lengths))
+
+    def band(self, pos_1, deviation):
+        """
+        :return: The range of target positions searched for source position pos_1
+        """
+        diagonal = int((self.ratio * pos_1) + 0.000001)
+        return max(0, int(diagonal - deviation)), min(self.n2, int(diagonal + deviation))
+
+    def cond(self, length_1, lengths_2):
+        """
+        :return: The negative log Poisson probability of the target lengths given the source length
+        """
+        mean = length_1 * self.mean_ratio
+        return mean - lengths_2 * math.log(mean) + self.log_factorials[lengths_2]
+
+    def bead_scores(self, pos_1, pos_2, forward):
+        """
+        The length based score of each bead type ending (forward) or starting (backward) at the given cells
+        :param pos_1: The source position
+        :param pos_2: The target positions
+        :param forward: True for beads ending at the cells, False for beads starting at them
+        :return: A 5 x len(pos_2) array of bead scores, excluding the bead type prior
+        """
+        if forward:
+            s1, s2, t1, t2 = pos_1 - 1, pos_2 - 1, pos_1 - 2, pos_2 - 2
+        else:
+            s1, s2, t1, t2 = pos_1, pos_2, pos_1 + 1, pos_2 + 1
+        length_1 = self.lengths_1[s1]
+        score_1 = self.scores_1[s1]
+        scores = np.zeros((5, len(pos_2)))
+        if length_1 == 0:
+            scores[INSERT] = self.scores_2[s2]
+            return scores
+        scores[DELETE] = score_1
+        scores[INSERT] = self.scores_2[s2]
+        scores[MATCH] = score_1 + self.cond(length_1, self.lengths_2[s2])
+        if self.lengths_1[t1] > 0:
+            scores[CONTRACT] = (score_1 + self.scores_1[t1] +
+                                self.cond(length_1 + self.lengths_1[t1], self.lengths_2[s2]))
+        # The pair starting at the earlier target sentence
+        first = t2 if forward else s2
+        scores[EXPAND] = (score_1 + self.pair_scores_2[first] +
+                          self.cond(length_1, self.lengths_2[first] + self.lengths_2[first + 1]))
+        return scores
+
+
+def _forward(rows, bead_scores):
+    """
+    The forward pass of the forward-backward algorithm over a set of cells
+    :param rows: The ascending target positions of the cells searched at each source position
+    :param bead_scores: A function of (pos_1, pos_2) returning the 5 x len(pos_2) bead scores ending at the cells
+    :return: The (positions, log probability) of each row, the most likely bead ending at each cell and the bead
+             scores of each row
+    """
+    forward = []
+    best_beads = []
+    row_scores = []
+    priors = np.array(BEAD_SCORES)[:, None]
+    for pos_1, pos_2 in enumerate(rows):
+        row_scores.append(bead_scores(pos_1, pos_2))
+        scores = row_scores[-1] + priors
+        previous_1 = forward[pos_1 - 1] if pos_1 >= 1 else None
+        previous_2 = forward[pos_1 - 2] if pos_1 >= 2 else None
+        candidates = np.full((5, len(pos_2)), -np.inf)
+        candidates[DELETE] = _lookup(previous_1, pos_2) - scores[DELETE]
+        candidates[MATCH] = _lookup(previous_1, pos_2 - 1) - scores[MATCH]
+        candidates[CONTRACT] = _lookup(previous_2, pos_2 - 1) - scores[CONTRACT]
+        candidates[EXPAND] = _lookup(previous_1, pos_2 - 2) - scores[EXPAND]
+        base = np.logaddexp.reduce(candidates, axis=0)
+        if pos_1 == 0 and len(pos_2) > 0 and pos_2[0] == 0:
+            base[0] = 0
+
+        # Inserts chain along the row so each run of consecutive cells is one cumulative log-add
+        values = np.full(len(pos_2), -np.inf)
+        for begin, end in _runs(pos_2):
+            values[begin:end], _ = _log_scan(base[begin:end], -scores[INSERT, begin:end])
+            candidates[INSERT, begin + 1:end] = values[begin:end - 1] - scores[INSERT, begin + 1:end]
+        forward.append((pos_2, values))
+        best_beads.append(np.argmax(candidates, axis=0))
+    return forward, best_beads, row_scores
+
+
+def _backward(model, forward, bead_scores, threshold):
+    """
+    The backward pass of the forward-backward algorithm, nodes unlikely to be on the alignment path are pruned
+    :param model: The _LengthModel
+    :param forward: The forward pass rows, the backward pass covers the cells these rows have a value for
+    :param bead_scores: A function of (pos_1, pos_2) returning the 5 x len(pos_2) bead scores starting at the cells
+    :param threshold: The log probability below which nodes are pruned
+    :return: The saved (positions, log probability) rows and the (pos_1, pos_2, bead, probability) of every bead
+             more likely than not, in the order the Perl scripts write them
+    """
+    n1, n2 = model.n1, model.n2
+    end_positions, end_values = forward[n1]
+    total = end_values[-1] if len(end_positions) > 0 and end_positions[-1] == n2 else -np.inf
+    if not np.isfinite(total):
+        raise ValueError("No alignment path reaches the end of both documents")
+    backward = [None] * (n1 + 1)
+    beads = []
+    priors = np.array(BEAD_SCORES)[:, None]
+    log_one_half = math.log(0.5)
+    for pos_1 in range(n1, -1, -1):
+        pos_2, forward_values = forward[pos_1]
+        # Perl reads an undefined forward probability as 0
+        norm_forward = np.where(forward_values > -np.inf, forward_values, 0) - total
+        scores = bead_scores(pos_1, pos_2) + priors
+        next_1 = backward[pos_1 + 1] if pos_1 + 1 <= n1 else None
+        next_2 = backward[pos_1 + 2] if pos_1 + 2 <= n1 else None
+        candidates = np.full((5, len(pos_2)), -np.inf)
+        candidates[DELETE] = _lookup(next_1, pos_2) - scores[DELETE]
+        candidates[MATCH] = _lookup(next_1, pos_2 + 1) - scores[MATCH]
+        candidates[CONTRACT] = _lookup(next_2, pos_2 + 1) - scores[CONTRACT]
+        candidates[EXPAND] = _lookup(next_1, pos_2 + 2) - scores[EXPAND]
+        base = np.logaddexp.reduce(candidates, axis=0)
+        floor = threshold - norm_forward
+        if pos_1 == n1 and len(pos_2) > 0 and pos_2[-1] == n2:
+            base[-1] = 0
+            floor[-1] = -np.inf
+
+        # The backward pass runs along the row from the end so the scan works on reversed runs
+        values = np.full(len(pos_2), -np.inf)
+        kept = np.zeros(len(pos_2), dtype=bool)
+        for begin, end in _runs(pos_2):
+            run = slice(end - 1, begin - 1 if begin > 0 else None, -1)
+            run_values, run_kept = _log_scan(base[run], -scores[INSERT, run], floor[run])
+            values[run], kept[run] = run_values, run_kept
+            saved = np.where(kept[begin:end], values[begin:end], -np.inf)
+            candidates[INSERT, begin:end - 1] = saved[1:] - scores[INSERT, begin:end - 1]
+        backward[pos_1] = (pos_2[kept], values[kept])
+
+        totals = candidates + norm_forward
+        for bead, index in zip(*np.nonzero(totals > log_one_half)):
+            beads.append((pos_1, int(pos_2[index]), BEAD_TYPES[bead], math.exp(totals[bead, index])))
+
+    beads.sort(key=lambda bead: (bead[0], bead[1], -BEAD_TYPES.index(bead[2])))
+    return backward, beads
+
+
+def _align_by_length(model):
+    """
+    Aligns by sentence length alone, widening the search band until the best path stays well inside it
+    :return: The saved backward rows, which bound the word based search, and the likely beads
+    """
+    max_path_deviation = SEARCH_DEVIATION / SEARCH_INCREMENT_RATIO
+    min_beam_margin = SEARCH_DEVIATION / 4
+    threshold = CONF_THRESHOLD / CONF_INCREMENT_RATIO
+    search_deviation = 0
+
+    while (max_path_deviation + min_beam_margin) > search_deviation:
+        search_deviation = max_path_deviation * SEARCH_INCREMENT_RATIO
+        threshold *= CONF_INCREMENT_RATIO
+        search_deviation = max(search_deviation, max_path_deviation + min_beam_margin)
+        rows = [np.arange(lower, upper + 1) for lower, upper in
+                (model.band(pos_1, search_deviation) for pos_1 in range(model.n1 + 1))]
+        forward, best_beads, _ = _forward(rows, lambda pos_1, pos_2: model.bead_scores(pos_1, pos_2, True))
+
+        # Follow the best path back from the end to see how far it strays from the diagonal
+        max_path_deviation = 0
+        pos_1, pos_2 = model.n1, model.n2
+        while pos_1 > 0 or pos_2 > 0:
+            max_path_deviation = max(max_path_deviation, abs(int((model.ratio * pos_1) + 0.000001) - pos_2))
+            bead = best_beads[pos_1][pos_2 - rows[pos_1][0]]
+            pos_1 -= 2 if bead == CONTRACT else 0 if bead == INSERT else 1
+            pos_2 -= 2 if bead == EXPAND else 0 if bead == DELETE else 1
+
+    # Every cell in the band is searched backwards, cells the forward pass never reached included
+    return _backward(model, forward, lambda pos_1, pos_2: model.bead_scores(pos_1, pos_2, False), threshold)
+
+
+def _lexicon(sentences, cutoff):
+    """
+    :return: The tokens frequent enough to get their own entry in the word model
+    """
+    counts = Counter(token for tokens in sentences for token in tokens)
+    prev_count, token_count, kept = 0, 0, 0
+    for count in sorted(counts.values(), reverse=True):
+        prev_count, token_count = token_count, count
+        if (kept >= cutoff and count < prev_count) or count == 1:
+            break
+        kept += 1
+    lexicon = {token for token, count in counts.items() if count >= prev_count}
+    lexicon.add(OTHER)
+    return lexicon
+
+
+def train_model_one(sentences_1, sentences_2, iterations=EM_ITERATIONS, cutoff=LEX_SIZE_CUTOFF):
+    """
+    Trains IBM Model 1 translation probabilities with EM, each iteration is a handful of array operations over
+    every (source token, target token) pair in the corpus
+    :param sentences_1: The normalised source tokens of each sentence pair
+    :param sentences_2: The normalised target tokens of each sentence pair
+    :param iterations: The number of EM iterations
+    :param cutoff: The number of tokens kept per language
+    :return: A dictionary of (source token, target token) to the probability of the target token given the source
+    """
+    lexicon_1 = _lexicon(sentences_1, cutoff)
+    lexicon_2 = _lexicon(sentences_2, cutoff)
+    types_1, types_2 = {}, {}
+    sources, targets, occurrences, limits = [], [], [], []
+    occurrence = 0
+    for tokens_1, tokens_2 in zip(sentences_1, sentences_2):
+        ids_1 = [types_1.setdefault(token if token in lexicon_1 else OTHER, len(types_1)) for token in tokens_1]
+        ids_1.append(types_1.setdefault(EMPTY, len(types_1)))
+        ids_2 = [types_2.setdefault(token if token in lexicon_2 else OTHER, len(types_2)) for token in tokens_2]
+        # Every source token pairs with every target token, occurrence numbers each target token in the corpus
+        sources.append(np.tile(ids_1, len(ids_2)))
+        targets.append(np.repeat(ids_2, len(ids_1)))
+        occurrences.append(np.repeat(np.arange(occurrence, occurrence + len(ids_2)), len(ids_1)))
+        limits.append(np.full(len(ids_1) * len(ids_2), 1 / len(ids_1)))
+        occurrence += len(ids_2)
+
+    if occurrence == 0:
+        return {}
+    sources, targets = np.concatenate(sources), np.concatenate(targets)
+    occurrences, limits = np.concatenate(occurrences), np.concatenate(limits)
+    keys, pairs = np.unique(sources * len(types_2) + targets, return_inverse=True)
+    key_sources, key_targets = keys // len(types_2), keys % len(types_2)
+    # Counts too small to trust are moved to the (empty) source token of the same target token
+    empty_keys = np.full(len(types_2), -1)
+    empty_mask = key_sources == types_1[EMPTY]
+    empty_keys[key_targets[empty_mask]] = np.flatnonzero(empty_mask)
+
+    fractions = limits
+    assigned = pairs
+    for iteration in range(iterations):
+        if iteration > 0:
+            pair_probs = probs[pairs]
+            fractions = pair_probs / np.bincount(occurrences, weights=pair_probs)[occurrences]
+            assigned = np.where(fractions > limits, pairs, empty_keys[targets])
+        counts = np.bincount(assigned, weights=fractions, minlength=len(keys))
+        source_counts = np.bincount(key_sources[assigned], weights=fractions, minlength=len(types_1))
+        present = np.bincount(assigned, minlength=len(keys)) > 0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            probs = np.where(present, counts / source_counts[key_sources], 0.0)
+
+    names_1 = sorted(types_1, key=types_1.get)
+    names_2 = sorted(types_2, key=types_2.get)
+    # The Perl model file holds 15 significant digits, round the same way so both engines agree
+    return {(names_1[source], names_2[target]): float('%.15g' % prob) for source, target, prob in
+            zip(key_sources[present], key_targets[present], probs[present])}
+
+
+class _WordModel:
+    """
+    The word based bead scores, the Model 1 probabilities are held as a sparse source token x target token matrix
+    """
+
+    def __init__(self, length_model, sentences_1, sentences_2, trans_probs):
+        self.length_model = length_model
+        types_1 = {EMPTY: 0, OTHER: 1}
+        types_2 = {OTHER: 0}
+        for token_1, token_2 in trans_probs:
+            types_1.setdefault(token_1, len(types_1))
+            types_2.setdefault(token_2, len(types_2))
+        known_1 = {token_1 for token_1, _ in trans_probs}
+        known_2 = {token_2 for _, token_2 in trans_probs}
+
+        entries = sorted((types_1[token_1], types_2[token_2], prob) for (token_1, token_2), prob in trans_probs.items())
+        rows = np.array([entry[0] for entry in entries], dtype=np.int64)
+        self.columns = np.array([entry[1] for entry in entries], dtype=np.int64)
+        self.probs = np.array([entry[2] for entry in entries])
+        self.row_starts = np.searchsorted(rows, np.arange(len(types_1) + 1))
+        self.type_count_2 = len(types_2)
+        self.empty_row = self._column_sums([0])
+
+        def token_ids(sentences, known, types):
+            return [np.array([types[word] if word in known else types[OTHER] for word in
+                              (_normalise_word(word) for word in words)], dtype=np.int64) for words in sentences]
+
+        self.ids_1 = token_ids(sentences_1, known_1, types_1)
+        self.ids_2 = token_ids(sentences_2, known_2, types_2)
+        self.word_scores_1 = self._word_scores(self.ids_1, len(types_1))
+        self.word_scores_2 = self._word_scores(self.ids_2, len(types_2))
+        self.flat_2 = np.concatenate(self.ids_2)
+        self.starts_2 = np.concatenate(([0], np.cumsum([len(ids) for ids in self.ids_2])))
+
+    @staticmethod
+    def _word_scores(sentences, type_count):
+        """
+        :return: The summed unigram negative log probability of each sentence, padded like the length scores
+        """
+        flat = np.concatenate(sentences)
+        with np.errstate(divide='ignore'):
+            token_scores = -np.log(np.bincount(flat, minlength=type_count) / len(flat))
+        starts = np.cumsum([0] + [len(ids) for ids in sentences[:-1]])
+        return np.concatenate((np.add.reduceat(token_scores[flat], starts), [0, 0]))
+
+    def _column_sums(self, ids):
+        """
+        :return: The sum over the given source tokens of the probability of each target token
+        """
+        rows = [np.arange(self.row_starts[i], self.row_starts[i + 1]) for i in ids]
+        entries = np.concatenate(rows) if rows else np.zeros(0, dtype=np.int64)
+        return np.bincount(self.columns[entries], weights=self.probs[entries], minlength=self.type_count_2)
+
+    def _trans_scores(self, ids, first, last):
+        """
+        The Model 1 score of the source tokens translating to each target sentence in first to last, before the
+        length normalisation
+        :return: An array of scores indexed by target position - first
+        """
+        with np.errstate(divide='ignore'):
+            token_scores = -np.log(self.empty_row + self._column_sums(ids))
+        flat = token_scores[self.flat_2[self.starts_2[first]:self.starts_2[last + 1]]]
+        bounds = self.starts_2[first:last + 2] - self.starts_2[first]
+        if not np.isfinite(flat).all():
+            # A target token no source token translates to makes the bead impossible, the Perl aligner stops here
+            return np.array([flat[start:end].sum() for start, end in zip(bounds[:-1], bounds[1:])])
+        cumulative = np.concatenate(([0.0], np.cumsum(flat)))
+        return cumulative[bounds[1:]] - cumulative[bounds[:-1]]
+
+    def bead_scores(self, pos_1, pos_2):
+        """
+        The length and word based score of each bead type ending at the given cells
+        :return: A 5 x len(pos_2) array of bead scores, excluding the bead type prior
+        """
+        model = self.length_model
+        scores = model.bead_scores(pos_1, pos_2, True)
+        scores[INSERT] += self.word_scores_2[pos_2 - 1]
+        if pos_1 == 0 or len(pos_2) == 0:
+            return scores
+
+        words_1 = self.ids_1[pos_1 - 1]
+        scores[DELETE] += self.word_scores_1[pos_1 - 1]
+        first, last = max(0, pos_2[0] - 2), min(model.n2 - 1, pos_2[-1] - 1)
+        if last < first:
+            return scores
+        target = np.clip(pos_2 - 1, first, last) - first
+        previous = np.clip(pos_2 - 2, first, last) - first
+        lengths = model.lengths_2[np.clip(pos_2 - 1, 0, None)]
+        previous_lengths = model.lengths_2[np.clip(pos_2 - 2, 0, None)]
+
+        trans = self._trans_scores(words_1, first, last)
+        normaliser = -math.log(1 / (len(words_1) + 1))
+        scores[MATCH] += self.word_scores_1[pos_1 - 1] + trans[target] + normaliser * lengths
+        scores[EXPAND] += (self.word_scores_1[pos_1 - 1] + trans[previous] + trans[target] +
+                           normaliser * (previous_lengths + lengths))
+        if pos_1 >= 2:
+            words_pair = np.concatenate((self.ids_1[pos_1 - 2], words_1))
+            trans_pair = self._trans_scores(words_pair, first, last)
+            scores[CONTRACT] += (self.word_scores_1[pos_1 - 1] + self.word_scores_1[pos_1 - 2] +
+                                 trans_pair[target] - math.log(1 / (len(words_pair) + 1)) * lengths)
+        return scores
+
+
+def _align_by_words(length_model, nodes, sentences_1, sentences_2, trans_probs):
+    """
+    Realigns using sentence lengths and word translation probabilities, searching only the nodes the length based
+    alignment kept
+    :return: The likely beads
+    """
+    word_model = _WordModel(length_model, sentences_1, sentences_2, trans_probs)
+    forward, _, forward_scores = _forward([positions for positions, _ in nodes], word_model.bead_scores)
+    forward = [(positions[values > -np.inf], values[values > -np.inf]) for positions, values in forward]
+
+    # The backward pass needs the scores of the beads starting at each cell, which are the forward scores of the
+    # cells the beads end at
+
+    def backward_scores(pos_1, pos_2):
+        scores = np.zeros((5, len(pos_2)))
+        for bead, d1, d2 in ((DELETE, 1, 0), (INSERT, 0, 1), (MATCH, 1, 1), (CONTRACT, 2, 1), (EXPAND, 1, 2)):
+            if pos_1 + d1 < len(nodes):
+                row = (nodes[pos_1 + d1][0], forward_scores[pos_1 + d1][bead])
+                scores[bead] = _lookup(row, pos_2 + d2, 0.0)
+        return scores
+
+    _, beads = _backward(length_model, forward, backward_scores, CONF_THRESHOLD)
+    return beads
+
+
+def _matched_positions(beads, threshold):
+    """
+    :return: The source and target positions of the match beads above the threshold, compared at the precision
+             the Perl scripts write them with
+    """
+    matches = [(pos_1, pos_2) for pos_1, pos_2, bead, prob in beads
+               if bead == 'match' and float('%.8f' % prob) > threshold]
+    return [pos_1 for pos_1, _ in matches], [pos_2 for _, pos_2 in matches]
+
+
+def _align_pair_by_length(source_file, target_file):
+    """
+    Runs the length based pass over a pair of documents
+    :param source_file: The source language document
+    :param target_file: The target language document
+    :return: The saved backward rows that bound the word based pass, and the normalised words of the most confident
+    length based matches of each document to train the word model with
+    """
+    length_model = _LengthModel(read_sentences(source_file), read_sentences(target_file))
+    nodes, length_beads = _align_by_length(length_model)
+
+    positions_1, positions_2 = _matched_positions(length_beads, HIGH_PROB_THRESHOLD)
+    words_1 = [[_normalise_word(word) for word in _split_words(line)] for line in
+               _select_lines(source_file, positions_1)]
+    words_2 = [[_normalise_word(word) for word in _split_words(line)] for line in
+               _select_lines(target_file, positions_2)]
+    return nodes, words_1, words_2
+
+
+def _align_pair_by_words(source_file, target_file, nodes, trans_probs, threshold):
+    """
+    Runs the word based pass over a pair of documents and writes <file>.aligned for both
+    :return: The number of aligned sentence pairs
+    """
+    sentences_1 = read_sentences(source_file)
+    sentences_2 = read_sentences(target_file)
+    length_model = _LengthModel(sentences_1, sentences_2)
+
+    beads = _align_by_words(length_model, nodes, sentences_1, sentences_2, trans_probs)
+    positions_1, positions_2 = _matched_positions(beads, threshold)
+    with open(source_file + '.aligned', 'wb') as aligned:
+        aligned.writelines(_select_lines(source_file, positions_1))
+    with open(target_file + '.aligned', 'wb') as aligned:
+        aligned.writelines(_select_lines(target_file, positions_2))
+
+    return len(positions_1)
+
+
+def align_sentences(source_file, target_file, threshold=0.5):
+    """
+    Aligns two documents with one sentence per line, a NumPy port of the Microsoft Bilingual Sentence Aligner
+    align-sents-all.pl that writes the same <file>.aligned output without the intermediate files
+    :param source_file: The source language document
+    :param target_file: The target language document
+    :param threshold: The probability a sentence match must exceed to be written out
+    :return: The number of aligned sentence pairs
+    """
+    # The most confident length based matches train the word model
+    nodes, words_1, words_2 = _align_pair_by_length(source_file, target_file)
+    trans_probs = train_model_one(words_1, words_2)
+    return _align_pair_by_words(source_file, target_file, nodes, trans_probs, threshold)
+
+
+def _init_word_worker(trans_probs):
+    """
+    Ships the shared word model to a worker process once rather than with every document pair
+    """
+    _worker['trans_probs'] = trans_probs
+
+
+def _length_task(pair):
+    """
+    :param pair: A (source document, target document) tuple
+    :return: The result of _align_pair_by_length, or None if the pair could not be aligned
+    """
+    try:
+        return _align_pair_by_length(*pair)
+    except Exception as align_error:
+        logging.error(f"Error with sentence alignment of {pair[0]} {pair[1]} {align_error}")
+        return None
+
+
+def _word_task(task):
+    """
+    :param task: A (source document, target document, nodes, threshold) tuple
+    :return: The number of aligned sentence pairs, or None if the pair could not be aligned
+    """
+    source_file, target_file, nodes, threshold = task
+    try:
+        return _align_pair_by_words(source_file, target_file, nodes, _worker['trans_probs'], threshold)
+    except Exception as align_error:
+        logging.error(f"Error with sentence alignment of {source_file} {target_file} {align_error}")
+        return None
+
+
+def _run_tasks(function, tasks, workers, initializer=None, initargs=()):
+    """
+    Maps the function over the tasks in order, in a process pool when more than one worker is asked for
+    """
+    if workers <= 1 or len(tasks) <= 1:
+        if initializer:
+            initializer(*initargs)
+        return list(map(function, tasks))
+    with Pool(min(workers, len(tasks)), initializer=initializer, initargs=initargs) as pool:
+        return pool.map(function, tasks, chunksize=1)
+
+
+def align_document_pairs(pairs, threshold=0.5, workers=None):
+    """
+    Aligns many document pairs with one word model, the equivalent of align-sents-all-multi-file.pl. The length based
+    pass runs over the pairs in a process pool, the word model is trained once on the confident matches of every pair
+    and the word based pass then runs over the pairs in a process pool again
+    :param pairs: A list of (source document, target document) tuples
+    :param threshold: The probability a sentence match must exceed to be written out
+    :param workers: The number of worker processes, defaults to the number of CPUs
+    :return: A list with the (source .aligned, target .aligned, number of aligned sentence pairs) of each pair in
+    order, or None for a pair that could not be aligned
+    """
+    pairs = [tuple(pair) for pair in pairs]
+    workers = workers or os.cpu_count() or 1
+
+    length_results = _run_tasks(_length_task, pairs, workers)
+    words_1, words_2 = [], []
+    for result in length_results:
+        if result is not None:
+            words_1.extend(result[1])
+            words_2.extend(result[2])
+    trans_probs = train_model_one(words_1, words_2)
+    logging.debug(f"Trained the word model on {len(words_1)} sentence pairs from {len(pairs)} document pairs")
+
+    tasks = [(source_file, target_file, result[0], threshold)
+             for (source_file, target_file), result in zip(pairs, length_results) if result is not None]
+    counts = iter(_run_tasks(_word_task, tasks, workers, _init_word_worker, (trans_probs,)))
+
+    aligned = []
+    for (source_file, target_file), result in zip(pairs, length_results):
+        count = next(counts) if result is not None else None
+        aligned.append(None if count is None else (source_file + '.aligned', target_file + '.aligned', count))
+    return aligned
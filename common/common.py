@@ -1,8 +1,19 @@
-from requests import post
+import hashlib
+import json
 import logging
-from translate.storage.tmx import tmxfile
-import spacy
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import unicodedata
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+TRANSLATOR_ENDPOINT = 'https://api.cognitive.microsofttranslator.com/translate'
+MAX_ELEMENTS_PER_REQUEST = 100  # The Translator v3 limit on the number of array elements per request
+MAX_CHARACTERS_PER_REQUEST = 10000  # The Translator v3 limit on the total characters per request
 
 
 def set_log_level(debug):
@@ -15,7 +26,7 @@ def set_log_level(debug):
         logging.basicConfig(level=logging.DEBUG)
 
 
-def call_translation(text, language_code, category_id, subscription_key, region):
+def call_translation(text, language_code, category_id, subscription_key, region, endpoint=TRANSLATOR_ENDPOINT):
     """
 
     :param text: The text to be translated
@@ -23,9 +34,12 @@ def call_translation(text, language_code, category_id, subscription_key, region)
     :param category_id: The category Id of the Machine Translation model
     :param subscription_key: The Subscription Key for the Custom Machine Translation service
     :param region: The Region that the model is deployed to
+    :param endpoint: The Translator translate endpoint, override to point at a local stub service
     :return: The translated text in a json object
     """
 
+    from requests import post
+
     analyze_result_response = None
 
     headers = {
@@ -35,8 +49,7 @@ def call_translation(text, language_code, category_id, subscription_key, region)
     }
 
     try:
-        url = 'https://api.cognitive.microsofttranslator.com/translate?api-version=3.0&to=' + language_code + \
-              '&category=' + category_id
+        url = endpoint + '?api-version=3.0&to=' + language_code + '&category=' + category_id
         resp = post(url=url, json=text, headers=headers)
         analyze_result_response = resp.json()
 
@@ -46,6 +59,254 @@ def call_translation(text, language_code, category_id, subscription_key, region)
     return analyze_result_response
 
 
+def batch_segments(segments, batch_size=MAX_ELEMENTS_PER_REQUEST, max_characters=MAX_CHARACTERS_PER_REQUEST):
+    """
+    Packs segments into batches that respect the Translator request limits, a segment that is longer than
+    max_characters on its own is sent in a batch of one
+    :param segments: The list of text segments to translate
+    :param batch_size: The maximum number of segments per request
+    :param max_characters: The maximum number of characters per request
+    :return: A generator of batches, each batch is a list of (segment index, text) tuples
+    """
+    batch_size = max(1, min(int(batch_size), MAX_ELEMENTS_PER_REQUEST))
+    batch = []
+    batch_characters = 0
+
+    for i, segment in enumerate(segments):
+        if len(batch) > 0 and (len(batch) >= batch_size or batch_characters + len(segment) > max_characters):
+            yield batch
+            batch = []
+            batch_characters = 0
+        batch.append((i, segment))
+        batch_characters += len(segment)
+
+    if len(batch) > 0:
+        yield batch
+
+
+def call_translation_batched(segments, language_code, category_id, subscription_key, region,
+                             batch_size=MAX_ELEMENTS_PER_REQUEST, endpoint=TRANSLATOR_ENDPOINT):
+    """
+    Translates a list of segments with as few requests as the Translator limits allow
+    :param segments: The list of text segments to translate
+    :param language_code: The target language to translate to
+    :param category_id: The category Id of the Machine Translation model
+    :param subscription_key: The Subscription Key for the Custom Machine Translation service
+    :param region: The Region that the model is deployed to
+    :param batch_size: The maximum number of segments per request
+    :param endpoint: The Translator translate endpoint, override to point at a local stub service
+    :return: The translated text per segment, in the order of segments, an empty string where a request failed
+    """
+    translated = [''] * len(segments)
+
+    for batch in batch_segments(segments, batch_size):
+        translation_results = call_translation([{'Text': text} for _, text in batch], language_code, category_id,
+                                               subscription_key, region, endpoint)
+
+        if not isinstance(translation_results, list) or len(translation_results) != len(batch):
+            logging.error(f"Translation failed for segments {batch[0][0]} to {batch[-1][0]} {translation_results}")
+            continue
+
+        # The service returns one result per element, in the order they were sent
+        for (i, _), translations in zip(batch, translation_results):
+            translated[i] = translations['translations'][0]['text']
+
+    return translated
+
+
+class TranslationCache:
+    """
+    A persistent SQLite translation cache keyed on a hash of the normalised source text, target language and
+    category, so reruns over the same documents and translation memories do not pay for the same translations again
+    """
+
+    def __init__(self, path, max_entries=None, max_age=None, read_only=False):
+        """
+        :param path: The SQLite cache file
+        :param max_entries: Evict the oldest entries above this many, None for no limit
+        :param max_age: Evict entries older than this many seconds, None for no limit
+        :param read_only: Never write to the cache, e.g. for CI runs against a shared cache
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.read_only = read_only
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._connection = None
+
+        if read_only:
+            if os.path.isfile(path):
+                self._connection = sqlite3.connect('file:' + path + '?mode=ro', uri=True, check_same_thread=False)
+            else:
+                logging.warning(f"Read only translation cache {path} does not exist, every lookup will miss")
+        else:
+            self._connection = sqlite3.connect(path, check_same_thread=False)
+            self._connection.execute('CREATE TABLE IF NOT EXISTS translations (key TEXT PRIMARY KEY, '
+                                     'translation TEXT NOT NULL, created REAL NOT NULL)')
+            self._connection.commit()
+            self.evict()
+
+    @staticmethod
+    def key(text, language_code, category_id):
+        """
+        :param text: The source text
+        :param language_code: The target language
+        :param category_id: The category Id of the Machine Translation model
+        :return: The cache key, a hash of the whitespace and unicode normalised text, language and category
+        """
+        normalised = unicodedata.normalize('NFC', ' '.join(text.split()))
+        return hashlib.sha256('\0'.join([normalised, language_code, category_id or '']).encode('utf-8')).hexdigest()
+
+    def get(self, text, language_code, category_id):
+        """
+        :return: The cached translation or None on a miss
+        """
+        translation = None
+        with self._lock:
+            if self._connection is not None:
+                row = self._connection.execute('SELECT translation, created FROM translations WHERE key = ?',
+                                               (self.key(text, language_code, category_id),)).fetchone()
+                if row is not None and (self.max_age is None or time.time() - row[1] <= self.max_age):
+                    translation = row[0]
+            if translation is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        return translation
+
+    def put(self, text, language_code, category_id, translation):
+        """
+        Stores a translation, this is a no-op for a read only cache
+        """
+        self.put_many([(text, language_code, category_id, translation)])
+
+    def put_many(self, entries):
+        """
+        Stores many translations in a single transaction
+        :param entries: An iterable of (text, language code, category id, translation) tuples
+        """
+        if self.read_only:
+            return
+
+        now = time.time()
+        rows = [(self.key(text, language_code, category_id), translation, now)
+                for text, language_code, category_id, translation in entries]
+        with self._lock:
+            self._connection.executemany('INSERT OR REPLACE INTO translations VALUES (?, ?, ?)', rows)
+            self._connection.commit()
+
+    def evict(self):
+        """
+        Removes the entries older than max_age then the oldest entries above max_entries
+        """
+        if self.read_only:
+            return
+
+        with self._lock:
+            if self.max_age is not None:
+                self._connection.execute('DELETE FROM translations WHERE created < ?', (time.time() - self.max_age,))
+            if self.max_entries is not None:
+                self._connection.execute('DELETE FROM translations WHERE key NOT IN (SELECT key FROM translations '
+                                         'ORDER BY created DESC LIMIT ?)', (int(self.max_entries),))
+            self._connection.commit()
+
+    def close(self):
+        if self._connection is not None:
+            self.evict()
+            self._connection.close()
+            self._connection = None
+        logging.info(f"Translation cache {self.path} hits {self.hits} misses {self.misses}")
+
+
+class RunJournal:
+    """
+    An append-only JSON lines journal of an evaluation run. The first line identifies the run and every following
+    line is a completed translation, written and flushed as each batch finishes, so a run that crashes or runs out of
+    quota can be resumed without paying for the translations it already has
+    """
+
+    def __init__(self, path, run, resume=False):
+        """
+        :param path: The journal file
+        :param run: A JSON serialisable dictionary identifying the run, e.g. the documents, language and models
+        :param resume: Continue the journal at path, otherwise any journal there is replaced
+        """
+        self.path = path
+        self.run = run
+        self.translations = {}
+        self._lock = threading.Lock()
+
+        if resume and os.path.isfile(path):
+            self._load()
+            self._file = open(path, 'a', encoding='utf-8')
+        else:
+            self._file = open(path, 'w', encoding='utf-8')
+            self._write([{'run': run}])
+        logging.info(f"Run journal {path} has {len(self.translations)} completed translations")
+
+    def _load(self):
+        with open(self.path, 'r', encoding='utf-8') as journal:
+            lines = journal.read().split('\n')
+        header = json.loads(lines[0]).get('run') if lines[0] else None
+        if header != self.run:
+            raise ValueError(f"The journal {self.path} belongs to a different run {header}")
+
+        for line in lines[1:]:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # Only the last line can be cut short by a crash, the rest of the journal is still good
+                continue
+            self.translations[(record['c'], record['i'])] = record['t']
+
+        # Start the next record on a fresh line if the last one was cut short
+        if lines[-1]:
+            with open(self.path, 'a', encoding='utf-8') as journal:
+                journal.write('\n')
+
+    def _write(self, records):
+        self._file.write(''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in records))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def record(self, category_id, translations):
+        """
+        Appends completed translations to the journal
+        :param category_id: The category Id of the Machine Translation model
+        :param translations: A list of (sentence index, translation) tuples
+        """
+        with self._lock:
+            self._write([{'c': category_id, 'i': i, 't': text} for i, text in translations])
+            for i, text in translations:
+                self.translations[(category_id, i)] = text
+
+    def completed(self, category_id):
+        """
+        :return: A dictionary of sentence index to translation of the sentences already translated by a model
+        """
+        return {i: text for (category, i), text in self.translations.items() if category == category_id}
+
+    def category_translations(self, categories, count):
+        """
+        :param categories: The category Ids of the Machine Translation models
+        :param count: The number of sentences
+        :return: A list per category of the translated text per sentence, an empty string where it is not journaled
+        """
+        return [[self.translations.get((category_id, i), '') for i in range(count)] for category_id in categories]
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
 def load_tmx_file(file, source_language=None, target_language=None):
     """
     Loads the tmx file
@@ -54,6 +315,7 @@ def load_tmx_file(file, source_language=None, target_language=None):
     :param target_language: The target language we are translating to
     :return: The tmx file XML file as a translation.storage.tmx object
     """
+    from translate.storage.tmx import tmxfile
 
     with open(file, 'rb') as tmx:
         tmx_file = tmxfile(tmx, 'en-GB', 'fr-FR')  # TODO This does not affect what is loaded
@@ -67,6 +329,9 @@ def load_spacy_model(model):
     :param model: The model we want to load
     :return: The loaded spaCy model
     """
+    # spaCy takes about a second to import, so it is only imported by the stages that parse text
+    import spacy
+
     nlp_model = spacy.load(model)
     return nlp_model
 
@@ -82,16 +347,27 @@ def load_phrase_dictionary(file, mode):
     return phrase_dict
 
 
-def call_sentence_alignment(source_aligner, target_aligner, aligner_path):
+def call_sentence_alignment(source_aligner, target_aligner, aligner_path, engine='perl'):
     """
     This invokes the Microsoft Bilingual Sentence Aligner perl script
     see https://www.microsoft.com/en-us/download/details.aspx?id=52608&from=https%3A%2F%2Fresearch.microsoft.com%2Fen-us%2Fdownloads%2Faafd5dcf-4dcc-49b2-8a22-f7055113e656%2F
+    or its NumPy port in common.aligner, both write <document>.aligned next to each document
     :param source_aligner: The source language document
     :param target_aligner: The target language document
     :param aligner_path: The path where the Microsoft Bilingual Sentence Aligner perl script
-    :return: pipe - The subprocess result
+    :param engine: perl to run the perl scripts or python to align in process
+    :return: pipe - The subprocess result, or the number of aligned sentence pairs for the python engine
     """
 
+    if engine == 'python':
+        from .aligner import align_sentences
+
+        try:
+            return align_sentences(source_aligner, target_aligner)
+        except Exception as align_error:
+            logging.error(f"Error with sentence alignment {align_error}")
+            return None
+
     pipe = None
     try:
         # Now we call the alignment Perl script
@@ -101,3 +377,146 @@ def call_sentence_alignment(source_aligner, target_aligner, aligner_path):
         logging.error(f"Error with alignment script {align_error}")
 
     return pipe
+
+
+def read_lines(file):
+    """
+    Reads a document with one sentence per line, as the pipeline reads the aligned documents
+    :param file: The document
+    :return: The list of sentences, a final newline does not start another sentence
+    """
+    with open(file, 'r') as document:
+        lines = document.read().split('\n')
+    if lines[-1] == '':
+        lines.pop()
+    return lines
+
+
+def load_alignment_manifest(file):
+    """
+    Loads a manifest of document pairs to align, each line holds a source and a target document separated by a tab.
+    Blank lines and lines starting with # are ignored and relative paths are relative to the manifest
+    :param file: The manifest file
+    :return: A list of (source document, target document) tuples
+    """
+    pairs = []
+    directory = os.path.dirname(os.path.abspath(file))
+    with open(file, 'r', encoding='utf-8') as manifest:
+        for line_number, line in enumerate(manifest, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            documents = [document.strip() for document in line.split('\t')]
+            if len(documents) != 2 or not all(documents):
+                raise ValueError(f"Expected a source and a target document on line {line_number} of {file}")
+            pairs.append(tuple(os.path.join(directory, document) for document in documents))
+    return pairs
+
+
+def _run_aligner_script(aligner_path, script, arguments, cwd):
+    """
+    Runs one of the Microsoft Bilingual Sentence Aligner perl scripts, raising CalledProcessError if the script dies
+    """
+    subprocess.run(["perl", os.path.join(aligner_path, script)] + arguments, cwd=cwd, stdout=subprocess.DEVNULL,
+                   stderr=subprocess.PIPE, check=True)
+
+
+def _call_batch_perl_alignment(pairs, aligner_path, workers, threshold):
+    """
+    Runs the stages of the multi file perl aligner align-sents-all-multi-file.pl over copies of the documents. The
+    pairs are split across one directory per worker so the per pair scripts and the word based pass, which reads
+    model-one and sentence-file-pair-list from its working directory, run in parallel
+    :return: The list of (source .aligned, target .aligned, number of aligned sentence pairs) or None for each pair
+    """
+    aligner_path = os.path.abspath(aligner_path)
+    results = [None] * len(pairs)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        chunks = [os.path.join(temp_dir, f'chunk{chunk}') for chunk in range(max(1, min(workers, len(pairs))))]
+        staged = []
+        for chunk in chunks:
+            os.mkdir(chunk)
+        for i, (source_file, target_file) in enumerate(pairs):
+            chunk = chunks[i % len(chunks)]
+            # The word based pass names its files after the pair list entries so these must be bare file names
+            staged.append((chunk, f'doc{i}_1.snt', f'doc{i}_2.snt'))
+            shutil.copyfile(source_file, os.path.join(chunk, staged[-1][1]))
+            shutil.copyfile(target_file, os.path.join(chunk, staged[-1][2]))
+
+        def length_pass(i):
+            chunk, sent_file_1, sent_file_2 = staged[i]
+            try:
+                _run_aligner_script(aligner_path, "align-sents-dp-beam7.pl", [sent_file_1, sent_file_2], chunk)
+                _run_aligner_script(aligner_path, "filter-initial-aligned-sents.pl", [sent_file_1, sent_file_2],
+                                    chunk)
+                return True
+            except Exception as align_error:
+                logging.error(f"Error with alignment script for {pairs[i][0]} {pairs[i][1]} {align_error}")
+                return False
+
+        with ThreadPoolExecutor(len(chunks)) as executor:
+            aligned = [i for i, done in enumerate(executor.map(length_pass, range(len(pairs)))) if done]
+
+        # One word model is trained on the high probability length based matches of every pair
+        for side in (1, 2):
+            with open(os.path.join(temp_dir, f'all_{side}.snt.words'), 'wb') as words:
+                for i in aligned:
+                    with open(os.path.join(staged[i][0], staged[i][side] + '.words'), 'rb') as pair_words:
+                        shutil.copyfileobj(pair_words, words)
+        _run_aligner_script(aligner_path, "build-model-one-multi-file.pl", ["all_1.snt", "all_2.snt"], temp_dir)
+
+        def word_pass(chunk):
+            shutil.copyfile(os.path.join(temp_dir, 'model-one'), os.path.join(chunk, 'model-one'))
+            with open(os.path.join(chunk, 'sentence-file-pair-list'), 'w') as pair_list:
+                for i in aligned:
+                    if staged[i][0] == chunk:
+                        pair_list.write(f"{staged[i][1]} {staged[i][2]}\n")
+            try:
+                _run_aligner_script(aligner_path, "align-sents-length-plus-words-multi-file2.pl", [], chunk)
+            except Exception as align_error:
+                logging.error(f"Error with alignment script in {chunk} {align_error}")
+
+        def final_pass(i):
+            chunk, sent_file_1, sent_file_2 = staged[i]
+            try:
+                _run_aligner_script(aligner_path, "filter-final-aligned-sents.pl",
+                                    [sent_file_1, sent_file_2, str(threshold)], chunk)
+            except Exception as align_error:
+                logging.error(f"Error with alignment script for {pairs[i][0]} {pairs[i][1]} {align_error}")
+                return
+            aligned_files = (pairs[i][0] + '.aligned', pairs[i][1] + '.aligned')
+            for sent_file, aligned_file in zip((sent_file_1, sent_file_2), aligned_files):
+                shutil.copyfile(os.path.join(chunk, sent_file + '.aligned'), aligned_file)
+            with open(aligned_files[0], 'rb') as aligned_source:
+                results[i] = aligned_files + (sum(1 for _ in aligned_source),)
+
+        with ThreadPoolExecutor(len(chunks)) as executor:
+            list(executor.map(word_pass, chunks))
+            list(executor.map(final_pass, aligned))
+
+    return results
+
+
+def call_batch_sentence_alignment(pairs, aligner_path, engine='perl', workers=None, threshold=0.5):
+    """
+    Aligns many document pairs with a single word model, the equivalent of the Microsoft Bilingual Sentence Aligner
+    align-sents-all-multi-file.pl, writing <document>.aligned next to each document
+    :param pairs: A list of (source document, target document) tuples e.g. from load_alignment_manifest
+    :param aligner_path: The path where the Microsoft Bilingual Sentence Aligner perl script
+    :param engine: perl to run the perl scripts or python to align with the NumPy port
+    :param workers: The number of pairs aligned in parallel, defaults to the number of CPUs
+    :param threshold: The probability a sentence match must exceed to be written out
+    :return: A list with the (source .aligned, target .aligned, number of aligned sentence pairs) of each pair in
+    order, or None for a pair that could not be aligned
+    """
+    workers = workers or os.cpu_count() or 1
+
+    try:
+        if engine == 'python':
+            from .aligner import align_document_pairs
+
+            return align_document_pairs(pairs, threshold, workers)
+        return _call_batch_perl_alignment(pairs, aligner_path, workers, threshold)
+    except Exception as align_error:
+        logging.error(f"Error with batch sentence alignment {align_error}")
+        return [None] * len(pairs)
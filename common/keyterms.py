@@ -0,0 +1,195 @@
+import gc
+import logging
+import multiprocessing
+import os
+import signal
+from multiprocessing.connection import Listener, Client
+
+from .common import load_spacy_model
+from .metrics import timed
+
+TEXTRANK_POS = ('NOUN', 'PROPN', 'ADJ', 'VERB')  # The parts of speech textrank builds keyterms from
+PIPE_BATCH_SIZE = 64  # The number of texts spaCy parses per batch
+SERVER_BACKLOG = 128  # Client connections queued while every server worker is busy
+
+
+def extract_keyterms(doc):
+    """
+    Runs textrank over a parsed document
+    :param doc: The spaCy document
+    :return: The top 5 lemmatised keyterms as (keyterm, score) tuples
+    """
+    # textacy imports spaCy, so it is imported when the first document is parsed rather than with the module
+    from textacy import ke
+
+    return ke.textrank(doc, normalize='lemma', include_pos=TEXTRANK_POS, window_size=5, edge_weighting='binary',
+                       position_bias=False, topn=5)
+
+
+def pipe_keyterms(nlp_source, nlp_target, source_texts, target_texts, batch_size=PIPE_BATCH_SIZE, n_process=1,
+                  extract=extract_keyterms, metrics=None):
+    """
+    Streams aligned texts through the source and target spaCy models with nlp.pipe and extracts their keyterms
+    :param nlp_source: The source language spaCy model
+    :param nlp_target: The target language spaCy model
+    :param source_texts: An iterable of the source texts
+    :param target_texts: An iterable of the target texts, aligned with the source texts
+    :param batch_size: The number of texts spaCy parses per batch
+    :param n_process: The number of processes spaCy parses with
+    :param extract: The function extracting the keyterms of a parsed document
+    :param metrics: Optional Metrics the seconds spent parsing and extracting each document are recorded in, a batch
+    is parsed when its first document is pulled so that document carries the parse time of the batch
+    :return: A generator of (source keyterms, target keyterms) tuples
+    """
+    docs_source = timed(nlp_source.pipe(source_texts, batch_size=batch_size, n_process=n_process), metrics,
+                        'spacy_parse_seconds', side='source')
+    docs_target = timed(nlp_target.pipe(target_texts, batch_size=batch_size, n_process=n_process), metrics,
+                        'spacy_parse_seconds', side='target')
+    for doc_source, doc_target in zip(docs_source, docs_target):
+        if metrics is None:
+            yield extract(doc_source), extract(doc_target)
+            continue
+        with metrics.timer('keyterm_extract_seconds'):
+            keyterms = extract(doc_source), extract(doc_target)
+        yield keyterms
+
+
+class KeytermServer:
+    """
+    Serves the keyterms of batches of aligned texts over a local Unix socket. The source and target spaCy models are
+    loaded once and the worker processes are forked after, so they share the memory of the models copy on write and a
+    batch job that connects neither loads the models nor waits for them.
+
+    The API is a multiprocessing.connection over the socket, one request per connection:
+    * ('keyterms', source texts, target texts) answers ('ok', [(source keyterms, target keyterms), ...]) with the
+      keyterms of each text pair in order, a keyterm is a (keyterm, score) tuple
+    * ('models',) answers ('ok', (source model, target model)) with the names the models were loaded with
+    * a request that fails answers ('error', message)
+
+    Messages are pickled, so the socket is created readable and writable by its owner only. The workers are forked,
+    which needs a platform with the fork start method e.g. Linux
+    """
+
+    def __init__(self, path, nlp_id, nlp_target, workers=1, batch_size=PIPE_BATCH_SIZE, extract=extract_keyterms):
+        """
+        :param path: The Unix socket file, it must not exist
+        :param nlp_id: The source language spaCy model e.g. en_core_web_md
+        :param nlp_target: The target language spaCy model e.g. fr_core_news_md
+        :param workers: The number of worker processes parsing requests in parallel
+        :param batch_size: The number of texts spaCy parses per batch
+        :param extract: The function extracting the keyterms of a parsed document
+        """
+        self.path = path
+        self.models = (nlp_id, nlp_target)
+        self.workers = workers
+        self.batch_size = batch_size
+        self.extract = extract
+        self._nlp = (load_spacy_model(nlp_id), load_spacy_model(nlp_target))
+        umask = os.umask(0o177)
+        try:
+            self._listener = Listener(path, family='AF_UNIX', backlog=SERVER_BACKLOG)
+        finally:
+            os.umask(umask)
+        self._processes = []
+        logging.debug(f"Loaded models {nlp_id} {nlp_target} for the keyterm server {path}")
+
+    def start(self):
+        """
+        Forks the workers, each accepts connections on the shared socket until the server is closed
+        :return: The server
+        """
+        context = multiprocessing.get_context('fork')
+        # The loaded models are moved out of the garbage collector while the workers are forked, so a collection in a
+        # worker does not write to, and so copy, the pages it shares with the other workers
+        gc.freeze()
+        try:
+            for _ in range(self.workers):
+                process = context.Process(target=self._serve, daemon=True)
+                process.start()
+                self._processes.append(process)
+        finally:
+            gc.unfreeze()
+        return self
+
+    def _serve(self):
+        # The server process stops the workers, a Ctrl-C in the terminal only reaches it and a terminated worker exits
+        # straight away rather than running the exit handlers it inherited
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        while True:
+            with self._listener.accept() as connection:
+                try:
+                    connection.send(self._answer(connection.recv()))
+                except (EOFError, OSError) as e:
+                    logging.debug(f"Keyterm client went away {e!r}")
+
+    def _answer(self, request):
+        try:
+            if request[0] == 'keyterms':
+                return 'ok', list(pipe_keyterms(self._nlp[0], self._nlp[1], request[1], request[2], self.batch_size,
+                                                extract=self.extract))
+            if request[0] == 'models':
+                return 'ok', self.models
+            raise ValueError(f"Unknown request {request[0]!r}")
+        except Exception as e:
+            logging.error(f"Keyterm server request failed {e!r}")
+            return 'error', repr(e)
+
+    def join(self):
+        """
+        Waits for the workers, they only stop once the server is closed or they are killed
+        """
+        for process in self._processes:
+            process.join()
+
+    def close(self):
+        for process in self._processes:
+            process.terminate()
+        for process in self._processes:
+            process.join()
+        self._processes = []
+        if self._listener is not None:
+            # Closing the listener removes the socket file
+            self._listener.close()
+            self._listener = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class KeytermClient:
+    """
+    Requests keyterms from a KeytermServer, each request opens its own connection so the requests of many batch jobs
+    are spread over the server workers
+    """
+
+    def __init__(self, path):
+        """
+        :param path: The Unix socket file of the server
+        """
+        self.path = path
+
+    def _request(self, *request):
+        with Client(self.path, family='AF_UNIX') as connection:
+            connection.send(request)
+            status, result = connection.recv()
+        if status != 'ok':
+            raise RuntimeError(f"Keyterm server {self.path} failed {result}")
+        return result
+
+    def models(self):
+        """
+        :return: The names of the source and target models the server loaded
+        """
+        return tuple(self._request('models'))
+
+    def keyterms(self, source_texts, target_texts):
+        """
+        :param source_texts: The source texts
+        :param target_texts: The target texts, aligned with the source texts
+        :return: A list of the (source keyterms, target keyterms) of each text pair
+        """
+        return self._request('keyterms', list(source_texts), list(target_texts))
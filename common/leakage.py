@@ -0,0 +1,256 @@
+import json
+import logging
+import os
+import shutil
+import tempfile
+import unicodedata
+from itertools import islice
+
+import numpy as np
+
+INDEX_VERSION = 1  # Stored in the index metadata, bump it when the signatures or the file layout change
+NUM_PERM = 64  # MinHash permutations per segment
+BANDS = 16  # LSH bands of NUM_PERM // BANDS rows, near duplicates around a Jaccard similarity of 0.5 share a band
+SHINGLE_SIZE = 5  # Characters per shingle, shorter segments are padded to one shingle
+SIMILARITY_THRESHOLD = 0.8  # The estimated Jaccard similarity from which a segment counts as seen
+BATCH_SIZE = 4096  # Segments hashed per batch, bounds the memory used to build or query the index
+MAX_CANDIDATES = 256  # Segments compared per query, those sharing the most bands first
+HASH_BASE = np.uint64(1000003)  # The polynomial base of the shingle hash
+MIX = np.uint64(0x9E3779B97F4A7C15)  # The odd multiplier mixing shingle hashes and band keys
+
+
+def normalise(text):
+    """
+    :return: The unicode normalised, case folded text with its whitespace collapsed
+    """
+    return unicodedata.normalize('NFC', ' '.join(text.split())).casefold()
+
+
+def _permutations(num_perm, seed):
+    """
+    :return: The odd multipliers and the offsets of the multiply shift hashes standing in for the permutations
+    """
+    rng = np.random.default_rng(seed)
+    multipliers = rng.integers(1, np.iinfo(np.uint64).max, size=num_perm, dtype=np.uint64) | np.uint64(1)
+    offsets = rng.integers(0, np.iinfo(np.uint64).max, size=num_perm, dtype=np.uint64)
+    return multipliers, offsets
+
+
+def minhash_signatures(texts, num_perm=NUM_PERM, shingle_size=SHINGLE_SIZE, seed=0):
+    """
+    Computes the MinHash signatures of a batch of segments over their character shingles. The shingles of the whole
+    batch are hashed with a rolling polynomial hash in NumPy, there is no Python loop over the shingles
+    :param texts: The segments
+    :param num_perm: The number of permutations
+    :param shingle_size: The characters per shingle
+    :param seed: The random seed of the permutations, an index is only comparable with signatures of the same seed
+    :return: A (len(texts), num_perm) uint32 array
+    """
+    padded = [normalise(text).ljust(shingle_size, '\0') for text in texts]
+    if not padded:
+        return np.zeros((0, num_perm), dtype=np.uint32)
+    lengths = np.array([len(text) for text in padded], dtype=np.int64)
+    codes = np.frombuffer(''.join(padded).encode('utf-32-le'), dtype=np.uint32).astype(np.uint64)
+
+    windows = len(codes) - shingle_size + 1
+    hashes = np.zeros(windows, dtype=np.uint64)
+    with np.errstate(over='ignore'):
+        for offset in range(shingle_size):
+            hashes = hashes * HASH_BASE + codes[offset:offset + windows]
+        hashes = (hashes ^ (hashes >> np.uint64(29))) * MIX
+
+    # Keep the shingles that lie within one segment, each segment has at least one
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    segment = np.repeat(np.arange(len(padded)), lengths)[:windows]
+    valid = np.arange(windows) - starts[segment] <= lengths[segment] - shingle_size
+    hashes = hashes[valid]
+    first_shingle = np.concatenate(([0], np.cumsum(lengths - shingle_size + 1)[:-1]))
+
+    multipliers, offsets = _permutations(num_perm, seed)
+    signatures = np.empty((len(padded), num_perm), dtype=np.uint32)
+    with np.errstate(over='ignore'):
+        for perm in range(num_perm):
+            permuted = (hashes * multipliers[perm] + offsets[perm]) >> np.uint64(32)
+            signatures[:, perm] = np.minimum.reduceat(permuted, first_shingle)
+    return signatures
+
+
+def band_keys(signatures, bands):
+    """
+    :param signatures: A (segments, permutations) uint32 array
+    :param bands: The number of bands the permutations are split into
+    :return: A (bands, segments) uint64 array hashing the rows of each band
+    """
+    rows = signatures.shape[1] // bands
+    keys = np.zeros((bands, len(signatures)), dtype=np.uint64)
+    with np.errstate(over='ignore'):
+        for band in range(bands):
+            for row in signatures[:, band * rows:(band + 1) * rows].T:
+                keys[band] = (keys[band] ^ row.astype(np.uint64)) * MIX
+    return keys
+
+
+def _batches(texts, batch_size):
+    texts = iter(texts)
+    batch = list(islice(texts, batch_size))
+    while batch:
+        yield batch
+        batch = list(islice(texts, batch_size))
+
+
+class LeakageIndex:
+    """
+    A MinHash LSH index of the segments of the training memories, persisted as memory mapped files, so checking whether
+    a test or evaluation segment, or a near duplicate of it, was seen in training takes a binary search per band
+    rather than a comparison with every training segment:
+    * meta.json with the parameters and the number of segments
+    * signatures.u32, the (segments, permutations) MinHash signatures
+    * band_keys.u64 and band_ids.u32, the (bands, segments) band hashes, sorted within each band, and their segments
+    """
+
+    def __init__(self, path):
+        """
+        :param path: The index directory written by build
+        """
+        self.path = path
+        with open(os.path.join(path, 'meta.json'), 'r') as meta_file:
+            meta = json.load(meta_file)
+        if meta['version'] != INDEX_VERSION:
+            raise ValueError(f"Leakage index {path} is version {meta['version']}, rebuild it for version "
+                             f"{INDEX_VERSION}")
+        self.num_perm = meta['num_perm']
+        self.bands = meta['bands']
+        self.shingle_size = meta['shingle_size']
+        self.seed = meta['seed']
+        self.count = meta['count']
+        self._signatures = self._band_keys = self._band_ids = None
+        if self.count:
+            self._signatures = np.memmap(os.path.join(path, 'signatures.u32'), np.uint32, 'r',
+                                         shape=(self.count, self.num_perm))
+            self._band_keys = np.memmap(os.path.join(path, 'band_keys.u64'), np.uint64, 'r',
+                                        shape=(self.bands, self.count))
+            self._band_ids = np.memmap(os.path.join(path, 'band_ids.u32'), np.uint32, 'r',
+                                       shape=(self.bands, self.count))
+
+    @staticmethod
+    def build(path, texts, num_perm=NUM_PERM, bands=BANDS, shingle_size=SHINGLE_SIZE, seed=0,
+              batch_size=BATCH_SIZE):
+        """
+        Builds an index in one streaming pass, the signatures and band hashes are appended to files a batch at a time
+        and each band is then sorted on its own, so memory is bounded by one band rather than the whole index. The
+        index is written next to path and moved over any index there
+        :param path: The index directory
+        :param texts: An iterable of the segments to index, a segment's id is its position
+        :param num_perm: The number of MinHash permutations
+        :param bands: The number of LSH bands, it must divide num_perm
+        :param shingle_size: The characters per shingle
+        :param seed: The random seed of the permutations
+        :param batch_size: The number of segments hashed at a time
+        :return: The number of segments indexed
+        """
+        if num_perm % bands:
+            raise ValueError(f"{bands} bands do not divide {num_perm} permutations")
+        parent = os.path.dirname(os.path.abspath(path))
+        build_path = tempfile.mkdtemp(dir=parent, prefix='.leakage-')
+        try:
+            count = 0
+            band_files = [open(os.path.join(build_path, f'band_{band}.tmp'), 'wb') for band in range(bands)]
+            with open(os.path.join(build_path, 'signatures.u32'), 'wb') as signature_file:
+                for batch in _batches(texts, batch_size):
+                    signatures = minhash_signatures(batch, num_perm, shingle_size, seed)
+                    signature_file.write(signatures.tobytes())
+                    for band_file, keys in zip(band_files, band_keys(signatures, bands)):
+                        band_file.write(keys.tobytes())
+                    count += len(batch)
+            for band_file in band_files:
+                band_file.close()
+
+            if count:
+                sorted_keys = np.memmap(os.path.join(build_path, 'band_keys.u64'), np.uint64, 'w+',
+                                        shape=(bands, count))
+                sorted_ids = np.memmap(os.path.join(build_path, 'band_ids.u32'), np.uint32, 'w+',
+                                       shape=(bands, count))
+                for band in range(bands):
+                    band_file = os.path.join(build_path, f'band_{band}.tmp')
+                    keys = np.fromfile(band_file, dtype=np.uint64)
+                    order = np.argsort(keys, kind='stable')
+                    sorted_keys[band] = keys[order]
+                    sorted_ids[band] = order
+                    os.remove(band_file)
+                sorted_keys.flush()
+                sorted_ids.flush()
+                del sorted_keys, sorted_ids
+            else:
+                for band in range(bands):
+                    os.remove(os.path.join(build_path, f'band_{band}.tmp'))
+
+            with open(os.path.join(build_path, 'meta.json'), 'w') as meta_file:
+                json.dump({'version': INDEX_VERSION, 'num_perm': num_perm, 'bands': bands,
+                           'shingle_size': shingle_size, 'seed': seed, 'count': count}, meta_file)
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            os.replace(build_path, path)
+        except BaseException:
+            shutil.rmtree(build_path, ignore_errors=True)
+            raise
+        logging.debug(f"Indexed {count} segments in {path}")
+        return count
+
+    def __len__(self):
+        return self.count
+
+    def query(self, texts, batch_size=BATCH_SIZE):
+        """
+        Finds the most similar indexed segment of each text among the segments sharing a band with it
+        :param texts: The segments to look up
+        :param batch_size: The number of segments hashed at a time
+        :return: The estimated Jaccard similarity of the closest indexed segment of each text, 0 if none shares a
+        band or the text is empty, and its id, -1 if there is none
+        """
+        similarities, ids = [], []
+        for batch in _batches(texts, batch_size):
+            batch_similarities = np.zeros(len(batch))
+            batch_ids = np.full(len(batch), -1, dtype=np.int64)
+            if self.count:
+                signatures = minhash_signatures(batch, self.num_perm, self.shingle_size, self.seed)
+                keys = band_keys(signatures, self.bands)
+                candidates = [[] for _ in batch]
+                for band in range(self.bands):
+                    lower = np.searchsorted(self._band_keys[band], keys[band], 'left')
+                    # A bucket larger than this holds copies of much the same text, any of them will do
+                    upper = np.minimum(np.searchsorted(self._band_keys[band], keys[band], 'right'),
+                                       lower + MAX_CANDIDATES)
+                    for i in np.flatnonzero(upper > lower):
+                        candidates[i].append(self._band_ids[band, lower[i]:upper[i]])
+                for i, text_candidates in enumerate(candidates):
+                    if not text_candidates or not batch[i].strip():
+                        continue
+                    segment_ids, bands = np.unique(np.concatenate(text_candidates), return_counts=True)
+                    if len(segment_ids) > MAX_CANDIDATES:
+                        segment_ids = np.sort(segment_ids[np.argsort(-bands, kind='stable')[:MAX_CANDIDATES]])
+                    agreement = (self._signatures[segment_ids] == signatures[i]).mean(axis=1)
+                    best = int(np.argmax(agreement))
+                    batch_similarities[i] = agreement[best]
+                    batch_ids[i] = segment_ids[best]
+            similarities.append(batch_similarities)
+            ids.append(batch_ids)
+        if not similarities:
+            return np.zeros(0), np.zeros(0, dtype=np.int64)
+        return np.concatenate(similarities), np.concatenate(ids)
+
+    def seen(self, texts, threshold=SIMILARITY_THRESHOLD):
+        """
+        :param texts: The segments to look up
+        :param threshold: The estimated Jaccard similarity from which a segment counts as seen
+        :return: A boolean array, True for the texts with a near duplicate in the index
+        """
+        return self.query(texts)[0] >= threshold
+
+    def close(self):
+        self._signatures = self._band_keys = self._band_ids = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
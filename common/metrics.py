@@ -0,0 +1,239 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0,
+                   900.0)  # The upper bounds in seconds of the latency histogram buckets, the last bucket is unbounded
+PROMETHEUS_EXTENSION = '.prom'  # Metrics files with this extension are written in the Prometheus text format
+
+
+def _labels(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _prometheus_labels(labels, extra=()):
+    labels = list(labels) + list(extra)
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_prometheus_escape(value)}"' for name, value in labels) + '}'
+
+
+def _prometheus_escape(value):
+    """
+    :return: The label value escaped as the text format requires, backslash first so the other escapes are kept
+    """
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Metrics:
+    """
+    The counters and latency histograms of a run, e.g. the seconds spent in each stage, the translation requests and
+    characters billed and the cache hits. Recording is thread safe, worker processes record into their own Metrics and
+    the run merges their snapshots. A snapshot is written as JSON or in the Prometheus text format
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        """
+        :param buckets: The upper bounds of the histogram buckets, in increasing order
+        """
+        self.buckets = tuple(buckets)
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._counters = {}  # (name, labels) to the count
+        self._histograms = {}  # (name, labels) to [the count per bucket and one for the unbounded bucket, the sum]
+
+    def increment(self, name, value=1, **labels):
+        """
+        Adds to a counter, e.g. increment('translation_requests_total', status=200)
+        """
+        key = (name, _labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        """
+        Adds an observation, e.g. a latency in seconds, to a histogram
+        """
+        key = (name, _labels(labels))
+        bucket = bisect_left(self.buckets, value)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            histogram[0][bucket] += 1
+            histogram[1] += value
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """
+        Observes the seconds the body of the with statement takes, whether or not it raises
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def stage(self, stage):
+        """
+        :return: A timer of a pipeline stage, observed in the stage_seconds histogram
+        """
+        return self.timer('stage_seconds', stage=stage)
+
+    def counter(self, name, **labels):
+        """
+        :return: The value of a counter, 0 if nothing was counted
+        """
+        with self._lock:
+            return self._counters.get((name, _labels(labels)), 0)
+
+    def _quantile(self, counts, quantile):
+        """
+        :return: The upper bound of the bucket holding the quantile, None if it is in the unbounded bucket
+        """
+        rank, seen = quantile * sum(counts), 0
+        for bound, count in zip(self.buckets, counts):
+            seen += count
+            if count and seen >= rank:
+                return bound
+        return None
+
+    def snapshot(self):
+        """
+        :return: A JSON serialisable dictionary of the counters and histograms, the histograms with the count of each
+        bucket, their sum, count, mean and the bucket bounds of their median and 95th percentile
+        """
+        with self._lock:
+            counters = [{'name': name, 'labels': dict(labels), 'value': value}
+                        for (name, labels), value in sorted(self._counters.items())]
+            histograms = []
+            for (name, labels), (counts, total) in sorted(self._histograms.items()):
+                count = sum(counts)
+                histograms.append({'name': name, 'labels': dict(labels), 'counts': list(counts), 'sum': total,
+                                   'count': count, 'mean': total / count if count else 0.0,
+                                   'p50': self._quantile(counts, 0.5), 'p95': self._quantile(counts, 0.95)})
+        return {'started': self.started, 'elapsed_seconds': time.time() - self.started, 'buckets': list(self.buckets),
+                'counters': counters, 'histograms': histograms}
+
+    def merge(self, snapshot):
+        """
+        Adds the counters and histograms of a snapshot, e.g. of a worker process, to these metrics
+        :param snapshot: A snapshot of a Metrics with the same buckets
+        """
+        if list(snapshot['buckets']) != list(self.buckets):
+            raise ValueError('Metrics with different histogram buckets cannot be merged')
+        with self._lock:
+            for counter in snapshot['counters']:
+                key = (counter['name'], _labels(counter['labels']))
+                self._counters[key] = self._counters.get(key, 0) + counter['value']
+            for merged in snapshot['histograms']:
+                key = (merged['name'], _labels(merged['labels']))
+                histogram = self._histograms.get(key)
+                if histogram is None:
+                    histogram = self._histograms[key] = [[0] * (len(self.buckets) + 1), 0.0]
+                histogram[0] = [count + other for count, other in zip(histogram[0], merged['counts'])]
+                histogram[1] += merged['sum']
+
+    def prometheus(self):
+        """
+        :return: The metrics in the Prometheus text exposition format
+        """
+        lines = []
+        with self._lock:
+            typed = set()
+            for (name, labels), value in sorted(self._counters.items()):
+                if name not in typed:
+                    lines.append(f'# TYPE {name} counter')
+                    typed.add(name)
+                lines.append(f'{name}{_prometheus_labels(labels)} {value}')
+            for (name, labels), (counts, total) in sorted(self._histograms.items()):
+                if name not in typed:
+                    lines.append(f'# TYPE {name} histogram')
+                    typed.add(name)
+                cumulative = 0
+                for bound, count in zip(self.buckets + ('+Inf',), counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{_prometheus_labels(labels, [("le", bound)])} {cumulative}')
+                lines.append(f'{name}_sum{_prometheus_labels(labels)} {total}')
+                lines.append(f'{name}_count{_prometheus_labels(labels)} {cumulative}')
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        """
+        Writes the metrics, in the Prometheus text format if the file ends in .prom and as JSON otherwise. The file is
+        replaced in one step so a scraper never reads a partial file
+        """
+        text = self.prometheus() if path.endswith(PROMETHEUS_EXTENSION) else json.dumps(self.snapshot(), indent=2)
+        directory = os.path.dirname(os.path.abspath(path))
+        with tempfile.NamedTemporaryFile('w', dir=directory, prefix='.metrics-', delete=False) as temp_file:
+            temp_file.write(text)
+        os.replace(temp_file.name, path)
+        logging.debug(f"Wrote the metrics to {path}")
+
+
+def timed(iterable, metrics, name, **labels):
+    """
+    Observes the seconds each item of an iterable takes to produce, e.g. the documents of a lazy spaCy pipe, without
+    counting the time the consumer spends on the items
+    :param iterable: The iterable
+    :param metrics: The Metrics, the items are passed through untimed if None
+    :param name: The histogram the seconds are observed in
+    :return: A generator of the items of the iterable
+    """
+    if metrics is None:
+        yield from iterable
+        return
+    iterator = iter(iterable)
+    while True:
+        started = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        metrics.observe(name, time.perf_counter() - started, **labels)
+        yield item
+
+
+@contextmanager
+def profile(path):
+    """
+    Profiles the body of the with statement, doing nothing if path is None. A path ending in .html is profiled with
+    the pyinstrument sampling profiler, which needs pyinstrument, any other path with cProfile, whose stats file can
+    be read with pstats or snakeviz
+    :param path: The profile file
+    """
+    if not path:
+        yield
+        return
+
+    if path.endswith('.html'):
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            raise ImportError('The html profile needs pyinstrument, pip install pyinstrument or use a .prof file')
+        profiler = Profiler()
+        profiler.start()
+        try:
+            yield
+        finally:
+            profiler.stop()
+            with open(path, 'w', encoding='utf-8') as profile_file:
+                profile_file.write(profiler.output_html())
+            logging.info(f"Wrote the profile to {path}")
+        return
+
+    import cProfile
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+        logging.info(f"Wrote the profile to {path}")
@@ -0,0 +1,146 @@
+import hashlib
+import io
+import logging
+import os
+import tempfile
+from multiprocessing import Pool
+
+from pdfminer.converter import TextConverter
+from pdfminer.layout import LAParams
+from pdfminer.pdfdocument import PDFDocument
+from pdfminer.pdfinterp import PDFResourceManager, PDFPageInterpreter
+from pdfminer.pdfpage import PDFPage
+from pdfminer.pdfparser import PDFParser
+
+TEXT_CACHE_VERSION = '1'  # Part of the cache key, bump it when the extraction changes so stale text is not reused
+
+
+def file_hash(file):
+    """
+    :param file: The file
+    :return: The sha256 hex digest of the file contents
+    """
+    digest = hashlib.sha256()
+    with open(file, 'rb') as data:
+        for block in iter(lambda: data.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def count_pages(file):
+    """
+    :param file: The pdf file
+    :return: The number of pages, only the page tree is read
+    """
+    with open(file, 'rb') as fp:
+        return sum(1 for _ in PDFPage.create_pages(PDFDocument(PDFParser(fp))))
+
+
+def extract_pages(file, pagenos=None):
+    """
+    Converts pages of a pdf to text with pdfminer's default layout analysis, every page ends with a form feed
+    :param file: The pdf file
+    :param pagenos: The zero based page numbers to extract, None for every page
+    :return: The text of the pages in page order
+    """
+    rsrc_mgr = PDFResourceManager()
+    ret_str = io.StringIO()
+    device = TextConverter(rsrc_mgr, ret_str, laparams=LAParams())
+    interpreter = PDFPageInterpreter(rsrc_mgr, device)
+    with open(file, 'rb') as fp:
+        for page in PDFPage.get_pages(fp, pagenos, maxpages=max(pagenos) + 1 if pagenos else 0):
+            interpreter.process_page(page)
+    device.close()
+    # The buffer is read once at the end, reading it after every page copies it again for each page
+    return ret_str.getvalue()
+
+
+def _extract_task(task):
+    file, pagenos = task
+    return extract_pages(file, set(pagenos) if pagenos is not None else None)
+
+
+class TextCache:
+    """
+    A directory of extracted pdf text keyed on a hash of the pdf contents, so a document that is evaluated again, e.g.
+    against other models, is not extracted again
+    """
+
+    def __init__(self, path):
+        """
+        :param path: The cache directory, it is created if it does not exist
+        """
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def _file(self, key):
+        return os.path.join(self.path, key + '.txt')
+
+    def get(self, key):
+        """
+        :return: The cached text or None on a miss
+        """
+        try:
+            with open(self._file(key), 'r', encoding='utf-8', newline='') as text:
+                return text.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, key, text):
+        """
+        Stores the text, written to a temporary file first so a concurrent reader never sees part of it
+        """
+        fd, temp_file = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8', newline='') as temp:
+            temp.write(text)
+        os.replace(temp_file, self._file(key))
+
+
+def extract_pdf_texts(files, workers=None, cache_path=None):
+    """
+    Converts pdf documents to text, the pages of all the documents are split across one process pool and joined back
+    in page order, so the text is the same as extracting each document serially
+    :param files: The pdf files
+    :param workers: The number of processes, defaults to the number of CPUs, 1 extracts in this process
+    :param cache_path: An optional directory caching the text of each pdf by a hash of its contents
+    :return: The text of each document, in the order of files
+    """
+    cache = TextCache(cache_path) if cache_path else None
+    workers = workers or os.cpu_count() or 1
+    texts = [None] * len(files)
+    keys = [None] * len(files)
+    tasks = []
+
+    for i, file in enumerate(files):
+        if cache:
+            keys[i] = file_hash(file) + '-' + TEXT_CACHE_VERSION
+            texts[i] = cache.get(keys[i])
+            if texts[i] is not None:
+                logging.debug(f"Read the text of {file} from the cache")
+                continue
+        texts[i] = ''
+        if workers == 1:
+            tasks.append((i, (file, None)))
+            continue
+        pages = count_pages(file)
+        # Every task parses the document structure again, so each worker gets one run of consecutive pages
+        chunk = max(1, -(-pages // workers))
+        tasks += [(i, (file, list(range(start, min(start + chunk, pages))))) for start in range(0, pages, chunk)]
+
+    if tasks:
+        if workers == 1 or len(tasks) == 1:
+            results = [_extract_task(task) for _, task in tasks]
+        else:
+            with Pool(workers) as pool:
+                results = pool.map(_extract_task, [task for _, task in tasks])
+        # The tasks of a document are in page order so its text is their concatenation
+        pieces = [[] for _ in files]
+        for (i, _), text in zip(tasks, results):
+            pieces[i].append(text)
+        for i in {i for i, _ in tasks}:
+            texts[i] = ''.join(pieces[i])
+            if cache:
+                cache.put(keys[i], texts[i])
+        logging.debug(f"Extracted {len(tasks)} page ranges of {len(set(i for i, _ in tasks))} pdf documents")
+
+    return texts
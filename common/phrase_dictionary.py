@@ -0,0 +1,126 @@
+import logging
+import os
+import sqlite3
+import tempfile
+import unicodedata
+
+BUSY_TIMEOUT = 60  # Seconds a writer waits for another process holding the dictionary write lock
+
+
+class PhraseDictionary:
+    """
+    A phrase dictionary in an indexed SQLite file. Lookups go through the primary key index rather than a dictionary
+    loaded into memory, so opening it costs the same whatever its size, and concurrent workers and batch jobs can add
+    phrases to the same file, each batch in its own transaction
+    """
+
+    def __init__(self, path, read_only=False):
+        """
+        :param path: The SQLite phrase dictionary file, it is created if it does not exist
+        :param read_only: Open the dictionary for lookups only, e.g. to export it
+        """
+        self.path = path
+        self.read_only = read_only
+        if read_only:
+            self._connection = sqlite3.connect('file:' + path + '?mode=ro', uri=True, timeout=BUSY_TIMEOUT,
+                                               check_same_thread=False)
+        else:
+            # Autocommit mode so add_many controls its own transaction
+            self._connection = sqlite3.connect(path, timeout=BUSY_TIMEOUT, isolation_level=None,
+                                               check_same_thread=False)
+            # Readers do not block the writer, or each other, in write-ahead logging mode
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS phrases (key TEXT PRIMARY KEY, source TEXT NOT NULL, '
+                                     'target TEXT NOT NULL)')
+
+    @staticmethod
+    def key(phrase):
+        """
+        :param phrase: The source phrase
+        :return: The lookup key, the whitespace and unicode normalised phrase. The case is kept, the phrase dictionary
+        is case sensitive so each case variant of a phrase is its own entry
+        """
+        return unicodedata.normalize('NFC', ' '.join(phrase.split()))
+
+    def get(self, phrase):
+        """
+        :return: The target phrase of the first whitespace variant of the phrase added, or None if it is not in the
+        dictionary
+        """
+        row = self._connection.execute('SELECT target FROM phrases WHERE key = ?', (self.key(phrase),)).fetchone()
+        return row[0] if row else None
+
+    def __contains__(self, phrase):
+        return self.get(phrase) is not None
+
+    def __len__(self):
+        return self._connection.execute('SELECT COUNT(*) FROM phrases').fetchone()[0]
+
+    def items(self):
+        """
+        :return: A generator of the (source phrase, target phrase) tuples in the order they were added
+        """
+        for source, target in self._connection.execute('SELECT source, target FROM phrases ORDER BY rowid'):
+            yield source, target
+
+    def add_many(self, phrases):
+        """
+        Adds phrases in a single transaction, a phrase whose whitespace variant is already in the dictionary keeps its
+        existing target phrase
+        :param phrases: An iterable of (source phrase, target phrase) tuples
+        :return: The number of phrases added
+        """
+        rows = [(self.key(source), ' '.join(source.split()), ' '.join(target.split())) for source, target in phrases]
+        # Take the write lock up front so a concurrent writer waits for the whole batch rather than failing part way
+        self._connection.execute('BEGIN IMMEDIATE')
+        try:
+            changes = self._connection.total_changes
+            self._connection.executemany('INSERT OR IGNORE INTO phrases VALUES (?, ?, ?)', rows)
+            added = self._connection.total_changes - changes
+            self._connection.execute('COMMIT')
+        except BaseException:
+            self._connection.execute('ROLLBACK')
+            raise
+        return added
+
+    def export_text(self, source_file, target_file):
+        """
+        Writes the dictionary as the pair of line aligned plain text files Custom Translator takes for a phrase
+        dictionary, one phrase per line. Both files are written next to their destination and moved over it
+        :param source_file: The source language file
+        :param target_file: The target language file
+        :return: The number of phrases written
+        """
+        temp_files = []
+        try:
+            for file in (source_file, target_file):
+                fd, temp_file = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(file)), suffix='.tmp')
+                temp_files.append((os.fdopen(fd, 'w', encoding='utf-8', newline='\n'), temp_file))
+            count = 0
+            for source, target in self.items():
+                temp_files[0][0].write(source + '\n')
+                temp_files[1][0].write(target + '\n')
+                count += 1
+            for temp, _ in temp_files:
+                temp.close()
+            for (_, temp_file), file in zip(temp_files, (source_file, target_file)):
+                os.replace(temp_file, file)
+        except BaseException:
+            for temp, temp_file in temp_files:
+                temp.close()
+                if os.path.exists(temp_file):
+                    os.remove(temp_file)
+            raise
+        logging.debug(f"Exported {count} phrases to {source_file} and {target_file}")
+        return count
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,208 @@
+import csv
+import json
+import os
+import shutil
+import tempfile
+from html import escape
+
+REPORT_FORMATS = ('csv', 'html', 'txt', 'jsonl', 'parquet')
+BUFFER_SIZE = 1 << 20  # Bytes buffered per report file before a write reaches the disk
+PARQUET_ROW_GROUP = 10000  # Rows held in memory before a Parquet row group is written
+HTML_TABLE_STYLE = 'border:1px solid; width:50%; float:left'
+
+
+class _Report:
+    """
+    A report written a row at a time through one buffered file, the file is replaced rather than appended to
+    """
+
+    def __init__(self, path, newline=None):
+        self.path = path
+        self._file = open(path, 'w', encoding='utf-8', newline=newline, buffering=BUFFER_SIZE)
+        self.rows = 0
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class CSVReport(_Report):
+    """
+    A CSV report laid out as pandas.DataFrame.to_csv, with the row number as an unnamed first column
+    """
+
+    def __init__(self, path, columns):
+        """
+        :param path: The CSV file
+        :param columns: The column names
+        """
+        super().__init__(path, newline='')
+        self._writer = csv.writer(self._file, lineterminator=os.linesep)
+        self._writer.writerow([''] + list(columns))
+
+    def write_row(self, values):
+        """
+        :param values: The values of a row, in the order of the columns
+        """
+        self._writer.writerow([self.rows] + list(values))
+        self.rows += 1
+
+
+class JSONLReport(_Report):
+    """
+    A JSON lines report, one object per row keyed on the column names
+    """
+
+    def __init__(self, path, columns):
+        super().__init__(path)
+        self.columns = list(columns)
+
+    def write_row(self, values):
+        self._file.write(json.dumps(dict(zip(self.columns, values)), ensure_ascii=False) + '\n')
+        self.rows += 1
+
+
+class TextReport(_Report):
+    """
+    A plain text report with one row per line, without a newline after the last row
+    """
+
+    def write_row(self, text):
+        """
+        :param text: The row text, it may itself span several lines
+        """
+        if self.rows:
+            self._file.write('\n')
+        self._file.write(text)
+        self.rows += 1
+
+
+class HTMLReport(_Report):
+    """
+    The sentence aligned HTML report of one model, a table of the source and reference sentences beside a table of
+    the machine translated and reference sentences. The second table is spooled to a temporary file while the first is
+    written, so memory use does not grow with the document
+    """
+
+    def __init__(self, path, title, source_doc, translated_doc):
+        """
+        :param path: The HTML file
+        :param title: The page title
+        :param source_doc: The source document, the heading of the first table
+        :param translated_doc: The human translated document, the heading of the second table
+        """
+        super().__init__(path)
+        self._spool = tempfile.SpooledTemporaryFile(max_size=BUFFER_SIZE, mode='w+', encoding='utf-8')
+        self._file.write(f'<!DOCTYPE html><html lang="en"><head><meta charset="UTF-8"><title>{escape(title)}</title>'
+                         f'</head><body><div>{self._table(source_doc)}')
+        self._spool.write(self._table(translated_doc))
+
+    @staticmethod
+    def _table(document):
+        return (f'<table id="{escape(document)}" style="{HTML_TABLE_STYLE}" frame="void" rules="rows">'
+                f'<tr><td><u>{escape(document)}</u></td></tr>')
+
+    def write_row(self, source_text, reference, translation):
+        """
+        :param source_text: The source sentence
+        :param reference: The human translated sentence
+        :param translation: The machine translated sentence
+        """
+        reference = escape(reference)
+        self._file.write(f'<tr><td>ENU: {escape(source_text)}</td></tr><tr><td>REF: {reference}</td></tr>\n')
+        self._spool.write(f'<tr><td>MT: {escape(translation)}</td></tr><tr><td>REF: {reference}</td></tr>\n')
+        self.rows += 1
+
+    def close(self):
+        if self._file.closed:
+            return
+        self._file.write('</table>')
+        self._spool.write('</table>')
+        self._spool.seek(0)
+        shutil.copyfileobj(self._spool, self._file)
+        self._spool.close()
+        self._file.write('</div></body></html>')
+        super().close()
+
+
+class ParquetReport:
+    """
+    A Parquet report written a row group at a time, this needs pyarrow
+    """
+
+    def __init__(self, path, columns, row_group=PARQUET_ROW_GROUP):
+        """
+        :param path: The Parquet file
+        :param columns: The column names
+        :param row_group: The number of rows per row group
+        """
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError('The parquet report needs pyarrow, pip install pyarrow or choose another format')
+        self._pyarrow = pyarrow
+        self._parquet = pyarrow.parquet
+        self.path = path
+        self.columns = list(columns)
+        self.row_group = row_group
+        self.rows = 0
+        self._batch = []
+        self._writer = None
+
+    def _flush(self):
+        if not self._batch:
+            return
+        table = self._pyarrow.Table.from_pylist([dict(zip(self.columns, values)) for values in self._batch])
+        if self._writer is None:
+            self._writer = self._parquet.ParquetWriter(self.path, table.schema)
+        self._writer.write_table(table)
+        self._batch = []
+
+    def write_row(self, values):
+        self._batch.append(list(values))
+        self.rows += 1
+        if len(self._batch) >= self.row_group:
+            self._flush()
+
+    def close(self):
+        self._flush()
+        if self._writer is None and not self.rows:
+            self._writer = self._parquet.ParquetWriter(self.path, self._pyarrow.table(
+                {column: self._pyarrow.array([], self._pyarrow.string()) for column in self.columns}).schema)
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def open_table_reports(path, columns, formats):
+    """
+    Opens the tabular reports of a run, one writer per format sharing the same rows
+    :param path: The report file path without its extension
+    :param columns: The column names
+    :param formats: Any of csv, jsonl and parquet, other formats are ignored
+    :return: The list of open reports
+    """
+    writers = {'csv': CSVReport, 'jsonl': JSONLReport, 'parquet': ParquetReport}
+    reports = []
+    try:
+        for report_format in formats:
+            if report_format in writers:
+                reports.append(writers[report_format](path + os.extsep + report_format, columns))
+    except Exception:
+        for report in reports:
+            report.close()
+        raise
+    return reports
@@ -0,0 +1,647 @@
+import math
+import re
+from multiprocessing import Pool
+
+import numpy as np
+
+METRICS = ('bleu', 'chrf', 'ter')
+DEFAULT_METRICS = ('bleu', 'chrf')  # TER takes many times as long as BLEU and chrF to compute, it is opt in
+NGRAM_ORDER = 4  # The word n-gram order of BLEU
+CHRF_ORDER = 6  # The character n-gram order of chrF
+CHRF_BETA = 2  # chrF weighs recall beta times as much as precision
+BOOTSTRAP_SAMPLES = 1000  # Resamples of the paired bootstrap significance test
+BOOTSTRAP_SEED = 12345  # The sacrebleu default seed, so repeated runs report the same p-values
+BOOTSTRAP_CHUNK = 100  # Resamples summed at once, bounds the memory of the resample weights
+
+# The TERCOM limits sacrebleu's TER uses
+TER_MAX_SHIFT_SIZE = 10  # The longest run of words moved by a single shift
+TER_MAX_SHIFT_DIST = 50  # The furthest apart the hypothesis and reference positions of a shift can be
+TER_BEAM_WIDTH = 25  # Reference positions either side of the diagonal the edit distance covers
+TER_MAX_SHIFT_CANDIDATES = 1000  # Shifts tried per sentence before the search gives up
+TER_INFINITY = 10 ** 16
+TER_NOP, TER_SUB, TER_INS, TER_DEL = range(4)
+
+WHITESPACE = re.compile(r'\s+')
+# The mteval-v13a tokenization sacrebleu computes BLEU on by default. Spacing out the symbols is one translate call
+# rather than a regular expression substitution, which makes it several times faster than sacrebleu's tokenize_13a
+SYMBOLS_13A = {ord(symbol): f' {symbol} ' for symbol in '{|}~[\\]^_` !"#$%&()*+:;<=>?@/'}
+ENTITIES_13A = (('<skipped>', ''), ('-\n', ''), ('\n', ' '), ('&quot;', '"'), ('&amp;', '&'), ('&lt;', '<'),
+                ('&gt;', '>'))
+PERIOD_AFTER_13A = re.compile(r'([^0-9])([\.,])')  # Period and comma not preceded by a digit
+PERIOD_BEFORE_13A = re.compile(r'([\.,])([^0-9])')  # Period and comma not followed by a digit
+DASH_13A = re.compile(r'([0-9])(-)')  # Dash preceded by a digit
+CHARACTER_COUNT = 0x110000  # The number of unicode code points, characters are their own ids
+
+_ter_worker = {}  # The reference words each TER worker process scores against
+
+
+def _flatten(ids, lengths):
+    """
+    :param ids: The concatenated token ids of a batch of sentences
+    :param lengths: The number of tokens of each sentence
+    :return: The sentence of each token and the number of tokens from each token to the end of its sentence
+    """
+    lengths = np.asarray(lengths, dtype=np.int64)
+    segments = np.repeat(np.arange(len(lengths)), lengths)
+    ends = np.cumsum(lengths)
+    return segments, ends[segments] - np.arange(len(ids))
+
+
+class _NgramTable:
+    """
+    The n-gram counts of a set of references, built once and matched against the hypotheses of any number of models.
+    N-grams are numbered one order at a time, an n-gram id is the position of its (n-1)-gram id and last token in the
+    unique keys of that order, and hypothesis n-grams are looked up in a pandas hash index of those keys in one call
+    """
+
+    def __init__(self, ids, lengths, order, vocabulary_size):
+        """
+        :param ids: The concatenated token ids of the references
+        :param lengths: The number of tokens of each reference
+        :param order: The highest n-gram order
+        :param vocabulary_size: One more than the largest token id
+        """
+        import pandas as pd
+
+        self.order = order
+        self.vocabulary_size = vocabulary_size
+        self.keys = []  # The index of the (n-1)-gram id and token keys of each order above one
+        self.counts = []  # The number of n-grams, and the index of reference and n-gram keys with their counts, per order
+
+        segments, remaining = _flatten(ids, lengths)
+        grams = ids
+        gram_count = vocabulary_size
+        for n in range(1, order + 1):
+            positions = np.flatnonzero(remaining >= n)
+            if n > 1:
+                keys, inverse = np.unique(grams[positions] * vocabulary_size + ids[positions + n - 1],
+                                          return_inverse=True)
+                grams = np.full(len(ids), -1, dtype=np.int64)
+                grams[positions] = inverse
+                gram_count = max(len(keys), 1)
+                self.keys.append(pd.Index(keys))
+            keys, counts = np.unique(segments[positions] * gram_count + grams[positions], return_counts=True)
+            self.counts.append((gram_count, pd.Index(keys), counts))
+
+    def totals(self, lengths):
+        """
+        :return: The number of n-grams of each order in sentences of the given lengths
+        """
+        lengths = np.asarray(lengths, dtype=np.int64)
+        return np.maximum(lengths[:, None] - np.arange(self.order)[None, :], 0)
+
+    def match(self, ids, lengths, references):
+        """
+        Counts the n-grams each hypothesis shares with its reference, clipped to the reference counts
+        :param ids: The concatenated token ids of the hypotheses, tokens no reference uses are -1
+        :param lengths: The number of tokens of each hypothesis
+        :param references: The index of the reference of each hypothesis
+        :return: The matching n-gram counts, an array of shape (hypotheses, order)
+        """
+        segments, remaining = _flatten(ids, lengths)
+        references = np.asarray(references)
+        matches = np.zeros((len(lengths), self.order))
+        grams = ids
+        for n in range(1, self.order + 1):
+            if n > 1:
+                # An n-gram is known if its (n-1)-gram and last token are, and the references have the pair
+                previous = grams
+                positions = np.flatnonzero((remaining >= n) & (previous >= 0))
+                tokens = ids[positions + n - 1]
+                positions, tokens = positions[tokens >= 0], tokens[tokens >= 0]
+                grams = np.full(len(ids), -1, dtype=np.int64)
+                grams[positions] = self.keys[n - 2].get_indexer(previous[positions] * self.vocabulary_size + tokens)
+
+            known = np.flatnonzero(grams >= 0)
+            gram_count, reference_keys, reference_counts = self.counts[n - 1]
+            if not len(known) or not len(reference_counts):
+                # No reference has an n-gram of this order, e.g. every reference is blank, so none of them match
+                continue
+            keys, counts = np.unique(segments[known] * gram_count + grams[known], return_counts=True)
+            hypotheses = keys // gram_count
+            found = reference_keys.get_indexer(references[hypotheses] * gram_count + keys % gram_count)
+            clipped = np.where(found >= 0, np.minimum(counts, reference_counts[found]), 0)
+            matches[:, n - 1] = np.bincount(hypotheses, clipped, minlength=len(lengths))
+
+        return matches
+
+
+def tokenize_13a(sentence):
+    """
+    :param sentence: The sentence to tokenize
+    :return: The tokens of sacrebleu's 13a tokenizer
+    """
+    for entity, replacement in ENTITIES_13A:
+        sentence = sentence.replace(entity, replacement)
+    sentence = f' {sentence} '.translate(SYMBOLS_13A)
+    if '.' in sentence or ',' in sentence:
+        sentence = PERIOD_AFTER_13A.sub(lambda match: match[1] + ' ' + match[2] + ' ', sentence)
+        sentence = PERIOD_BEFORE_13A.sub(lambda match: ' ' + match[1] + ' ' + match[2], sentence)
+    if '-' in sentence:
+        sentence = DASH_13A.sub(lambda match: match[1] + ' ' + match[2] + ' ', sentence)
+    return sentence.split()
+
+
+def _tokenize_bleu(sentence):
+    return tokenize_13a(sentence.rstrip())
+
+
+def _strip_whitespace(sentence):
+    return WHITESPACE.sub('', sentence)
+
+
+def _tokenize_ter(sentence):
+    return sentence.lower().split()
+
+
+class ReferenceStatistics:
+    """
+    Tokenizes and counts the n-grams of a set of reference sentences once so that the hypotheses of any number of
+    models can be scored against them. The sufficient statistics follow sacrebleu, BLEU on 13a tokens and chrF on
+    characters with whitespace removed, so corpus scores match sacrebleu.corpus_bleu and sacrebleu.corpus_chrf
+    """
+
+    def __init__(self, references, metrics=METRICS):
+        """
+        :param references: The reference sentences
+        :param metrics: The metrics to prepare, any of bleu, chrf and ter
+        """
+        self.references = list(references)
+        self.metrics = tuple(metrics)
+
+        if 'bleu' in self.metrics:
+            tokens = [_tokenize_bleu(reference) for reference in self.references]
+            self.vocabulary = {}
+            ids = [self.vocabulary.setdefault(token, len(self.vocabulary)) for sentence in tokens
+                   for token in sentence]
+            self.bleu_lengths = np.array([len(sentence) for sentence in tokens], dtype=np.int64)
+            self.bleu_table = _NgramTable(np.array(ids, dtype=np.int64), self.bleu_lengths, NGRAM_ORDER,
+                                          max(len(self.vocabulary), 1))
+
+        if 'chrf' in self.metrics:
+            characters = [_strip_whitespace(reference) for reference in self.references]
+            self.chrf_lengths = np.array([len(sentence) for sentence in characters], dtype=np.int64)
+            self.chrf_table = _NgramTable(_code_points(characters), self.chrf_lengths, CHRF_ORDER, CHARACTER_COUNT)
+            self.chrf_totals = self.chrf_table.totals(self.chrf_lengths)
+
+        if 'ter' in self.metrics:
+            self.ter_words = [_tokenize_ter(reference) for reference in self.references]
+
+    def _bleu_statistics(self, hypotheses, references):
+        tokens = [_tokenize_bleu(hypothesis) for hypothesis in hypotheses]
+        ids = [self.vocabulary.get(token, -1) for sentence in tokens for token in sentence]
+        lengths = np.array([len(sentence) for sentence in tokens], dtype=np.int64)
+
+        matches = self.bleu_table.match(np.array(ids, dtype=np.int64), lengths, references)
+        return np.hstack([matches, self.bleu_table.totals(lengths), lengths[:, None],
+                          self.bleu_lengths[references][:, None]]).astype(np.float64)
+
+    def _chrf_statistics(self, hypotheses, references):
+        characters = [_strip_whitespace(hypothesis) for hypothesis in hypotheses]
+        lengths = np.array([len(sentence) for sentence in characters], dtype=np.int64)
+
+        statistics = np.empty((len(hypotheses), 3 * CHRF_ORDER))
+        statistics[:, 0::3] = self.chrf_table.totals(lengths)
+        statistics[:, 1::3] = self.chrf_totals[references]
+        statistics[:, 2::3] = self.chrf_table.match(_code_points(characters), lengths, references)
+        return statistics
+
+    def _ter_statistics(self, hypotheses, references, workers):
+        pairs = list(zip(references.tolist(), hypotheses))
+        if workers > 1 and len(pairs) > 1:
+            with Pool(workers, initializer=_init_ter_worker, initargs=(self.ter_words,)) as pool:
+                edits = pool.map(_ter_task, pairs, chunksize=max(1, len(pairs) // (workers * 8)))
+        else:
+            _init_ter_worker(self.ter_words)
+            edits = [_ter_task(pair) for pair in pairs]
+        return np.array([(edit, len(self.ter_words[reference])) for edit, (reference, _) in zip(edits, pairs)],
+                        dtype=np.float64)
+
+    def statistics(self, metric, hypotheses, workers=1):
+        """
+        Computes the sufficient statistics of a metric, a translation several models agree on is only scored once
+        :param metric: bleu, chrf or ter
+        :param hypotheses: The hypotheses of one or more models, each model's in the order of the references
+        :param workers: The number of processes TER is computed in
+        :return: An array with a row for each hypothesis. For bleu the matching and total n-gram counts of each order
+        followed by the hypothesis and reference lengths, for chrf the hypothesis, reference and matching character
+        n-gram counts of each order as sacrebleu.get_sentence_statistics, for ter the edits and the reference length
+        """
+        if metric not in self.metrics:
+            raise ValueError(f"Unknown metric {metric}, the references were prepared for {', '.join(self.metrics)}")
+        if len(hypotheses) % max(len(self.references), 1) or (hypotheses and not self.references):
+            raise ValueError(f"Expected a multiple of {len(self.references)} hypotheses, got {len(hypotheses)}")
+
+        pairs = {}
+        inverse = [pairs.setdefault((i % len(self.references), hypothesis), len(pairs))
+                   for i, hypothesis in enumerate(hypotheses)]
+        references = np.array([reference for reference, _ in pairs], dtype=np.int64)
+        unique = [hypothesis for _, hypothesis in pairs]
+
+        if metric == 'bleu':
+            statistics = self._bleu_statistics(unique, references)
+        elif metric == 'chrf':
+            statistics = self._chrf_statistics(unique, references)
+        else:
+            statistics = self._ter_statistics(unique, references, workers)
+        return statistics[np.array(inverse, dtype=np.int64)]
+
+
+def _code_points(sentences):
+    return np.frombuffer(''.join(sentences).encode('utf-32-le'), dtype='<u4').astype(np.int64)
+
+
+def bleu_scores(statistics, smooth_method='exp', smooth_value=None, use_effective_order=False):
+    """
+    Computes BLEU from its sufficient statistics the way sacrebleu.compute_bleu does, vectorised over any leading axes
+    :param statistics: An array of shape (..., 2 * NGRAM_ORDER + 2) from ReferenceStatistics.statistics
+    :param smooth_method: exp, floor or none
+    :param smooth_value: The floor value of floor smoothing, defaults to 0
+    :param use_effective_order: Average only the n-gram orders the hypothesis has, for sentence level BLEU
+    :return: The BLEU scores from 0 to 100
+    """
+    statistics = np.asarray(statistics, dtype=np.float64)
+    correct = statistics[..., :NGRAM_ORDER]
+    total = statistics[..., NGRAM_ORDER:2 * NGRAM_ORDER]
+    sys_len = statistics[..., 2 * NGRAM_ORDER]
+    ref_len = statistics[..., 2 * NGRAM_ORDER + 1]
+
+    # sacrebleu stops at the first order without any n-grams
+    counted = np.cumprod(total > 0, axis=-1).astype(bool)
+    safe_total = np.where(total > 0, total, 1)
+    precisions = 100 * correct / safe_total
+    if smooth_method == 'exp':
+        halvings = np.cumsum((correct == 0) & counted, axis=-1)
+        precisions = np.where(correct > 0, precisions, 100 / (2.0 ** halvings * safe_total))
+    elif smooth_method == 'floor':
+        precisions = np.where(correct > 0, precisions, 100 * (smooth_value or 0.0) / safe_total)
+    elif smooth_method != 'none':
+        raise ValueError(f"Unknown smoothing method {smooth_method}")
+    precisions = np.where(counted, precisions, 0)
+    logs = np.where(precisions > 0, np.log(np.where(precisions > 0, precisions, 1)), -9999999999)
+
+    order = np.full(sys_len.shape, NGRAM_ORDER)
+    if use_effective_order:
+        order = np.where(counted[..., 0], counted.sum(axis=-1), NGRAM_ORDER)
+    used = np.arange(NGRAM_ORDER) < order[..., None]
+
+    safe_sys_len = np.where(sys_len > 0, sys_len, 1)
+    brevity_penalty = np.where(sys_len < ref_len, np.where(sys_len > 0, np.exp(1 - ref_len / safe_sys_len), 0), 1)
+    return brevity_penalty * np.exp((logs * used).sum(axis=-1) / order)
+
+
+def chrf_scores(statistics, beta=CHRF_BETA):
+    """
+    Computes chrF from its sufficient statistics the way sacrebleu does, vectorised over any leading axes
+    :param statistics: An array of shape (..., 3 * CHRF_ORDER) from ReferenceStatistics.statistics
+    :param beta: The weight of recall relative to precision
+    :return: The chrF scores from 0 to 100
+    """
+    statistics = np.asarray(statistics, dtype=np.float64)
+    hypothesis, reference, common = statistics[..., 0::3], statistics[..., 1::3], statistics[..., 2::3]
+    counted = (hypothesis > 0) & (reference > 0)
+    order = counted.sum(axis=-1)
+    safe_order = np.where(order > 0, order, 1)
+    precision = np.where(counted, common / np.where(counted, hypothesis, 1), 0).sum(axis=-1) / safe_order
+    recall = np.where(counted, common / np.where(counted, reference, 1), 0).sum(axis=-1) / safe_order
+
+    beta_square = beta ** 2
+    denominator = beta_square * precision + recall
+    score = (1 + beta_square) * precision * recall / np.where(denominator > 0, denominator, 1)
+    return 100 * np.where(precision + recall > 0, score, 0)
+
+
+def ter_scores(statistics):
+    """
+    :param statistics: An array of shape (..., 2) from ReferenceStatistics.statistics
+    :return: The TER scores, the edits as a percentage of the reference length, lower is better
+    """
+    statistics = np.asarray(statistics, dtype=np.float64)
+    edits, ref_len = statistics[..., 0], statistics[..., 1]
+    return 100 * np.where(ref_len > 0, edits / np.where(ref_len > 0, ref_len, 1), (edits > 0).astype(np.float64))
+
+
+def _corpus_scores(metric, statistics):
+    """
+    :return: The corpus level score of summed statistics, vectorised over any leading axes
+    """
+    if metric == 'bleu':
+        return bleu_scores(statistics)
+    if metric == 'chrf':
+        return chrf_scores(statistics)
+    return ter_scores(statistics)
+
+
+def _sentence_scores(metric, statistics):
+    if metric == 'bleu':
+        return bleu_scores(statistics, use_effective_order=True)
+    return _corpus_scores(metric, statistics)
+
+
+def _ter_band(hyp_length, ref_length):
+    """
+    :return: The first and one past the last reference position the TERCOM beam covers on each hypothesis row
+    """
+    ratio = ref_length / hyp_length
+    width = math.ceil(ratio / 2 + TER_BEAM_WIDTH) if TER_BEAM_WIDTH < ratio / 2 else TER_BEAM_WIDTH
+    diagonals = np.array([math.floor(i * ratio) for i in range(hyp_length + 1)], dtype=np.int64)
+    low = np.maximum(0, diagonals - width)
+    high = np.minimum(ref_length + 1, diagonals + width)
+    high[-1] = ref_length + 1
+    return low, high
+
+
+def _ter_row(previous, equal, low, high, columns):
+    """
+    Computes one row of the beam edit distance for any number of hypotheses at once
+    :param previous: The previous rows, an array of shape (hypotheses, reference length + 1)
+    :param equal: Whether each hypothesis word of this row matches each reference word
+    :return: The rows and the substitution or deletion cost each cell was built from, before insertions
+    """
+    substitute = previous[:, :-1] + ~equal
+    delete = previous + 1
+    base = np.full(previous.shape, TER_INFINITY, dtype=np.int64)
+    base[:, 1:] = np.minimum(substitute, delete[:, 1:])
+    base[:, 0] = delete[:, 0]
+    base[:, :low] = TER_INFINITY
+    base[:, high:] = TER_INFINITY
+    # An insertion costs one per reference word, so the row is a running minimum of the base costs
+    rows = np.minimum.accumulate(base - columns, axis=1) + columns
+    rows[:, high:] = TER_INFINITY
+    return np.minimum(rows, TER_INFINITY), base, substitute <= delete[:, 1:]
+
+
+def _ter_matrix(words, reference, low, high):
+    """
+    :return: The beam edit distance matrix of the hypothesis and the edit operation that ends in each cell, with
+    TERCOM's preference for substitutions, then deletions, then insertions
+    """
+    distances = np.full((len(words) + 1, len(reference) + 1), TER_INFINITY, dtype=np.int64)
+    operations = np.full(distances.shape, TER_INS, dtype=np.int8)
+    columns = np.arange(len(reference) + 1)
+    distances[0] = columns
+    for i in range(1, len(words) + 1):
+        equal = (reference == words[i - 1])[None, :]
+        rows, base, substituted = _ter_row(distances[i - 1:i], equal, low[i], high[i], columns)
+        distances[i] = rows[0]
+        operations[i, 0] = TER_DEL
+        operations[i, 1:] = np.where(substituted[0], np.where(equal[0], TER_NOP, TER_SUB), TER_DEL)
+        operations[i, 1:][rows[0, :-1] + 1 < base[0, 1:]] = TER_INS
+    return distances, operations
+
+
+def _ter_candidate_distances(candidates, words, reference, distances, low, high):
+    """
+    Computes the edit distance of many shifted hypotheses at once, the rows before the first word a candidate changes
+    are the rows of the unshifted hypothesis so each candidate only starts once its words differ
+    :param candidates: The shifted hypotheses, an array of shape (candidates, hypothesis length)
+    :param words: The unshifted hypothesis
+    :param distances: The edit distance matrix of the unshifted hypothesis
+    :return: The edit distance of each candidate
+    """
+    changed = candidates != words[None, :]
+    starts = np.where(changed.any(axis=1), changed.argmax(axis=1), len(words))
+    order = np.argsort(starts, kind='stable')
+    candidates, starts = candidates[order], starts[order]
+
+    columns = np.arange(len(reference) + 1)
+    rows = np.empty((len(candidates), len(reference) + 1), dtype=np.int64)
+    active = 0
+    for i in range(int(starts[0]) + 1, len(words) + 1):
+        started = np.searchsorted(starts, i - 1, side='right')
+        rows[active:started] = distances[i - 1]
+        active = started
+        equal = candidates[:active, i - 1][:, None] == reference[None, :]
+        rows[:active] = _ter_row(rows[:active], equal, low[i], high[i], columns)[0]
+
+    result = np.empty(len(candidates), dtype=np.int64)
+    result[order] = np.where(starts < len(words), rows[:, -1], distances[-1, -1])
+    return result
+
+
+def _ter_alignment(operations):
+    """
+    Walks back through the edit operations and rewrites them from the reference's point of view, as TERCOM does
+    :return: The hypothesis position each reference position aligns to, and whether each reference and hypothesis
+    word is in error
+    """
+    trace = []
+    i, j = operations.shape[0] - 1, operations.shape[1] - 1
+    while i > 0 or j > 0:
+        operation = operations[i, j]
+        trace.append(operation)
+        if operation in (TER_NOP, TER_SUB):
+            i, j = i - 1, j - 1
+        elif operation == TER_INS:
+            j -= 1
+        else:
+            i -= 1
+
+    align, ref_err, hyp_err = {}, [], []
+    pos_hyp, pos_ref = -1, -1
+    for operation in reversed(trace):
+        if operation in (TER_NOP, TER_SUB):
+            pos_hyp += 1
+            pos_ref += 1
+            align[pos_ref] = pos_hyp
+            hyp_err.append(int(operation == TER_SUB))
+            ref_err.append(int(operation == TER_SUB))
+        elif operation == TER_DEL:  # A deleted hypothesis word is an insertion from the reference's point of view
+            pos_hyp += 1
+            hyp_err.append(1)
+        else:
+            pos_ref += 1
+            align[pos_ref] = pos_hyp
+            ref_err.append(1)
+    return align, ref_err, hyp_err
+
+
+def _shift_candidates(words, reference, operations, checked):
+    """
+    Lists the shifts TERCOM would try, moving runs of hypothesis words that are in error to where the same words
+    are in error in the reference
+    :return: The shifted hypotheses, their (length, -start, -target) ranks and the shifts checked so far
+    """
+    align, ref_err, hyp_err = _ter_alignment(operations)
+    hyp, ref = words.tolist(), reference.tolist()
+    ref_positions = {}
+    for position, word in enumerate(ref):
+        ref_positions.setdefault(word, []).append(position)
+
+    candidates, ranks = [], []
+    for start_h in range(len(hyp)):
+        # Only reference positions holding the same word can start a shift
+        for start_r in ref_positions.get(hyp[start_h], ()):
+            if abs(start_r - start_h) > TER_MAX_SHIFT_DIST:
+                continue
+            length = 0
+            while hyp[start_h + length] == ref[start_r + length] and length < TER_MAX_SHIFT_SIZE:
+                length += 1
+                if (sum(hyp_err[start_h:start_h + length]) and sum(ref_err[start_r:start_r + length]) and
+                        not start_h <= align[start_r] < start_h + length):
+                    previous = -1
+                    for offset in range(-1, length):
+                        if start_r + offset == -1:
+                            target = 0
+                        elif start_r + offset in align:
+                            target = align[start_r + offset] + 1
+                        else:
+                            break
+                        if target == previous:
+                            continue
+                        previous = target
+                        candidates.append(_perform_shift(hyp, start_h, length, target))
+                        ranks.append((length, -start_h, -target))
+                        checked += 1
+                    if checked >= TER_MAX_SHIFT_CANDIDATES:
+                        return candidates, ranks, checked
+                if len(hyp) == start_h + length or len(ref) == start_r + length:
+                    break
+    return candidates, ranks, checked
+
+
+def _perform_shift(words, start, length, target):
+    if target < start:
+        return words[:target] + words[start:start + length] + words[target:start] + words[start + length:]
+    if target > start + length:
+        return words[:start] + words[start + length:target] + words[start:start + length] + words[target:]
+    return words[:start] + words[start + length:length + target] + words[start:start + length] + \
+        words[length + target:]
+
+
+def translation_edit_rate(hypothesis_words, reference_words):
+    """
+    Counts the edits of TER, a beam edit distance plus TERCOM's greedy search for word shifts that reduce it. The
+    search follows sacrebleu's TER but scores all the shifts of each round in one batched edit distance
+    :param hypothesis_words: The hypothesis tokens
+    :param reference_words: The reference tokens
+    :return: The number of edits, shifts included
+    """
+    if not reference_words:
+        return len(hypothesis_words)
+    if not hypothesis_words:
+        return len(reference_words)
+
+    vocabulary = {}
+    reference = np.array([vocabulary.setdefault(word, len(vocabulary)) for word in reference_words], dtype=np.int64)
+    words = np.array([vocabulary.setdefault(word, len(vocabulary)) for word in hypothesis_words], dtype=np.int64)
+    low, high = _ter_band(len(words), len(reference))
+
+    shifts, checked = 0, 0
+    while True:
+        distances, operations = _ter_matrix(words, reference, low, high)
+        candidates, ranks, checked = _shift_candidates(words, reference, operations, checked)
+        if checked >= TER_MAX_SHIFT_CANDIDATES or not candidates:
+            break
+        candidate_distances = _ter_candidate_distances(np.array(candidates, dtype=np.int64), words, reference,
+                                                       distances, low, high)
+        # The biggest reduction wins, then the longest shift, then the earliest start, then the earliest target
+        best = max(range(len(candidates)), key=lambda k: (distances[-1, -1] - candidate_distances[k],) + ranks[k])
+        if distances[-1, -1] - candidate_distances[best] <= 0:
+            break
+        shifts += 1
+        words = np.array(candidates[best], dtype=np.int64)
+
+    return shifts + int(distances[-1, -1])
+
+
+def _init_ter_worker(reference_words):
+    _ter_worker['references'] = reference_words
+
+
+def _ter_task(pair):
+    """
+    :param pair: A (reference index, hypothesis) tuple
+    :return: The number of TER edits of the hypothesis
+    """
+    reference, hypothesis = pair
+    return translation_edit_rate(_tokenize_ter(hypothesis), _ter_worker['references'][reference])
+
+
+def _confidence_interval(scores):
+    """
+    :return: Half the width of the 95% confidence interval of the bootstrap scores of each model, as sacrebleu
+    """
+    scores = np.sort(scores, axis=0)
+    lower = len(scores) // 40
+    return 0.5 * (scores[len(scores) - lower - 1] - scores[lower])
+
+
+def paired_bootstrap(metric, statistics, baseline=0, samples=BOOTSTRAP_SAMPLES, seed=BOOTSTRAP_SEED):
+    """
+    Paired bootstrap resampling between models, sacrebleu's paired-bs test. Every model is scored on the same
+    resamples of sentences, which are drawn as per sentence weights and summed with one matrix product per chunk
+    :param metric: bleu, chrf or ter
+    :param statistics: The sentence statistics of every model, an array of shape (models, sentences, statistics)
+    :param baseline: The index of the model the others are compared to
+    :param samples: The number of resamples
+    :param seed: The random seed, None for a different draw every run
+    :return: The mean bootstrap score, the half width of its 95% confidence interval and the p-value of the difference
+    to the baseline of each model, the baseline's p-value is nan
+    """
+    models, sentences, width = statistics.shape
+    flat = statistics.transpose(1, 0, 2).reshape(sentences, models * width)
+    rng = np.random.default_rng(seed)
+
+    sums = []
+    for start in range(0, samples, BOOTSTRAP_CHUNK):
+        size = min(BOOTSTRAP_CHUNK, samples - start)
+        indices = rng.integers(0, sentences, size=(size, sentences))
+        weights = np.bincount((indices + (np.arange(size) * sentences)[:, None]).ravel(),
+                              minlength=size * sentences).reshape(size, sentences)
+        sums.append(weights @ flat)
+    scores = _corpus_scores(metric, np.concatenate(sums).reshape(samples, models, width))
+
+    real = _corpus_scores(metric, statistics.sum(axis=1))
+    difference = np.abs(real - real[baseline])
+    sample_differences = np.abs(scores - scores[:, baseline:baseline + 1])
+    p_values = ((sample_differences - sample_differences.mean(axis=0) > difference).sum(axis=0) + 1) / (samples + 1)
+    p_values[baseline] = np.nan
+    return scores.mean(axis=0), _confidence_interval(scores), p_values
+
+
+def score_translations(references, hypotheses, metrics=DEFAULT_METRICS, baseline=None, samples=BOOTSTRAP_SAMPLES,
+                       seed=BOOTSTRAP_SEED, workers=1):
+    """
+    Scores the translations of any number of models against one set of references in a single batched pass
+    :param references: The reference sentences, or a ReferenceStatistics to reuse
+    :param hypotheses: A dictionary of each model to its translated sentences, in the order of the references
+    :param metrics: Any of bleu, chrf and ter, defaults to bleu and chrf
+    :param baseline: The model the others are tested against with paired bootstrap resampling, defaults to the first
+    :param samples: The number of bootstrap resamples, 0 to skip the significance test
+    :param seed: The bootstrap random seed
+    :param workers: The number of processes TER is computed in
+    :return: A DataFrame of the sentence scores with a <model>_<metric> column per model and metric, and a DataFrame
+    of the corpus scores indexed by model with a column per metric and, when bootstrapping, <metric>_mean,
+    <metric>_ci and <metric>_p columns
+    """
+    # pandas is imported by the scoring stage rather than with the module, it dominates the import time
+    import pandas as pd
+
+    if not isinstance(references, ReferenceStatistics):
+        references = ReferenceStatistics(references, metrics)
+    models = list(hypotheses)
+    if not models:
+        return pd.DataFrame(), pd.DataFrame(columns=list(metrics))
+    sentence_count = len(references.references)
+    for model in models:
+        if len(hypotheses[model]) != sentence_count:
+            raise ValueError(f"{model} has {len(hypotheses[model])} sentences but there are {sentence_count} "
+                             f"references")
+    baseline_index = models.index(baseline) if baseline is not None else 0
+    stacked = [hypothesis for model in models for hypothesis in hypotheses[model]]
+
+    sentence_scores = {}
+    corpus_scores = pd.DataFrame(index=pd.Index(models, name='model'))
+    for metric in metrics:
+        statistics = references.statistics(metric, stacked, workers).reshape(len(models), sentence_count, -1)
+        for i, model in enumerate(models):
+            sentence_scores[f"{model}_{metric}"] = _sentence_scores(metric, statistics[i])
+        corpus_scores[metric] = _corpus_scores(metric, statistics.sum(axis=1))
+        if samples and sentence_count:
+            mean, ci, p_values = paired_bootstrap(metric, statistics, baseline_index, samples, seed)
+            corpus_scores[f"{metric}_mean"] = mean
+            corpus_scores[f"{metric}_ci"] = ci
+            corpus_scores[f"{metric}_p"] = p_values
+
+    return pd.DataFrame(sentence_scores), corpus_scores
@@ -0,0 +1,227 @@
+import codecs
+import re
+from xml.etree.ElementTree import XMLPullParser
+
+XML_LANG = '{http://www.w3.org/XML/1998/namespace}lang'
+CHUNK_SIZE = 1 << 20  # Bytes read from the tmx file at a time
+UNIT_START = re.compile(r'<tu[\s>]', re.IGNORECASE)  # Matches <tu> and <tu attr=...> but not <tuv>
+UNIT_START_BYTES = re.compile(rb'<tu[\s>]', re.IGNORECASE)
+# Characters XML 1.0 does not allow, raw or as character references, e.g. the &#x1E; some Trados versions write
+INVALID_XML_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]')
+INVALID_CHAR_REFERENCE = re.compile(r'&#(?:[xX]0*(?:[0-8bBcCeEfF]|1[0-9a-fA-F]|[fF]{3}[eEfF])'
+                                    r'|0*(?:[0-8]|1[1-2]|1[4-9]|2[0-9]|3[01]|6553[45]));')
+STRAY_AMPERSAND = re.compile(r'&(?!(?:[A-Za-z_][\w.-]*|#[0-9]+|#[xX][0-9a-fA-F]+);)')
+MAX_REFERENCE = 32  # The longest entity or character reference kept whole across chunk boundaries when repairing
+_LOCAL_NAMES = {}  # The local name of each tag seen, a tmx file only uses a handful of tags
+
+
+class TmxUnit:
+    """
+    A lightweight translation unit, getid and gettarget mirror the translate-toolkit unit API
+    """
+    __slots__ = ('index', 'source', 'target', 'props')
+
+    def __init__(self, index, source, target, props):
+        self.index = index  # The position of the unit in the tmx file
+        self.source = source
+        self.target = target
+        self.props = props  # The <prop type="..."> values of the unit
+
+    def getid(self):
+        return self.source
+
+    def gettarget(self):
+        return self.target
+
+    def __repr__(self):
+        return f"TmxUnit({self.index}, {self.source!r}, {self.target!r})"
+
+
+def _detect_encoding(head):
+    """
+    :param head: The first bytes of the tmx file
+    :return: The python codec of the file, utf-16 files must start with a byte order mark
+    """
+    if head.startswith(codecs.BOM_UTF16_LE) or head.startswith(codecs.BOM_UTF16_BE):
+        return 'utf-16'
+    return 'utf-8'
+
+
+def repair_xml(text):
+    """
+    Repairs the bad encodings that stop a translation memory parsing, characters XML does not allow are removed and an
+    ampersand that does not start an entity or character reference is escaped
+    :param text: The XML text
+    :return: The repaired text
+    """
+    text = INVALID_CHAR_REFERENCE.sub('', text)
+    text = INVALID_XML_CHARS.sub('', text)
+    return STRAY_AMPERSAND.sub('&amp;', text)
+
+
+def _repaired_chunks(tmx, encoding):
+    """
+    Decodes, repairs and encodes a tmx file a chunk at a time, a possible reference at the end of a chunk is held back
+    and repaired with the next one
+    :param tmx: The tmx file opened in binary mode
+    :param encoding: The codec of the file
+    :return: A generator of repaired chunks in the same encoding
+    """
+    decoder = codecs.getincrementaldecoder(encoding)()
+    encoder = codecs.getincrementalencoder(encoding)()
+    tail = ''
+    while True:
+        chunk = tmx.read(CHUNK_SIZE)
+        data = tail + decoder.decode(chunk, final=not chunk)
+        cut = data.rfind('&', max(0, len(data) - MAX_REFERENCE)) if chunk else -1
+        if cut < 0:
+            cut = len(data)
+        tail = data[cut:]
+        yield encoder.encode(repair_xml(data[:cut]), final=not chunk)
+        if not chunk:
+            break
+
+
+def _local_name(tag):
+    name = _LOCAL_NAMES.get(tag)
+    if name is None:
+        name = _LOCAL_NAMES[tag] = tag.rsplit('}', 1)[-1].lower()
+    return name
+
+
+def _scan_unit_offsets(file):
+    """
+    Scans the raw bytes of a utf-8 tmx file for unit start tags without parsing any XML
+    :param file: The tmx file
+    :return: A generator of the byte offset of each <tu> tag
+    """
+    tail = b''
+    position = 0
+    with open(file, 'rb') as tmx:
+        while True:
+            chunk = tmx.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            data = tail + chunk
+            base = position - len(tail)
+            # Only the last 3 bytes can hold a partial '<tu' so keep them for the next chunk
+            searchable = len(data) - 3 if len(chunk) == CHUNK_SIZE else len(data)
+            for match in UNIT_START_BYTES.finditer(data, 0, len(data)):
+                if match.start() < searchable:
+                    yield base + match.start()
+            tail = data[searchable:]
+            position += len(chunk)
+
+
+def count_tmx_units(file):
+    """
+    Counts the translation units in a tmx file with a regular expression scan rather than an XML parse
+    :param file: The tmx file
+    :return: The number of translation units
+    """
+    with open(file, 'rb') as tmx:
+        encoding = _detect_encoding(tmx.read(4))
+
+    if encoding == 'utf-8':
+        return sum(1 for _ in _scan_unit_offsets(file))
+
+    count = 0
+    tail = ''
+    decoder = codecs.getincrementaldecoder(encoding)()
+    with open(file, 'rb') as tmx:
+        while True:
+            chunk = tmx.read(CHUNK_SIZE)
+            data = tail + decoder.decode(chunk, final=not chunk)
+            searchable = len(data) - 3 if chunk else len(data)
+            count += sum(1 for match in UNIT_START.finditer(data) if match.start() < searchable)
+            tail = data[searchable:]
+            if not chunk:
+                break
+
+    return count
+
+
+def _read_unit(index, element, source_language, target_language):
+    """
+    :return: A TmxUnit built from a parsed <tu> element
+    """
+    props = {}
+    variants = []
+    for child in element:
+        name = _local_name(child.tag)
+        if name == 'prop':
+            props[child.get('type')] = child.text or ''
+        elif name == 'tuv':
+            language = (child.get(XML_LANG) or child.get('lang') or '').lower()
+            text = ''
+            for seg in child:
+                if _local_name(seg.tag) == 'seg':
+                    text = ''.join(seg.itertext())
+                    break
+            variants.append((language, text))
+
+    source = variants[0][1] if len(variants) > 0 else ''
+    target = variants[1][1] if len(variants) > 1 else ''
+    # Pick the variants by language if requested e.g. 'en' matches 'EN-US', otherwise first is source
+    for language, text in variants:
+        if source_language and language.startswith(source_language.lower()):
+            source = text
+        elif target_language and language.startswith(target_language.lower()):
+            target = text
+
+    return TmxUnit(index, source, target, props)
+
+
+def iter_tmx_units(file, source_language=None, target_language=None, start=0, end=None, repair=False):
+    """
+    Streams the translation units of a tmx file, processed elements are cleared so memory stays flat however
+    large the file is. For utf-8 files the reader seeks straight to the start unit without parsing the ones before it
+    :param file: The tmx file
+    :param source_language: The source language code e.g. en, defaults to the first variant of each unit
+    :param target_language: The target language code e.g. fr, defaults to the second variant of each unit
+    :param start: The index of the first unit to yield
+    :param end: Stop before this unit index, None to read to the end of the file
+    :param repair: Repair bad encodings with repair_xml as the file is read
+    :return: A generator of TmxUnit records
+    """
+    with open(file, 'rb') as tmx:
+        encoding = _detect_encoding(tmx.read(4))
+
+    offset = 0
+    index = 0
+    parser = XMLPullParser(events=('start', 'end'))
+    if start > 0 and encoding == 'utf-8':
+        for i, unit_offset in enumerate(_scan_unit_offsets(file)):
+            if i == start:
+                offset = unit_offset
+                index = start
+                break
+        else:
+            return
+        # We feed a synthetic root so the parser can pick up mid file, the original closing tags end the document
+        parser.feed(b'<?xml version="1.0" encoding="utf-8"?><tmx><body>')
+
+    body = None
+    with open(file, 'rb') as tmx:
+        tmx.seek(offset)
+        chunks = _repaired_chunks(tmx, encoding) if repair else iter(lambda: tmx.read(CHUNK_SIZE), b'')
+        for chunk in chunks:
+            if end is not None and index >= end:
+                break
+            parser.feed(chunk)
+            for event, element in parser.read_events():
+                name = _local_name(element.tag)
+                if event == 'start':
+                    if name == 'body':
+                        body = element
+                    continue
+                if name != 'tu':
+                    continue
+
+                if index >= start and (end is None or index < end):
+                    yield _read_unit(index, element, source_language, target_language)
+                index += 1
+                # Release the units parsed so far, the current unit is complete and no later unit has started
+                element.clear()
+                if body is not None:
+                    body.clear()
@@ -0,0 +1,83 @@
+from xml.sax.saxutils import escape, quoteattr
+
+BUFFER_SIZE = 1 << 20  # Bytes buffered before each write to the tmx file
+TMX_FOOTER = b'  </body>\n</tmx>\n'
+
+
+def tmx_header(source_language, creation_tool='custom-machine-translation-recipes'):
+    """
+    :param source_language: The source language code e.g. en-US
+    :param creation_tool: The tool named in the header
+    :return: The utf-8 encoded tmx header up to and including the opening body tag
+    """
+    return ('<?xml version="1.0" encoding="utf-8"?>\n<tmx version="1.4">\n'
+            f'  <header creationtool={quoteattr(creation_tool)} creationtoolversion="1.0" segtype="sentence" '
+            f'o-tmf="unknown" adminlang="en-US" srclang={quoteattr(source_language)} datatype="plaintext"/>\n'
+            '  <body>\n').encode('utf-8')
+
+
+def encode_unit(unit, source_language, target_language):
+    """
+    :param unit: A TmxUnit
+    :param source_language: The source language code written on the source variant e.g. en-US
+    :param target_language: The target language code written on the target variant e.g. fr-FR
+    :return: The utf-8 encoded <tu> element of the unit, with its properties
+    """
+    props = ''.join(f'      <prop type={quoteattr(name)}>{escape(value)}</prop>\n'
+                    for name, value in unit.props.items())
+    return ('    <tu>\n' + props +
+            f'      <tuv xml:lang={quoteattr(source_language)}><seg>{escape(unit.source)}</seg></tuv>\n'
+            f'      <tuv xml:lang={quoteattr(target_language)}><seg>{escape(unit.target)}</seg></tuv>\n'
+            '    </tu>\n').encode('utf-8')
+
+
+class TmxWriter:
+    """
+    Writes translation units to a utf-8 tmx file through one buffered file, the size of the file written so far is
+    tracked so callers can cap it
+    """
+
+    def __init__(self, path, source_language, target_language, buffer_size=BUFFER_SIZE):
+        """
+        :param path: The tmx file, it is replaced if it exists
+        :param source_language: The source language code e.g. en-US
+        :param target_language: The target language code e.g. fr-FR
+        :param buffer_size: The number of bytes buffered before each write
+        """
+        self.path = path
+        self.source_language = source_language
+        self.target_language = target_language
+        self.units = 0
+        self._file = open(path, 'wb', buffering=buffer_size)
+        self.size = self._file.write(tmx_header(source_language))
+
+    def encode(self, unit):
+        """
+        :return: The encoded unit as write_encoded takes it
+        """
+        return encode_unit(unit, self.source_language, self.target_language)
+
+    def write_encoded(self, data):
+        """
+        Writes a unit encoded by encode
+        """
+        self.size += self._file.write(data)
+        self.units += 1
+
+    def write(self, unit):
+        """
+        Writes a TmxUnit
+        """
+        self.write_encoded(self.encode(unit))
+
+    def close(self):
+        if self._file is not None:
+            self.size += self._file.write(TMX_FOOTER)
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
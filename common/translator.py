@@ -0,0 +1,275 @@
+import json
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from requests import Session
+from requests.adapters import HTTPAdapter
+
+from .common import batch_segments, TRANSLATOR_ENDPOINT, MAX_ELEMENTS_PER_REQUEST
+
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)  # Throttled or transient service errors worth retrying
+
+
+class TranslationStats:
+    """
+    Thread safe throughput and latency counters for a TranslationClient
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0  # Requests sent, including retries
+        self.retries = 0  # Requests that were retried
+        self.throttled = 0  # 429 responses received
+        self.failures = 0  # Batches that could not be translated after all retries
+        self.segments = 0  # Segments translated successfully
+        self.characters = 0  # Characters sent in successful requests
+        self.latencies = []  # Seconds per request
+        self.started = time.perf_counter()
+
+    def record(self, latency, segments=0, characters=0, status=None):
+        with self._lock:
+            self.requests += 1
+            self.latencies.append(latency)
+            if status == 429:
+                self.throttled += 1
+            self.segments += segments
+            self.characters += characters
+
+    def record_retry(self):
+        with self._lock:
+            self.retries += 1
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+
+    def snapshot(self):
+        """
+        :return: A dictionary of the counters, latency percentiles in seconds and segments per second
+        """
+        with self._lock:
+            latencies = sorted(self.latencies)
+            elapsed = time.perf_counter() - self.started
+
+            def percentile(p):
+                return latencies[min(len(latencies) - 1, int(p * len(latencies)))] if latencies else 0.0
+
+            return {'requests': self.requests, 'retries': self.retries, 'throttled': self.throttled,
+                    'failures': self.failures, 'segments': self.segments, 'characters': self.characters,
+                    'elapsed': elapsed, 'segments_per_second': self.segments / elapsed if elapsed > 0 else 0.0,
+                    'latency_p50': percentile(0.5), 'latency_p95': percentile(0.95),
+                    'latency_max': latencies[-1] if latencies else 0.0}
+
+
+class TranslationClient:
+    """
+    A concurrent Translator client, batches are sent through a bounded thread pool sharing one HTTP session and
+    throttled or failed requests are retried with jittered exponential backoff, honouring Retry-After
+    """
+
+    def __init__(self, subscription_key, region, endpoint=TRANSLATOR_ENDPOINT, max_concurrency=8, max_retries=5,
+                 backoff=0.5, max_backoff=60, timeout=30, cache=None, metrics=None):
+        """
+        :param subscription_key: The Subscription Key for the Custom Machine Translation service
+        :param region: The Region that the model is deployed to
+        :param endpoint: The Translator translate endpoint, override to point at a local stub service
+        :param max_concurrency: The maximum number of requests in flight
+        :param max_retries: The number of times a throttled or failed request is retried
+        :param backoff: The base delay in seconds for the exponential backoff
+        :param max_backoff: The maximum delay in seconds between retries
+        :param timeout: The request timeout in seconds
+        :param cache: An optional TranslationCache checked before going to the network
+        :param metrics: Optional Metrics the request latencies, statuses, bytes sent and characters billed are
+        recorded in
+        """
+        self.endpoint = endpoint
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.cache = cache
+        self.metrics = metrics
+        self.stats = TranslationStats()
+        self.headers = {
+            "Ocp-Apim-Subscription-Key": subscription_key,
+            "Content-Type": "application/json",
+            "Ocp-Apim-Subscription-Region": region
+        }
+        self.session = Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_concurrency)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _retry_delay(self, attempt, retry_after=None):
+        """
+        :param attempt: The retry attempt, starting at 0
+        :param retry_after: The Retry-After header value if the service sent one
+        :return: The number of seconds to wait before retrying
+        """
+        if retry_after is not None:
+            try:
+                # Clamped like the backoff, a large Retry-After would otherwise hold a pool worker for that long
+                return min(self.max_backoff, max(0.0, float(retry_after)) + random.uniform(0, self.backoff))
+            except ValueError:
+                pass
+        # Full jitter spreads retries from concurrent workers so they do not hit the quota together
+        return random.uniform(0, min(self.max_backoff, self.backoff * (2 ** attempt)))
+
+    def _record(self, latency, size, status=None, segments=0, characters=0):
+        """
+        Records a request in the stats, and in the metrics if the client has them
+        :param latency: The seconds the request took
+        :param size: The bytes of the request body
+        :param status: The HTTP status of the response, None if the request raised
+        :param segments: The segments translated by a successful request
+        :param characters: The characters translated by a successful request
+        """
+        self.stats.record(latency, segments, characters, status)
+        if not self.metrics:
+            return
+        self.metrics.observe('translation_request_seconds', latency)
+        self.metrics.increment('translation_requests_total', status=status or 'error')
+        self.metrics.increment('translation_bytes_sent_total', size)
+        if segments:
+            self.metrics.increment('translation_segments_total', segments)
+            # The service bills the characters of the source texts it translates
+            self.metrics.increment('translation_characters_billed_total', characters)
+
+    @staticmethod
+    def _translations(resp, count, category_id):
+        """
+        :return: The translated texts of a 200 response, or None if its body is not the count translations expected
+        """
+        try:
+            translated = [result['translations'][0]['text'] for result in resp.json()]
+        except (ValueError, KeyError, IndexError, TypeError) as e:
+            logging.warning(f"Invalid translation response for CategoryId {category_id} {e}")
+            return None
+        if len(translated) != count:
+            logging.warning(f"Invalid translation response for CategoryId {category_id}, {len(translated)} "
+                            f"translations for {count} texts")
+            return None
+        return translated
+
+    def translate(self, texts, language_code, category_id):
+        """
+        Translates a single batch, retrying throttled and transient failures
+        :param texts: The list of texts in the batch, within the Translator request limits
+        :param language_code: The target language to translate to
+        :param category_id: The category Id of the Machine Translation model
+        :return: The translated texts in the order of texts, or None if the batch failed after all retries
+        """
+        params = {'api-version': '3.0', 'to': language_code, 'category': category_id}
+        # The body is serialised once rather than on every retry, its size is what is sent over the wire
+        body = json.dumps([{'Text': text} for text in texts]).encode('utf-8')
+        characters = sum(len(text) for text in texts)
+
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            started = time.perf_counter()
+            try:
+                resp = self.session.post(self.endpoint, params=params, data=body, headers=self.headers,
+                                         timeout=self.timeout)
+            except Exception as e:
+                self._record(time.perf_counter() - started, len(body))
+                logging.warning(f"Translation request failed for CategoryId {category_id} {e}")
+            else:
+                translated = self._translations(resp, len(texts), category_id) if resp.status_code == 200 else None
+                if translated is not None:
+                    self._record(time.perf_counter() - started, len(body), resp.status_code, len(texts), characters)
+                    return translated
+                if resp.status_code == 200:
+                    # A truncated or malformed body is retried like a transient service error
+                    self._record(time.perf_counter() - started, len(body))
+                else:
+                    self._record(time.perf_counter() - started, len(body), resp.status_code)
+                    if resp.status_code not in RETRY_STATUS_CODES:
+                        logging.error(f"Translation failed for CategoryId {category_id} {resp.status_code} "
+                                      f"{resp.text}")
+                        break
+                    retry_after = resp.headers.get('Retry-After')
+
+            if attempt < self.max_retries:
+                delay = self._retry_delay(attempt, retry_after)
+                logging.debug(f"Retrying CategoryId {category_id} in {delay:.2f}s (attempt {attempt + 1})")
+                self.stats.record_retry()
+                if self.metrics:
+                    self.metrics.increment('translation_retries_total')
+                time.sleep(delay)
+
+        self.stats.record_failure()
+        if self.metrics:
+            self.metrics.increment('translation_failures_total')
+        return None
+
+    def translate_categories(self, segments, language_code, categories, batch_size=MAX_ELEMENTS_PER_REQUEST,
+                             completed=None, on_translated=None):
+        """
+        Translates every segment against every category at once, all batches for all categories share the pool
+        :param segments: The list of text segments to translate
+        :param language_code: The target language to translate to
+        :param categories: The category Ids of the Machine Translation models
+        :param batch_size: The maximum number of segments per request
+        :param completed: Optionally a dictionary per category of segment index to the translation of a previous run,
+        these segments are not translated again
+        :param on_translated: Optionally called with the category index and a list of (segment index, translation)
+        tuples as each batch completes, e.g. to journal the run as it goes
+        :return: A list per category of the translated text per segment, an empty string where a batch failed
+        """
+        results = [[''] * len(segments) for _ in categories]
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            futures = {}
+            for cat_ind, category_id in enumerate(categories):
+                done = completed[cat_ind] if completed else {}
+                missing, cached_batch = [], []
+                for i, segment in enumerate(segments):
+                    if i in done:
+                        results[cat_ind][i] = done[i]
+                        continue
+                    cached = self.cache.get(segment, language_code, category_id) if self.cache else None
+                    if cached is None:
+                        missing.append(i)
+                    else:
+                        results[cat_ind][i] = cached
+                        cached_batch.append((i, cached))
+                if on_translated and cached_batch:
+                    on_translated(cat_ind, cached_batch)
+
+                # Only the segments that are not cached are sent, batch indices are mapped back to segment indices
+                for batch in batch_segments([segments[i] for i in missing], batch_size):
+                    batch = [(missing[j], text) for j, text in batch]
+                    future = executor.submit(self.translate, [text for _, text in batch], language_code,
+                                             category_id)
+                    futures[future] = (cat_ind, batch)
+
+            # Batches are handled as they finish so a crash part way through loses as little work as possible
+            for future in as_completed(futures):
+                cat_ind, batch = futures[future]
+                translated = future.result()
+                if translated is None:
+                    logging.error(f"Translation failed for CategoryId {categories[cat_ind]} segments "
+                                  f"{batch[0][0]} to {batch[-1][0]}")
+                    continue
+                for (i, _), text in zip(batch, translated):
+                    results[cat_ind][i] = text
+                if self.cache:
+                    self.cache.put_many([(source, language_code, categories[cat_ind], text)
+                                         for (_, source), text in zip(batch, translated)])
+                if on_translated:
+                    on_translated(cat_ind, [(i, text) for (i, _), text in zip(batch, translated)])
+
+        return results
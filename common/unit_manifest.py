@@ -0,0 +1,109 @@
+import hashlib
+import json
+import sqlite3
+import unicodedata
+
+BUSY_TIMEOUT = 60  # Seconds a writer waits for another process holding the manifest write lock
+LOOKUP_BATCH = 500  # Keys looked up per query, below the SQLite limit on query parameters
+
+
+def _normalise(text):
+    return unicodedata.normalize('NFC', ' '.join(text.split()))
+
+
+def _hash(*parts):
+    return hashlib.sha256('\0'.join(parts).encode('utf-8')).hexdigest()
+
+
+class UnitManifest:
+    """
+    The translation memory units a phrase dictionary was mined from, in an indexed SQLite file. A unit is recorded by
+    a fingerprint of its source and target text together with the models and category it was mined with, so a rerun
+    over a grown or edited memory only mines the units that are new, changed or were mined with other settings.
+    Optionally the keyterms of each unit are kept too, keyed on the fingerprint and the models, so a unit mined again
+    for another category is not parsed again. Concurrent workers and batch jobs can record units in the same file
+    """
+
+    def __init__(self, path, nlp_id, nlp_target, category_id):
+        """
+        :param path: The SQLite manifest file, it is created if it does not exist
+        :param nlp_id: The source language spaCy model the units are mined with
+        :param nlp_target: The target language spaCy model the units are mined with
+        :param category_id: The category Id of the model the keyterms are translated with
+        """
+        self.path = path
+        self._models = '\0'.join([nlp_id or '', nlp_target or ''])
+        self._scope = '\0'.join([self._models, category_id or ''])
+        # Autocommit mode so record controls its own transaction
+        self._connection = sqlite3.connect(path, timeout=BUSY_TIMEOUT, isolation_level=None, check_same_thread=False)
+        # Readers do not block the writer, or each other, in write-ahead logging mode
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('CREATE TABLE IF NOT EXISTS units (key TEXT PRIMARY KEY) WITHOUT ROWID')
+        self._connection.execute('CREATE TABLE IF NOT EXISTS keyterms (key TEXT PRIMARY KEY, source TEXT NOT NULL, '
+                                 'target TEXT NOT NULL) WITHOUT ROWID')
+
+    @staticmethod
+    def fingerprint(source, target):
+        """
+        :return: The fingerprint of a unit, a hash of its whitespace and unicode normalised source and target text
+        """
+        return _hash(_normalise(source), _normalise(target))
+
+    def _lookup(self, table, columns, keys):
+        rows = {}
+        keys = list(keys)
+        for start in range(0, len(keys), LOOKUP_BATCH):
+            batch = keys[start:start + LOOKUP_BATCH]
+            query = f"SELECT {columns} FROM {table} WHERE key IN ({','.join('?' * len(batch))})"
+            rows.update((row[0], row[1:]) for row in self._connection.execute(query, batch))
+        return rows
+
+    def processed(self, fingerprints):
+        """
+        :param fingerprints: The fingerprints of units
+        :return: The set of those fingerprints that were mined with the models and category of the manifest
+        """
+        keys = {_hash(self._scope, fingerprint): fingerprint for fingerprint in fingerprints}
+        return {keys[key] for key in self._lookup('units', 'key', keys)}
+
+    def keyterms(self, fingerprints):
+        """
+        :param fingerprints: The fingerprints of units
+        :return: A dictionary of the fingerprints whose keyterms were kept for the models of the manifest to their
+        (source keyterms, target keyterms)
+        """
+        keys = {_hash(self._models, fingerprint): fingerprint for fingerprint in fingerprints}
+        return {keys[key]: ([tuple(keyterm) for keyterm in json.loads(source)],
+                            [tuple(keyterm) for keyterm in json.loads(target)])
+                for key, (source, target) in self._lookup('keyterms', 'key, source, target', keys).items()}
+
+    def record(self, fingerprints, keyterms=()):
+        """
+        Records units as mined, and optionally their keyterms, in a single transaction. Record a unit only once the
+        phrases found in it are in the dictionary, so a unit of a run that stopped part way is mined again
+        :param fingerprints: The fingerprints of the mined units
+        :param keyterms: An iterable of (fingerprint, source keyterms, target keyterms) tuples to keep
+        """
+        units = [(_hash(self._scope, fingerprint),) for fingerprint in fingerprints]
+        keyterm_rows = [(_hash(self._models, fingerprint), json.dumps(source), json.dumps(target))
+                        for fingerprint, source, target in keyterms]
+        # Take the write lock up front so a concurrent writer waits for the whole batch rather than failing part way
+        self._connection.execute('BEGIN IMMEDIATE')
+        try:
+            self._connection.executemany('INSERT OR IGNORE INTO units VALUES (?)', units)
+            self._connection.executemany('INSERT OR REPLACE INTO keyterms VALUES (?, ?, ?)', keyterm_rows)
+            self._connection.execute('COMMIT')
+        except BaseException:
+            self._connection.execute('ROLLBACK')
+            raise
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()